@@ -9,6 +9,7 @@ Usage:
 """
 
 import getpass
+import hashlib
 import json
 import logging
 import os
@@ -21,10 +22,12 @@ from urllib.parse import urlparse
 import entrypoints
 import escapism
 from pythonjsonlogger import jsonlogger
-from traitlets import Any, Bool, Dict, Int, List, Unicode, default, observe
+from traitlets import Any, Bool, Dict, Float, Int, List, Unicode, default, observe
 from traitlets.config import Application
 
 from . import __version__, contentproviders
+from .asyncbuild import build_events
+from .buildkit import BuildKitProgress
 from .buildpacks import (
     CondaBuildPack,
     DockerBuildPack,
@@ -36,8 +39,18 @@ from .buildpacks import (
     PythonBuildPack,
     RBuildPack,
 )
+from .contentproviders.doi import DoiProvider
+from .contentproviders.git import GitMirrorCache
+from .contentstore import ContentStore
 from .engine import BuildError, ContainerEngineException, ImageLoadError
-from .utils import ByteSpecification, R2dState, chdir, get_free_port, get_platform
+from .repoindex import RepoIndex
+from .utils import (
+    ByteSpecification,
+    R2dState,
+    Timings,
+    get_free_port,
+    get_platform,
+)
 
 
 class Repo2Docker(Application):
@@ -51,6 +64,9 @@ class Repo2Docker(Application):
     aliases = {}
     flags = {}
 
+    # the Timings of the last build, set by build
+    timings = None
+
     @default("log_level")
     def _default_log_level(self):
         """The application's default log level"""
@@ -182,6 +198,22 @@ class Repo2Docker(Application):
         )
         sys.exit(-1)
 
+    build_context_memory_limit = ByteSpecification(
+        "64M",
+        help="""
+        Maximum size of the build context to hold in memory.
+
+        The build context (the repository contents plus repo2docker's helper
+        scripts) is assembled as a tar archive before it is handed to the
+        container engine. Archives larger than this are spooled to a
+        temporary file on disk so that memory use does not grow with the
+        size of the repository.
+
+        Set to 0 to always keep the build context in memory.
+        """,
+        config=True,
+    )
+
     volumes = Dict(
         {},
         help="""
@@ -302,6 +334,76 @@ class Repo2Docker(Application):
         config=True,
     )
 
+    system_image_repository = Unicode(
+        None,
+        allow_none=True,
+        help="""
+        Image repository for shared system images.
+
+        The first layers of an image built from a generated Dockerfile set
+        up locales, the user and the base apt packages. They are the same for
+        every repository with the same base image and user. If this is set,
+        these layers are built once as an image in this repository, tagged
+        with a hash of everything they depend on, and the image of each
+        repository starts `FROM` it.
+
+        When pushing, the system image is looked up in and pushed to the
+        registry, so that other builders can pull it instead of building it.
+        """,
+        config=True,
+    )
+
+    cache_mounts = Bool(
+        False,
+        help="""
+        Keep the downloads of package managers in BuildKit cache mounts.
+
+        The generated Dockerfile normally removes the downloads of apt, pip
+        and conda after installing packages, so every rebuild of a layer
+        downloads all of its packages again. If this is set, the `RUN`
+        instructions that install packages mount a BuildKit cache for the
+        downloads instead. The cache stays on the builder and isn't part of
+        the image, so rebuilds are faster and the image size is unchanged.
+
+        Has no effect on repositories with their own Dockerfile.
+        """,
+        config=True,
+    )
+
+    environment_image_repository = Unicode(
+        None,
+        allow_none=True,
+        help="""
+        Image repository for shared environment images.
+
+        After the system layers, the build scripts of a buildpack set up its
+        base environment, e.g. the conda environment created from the
+        lockfile for the Python version of the repository. They don't depend
+        on the contents of the repository, so if this is set they are built
+        once as an image in this repository, tagged with a hash of the
+        Dockerfile and the files used by the build scripts, like the
+        lockfile. The image of each repository then starts `FROM` it.
+
+        Like the system image, the environment image is looked up in and
+        pushed to the registry when pushing. If `system_image_repository`
+        is also set, the environment image starts `FROM` the system image.
+        """,
+        config=True,
+    )
+
+    metrics_textfile = Unicode(
+        None,
+        allow_none=True,
+        help="""
+        Write the time spent in each step of the build to this file.
+
+        The file is written in the Prometheus text format when the build
+        finishes, for example for the textfile collector of the Prometheus
+        node exporter. The durations are always logged.
+        """,
+        config=True,
+    )
+
     repo = Unicode(
         ".",
         help="""
@@ -336,6 +438,136 @@ class Repo2Docker(Application):
         allow_none=True,
     )
 
+    git_shallow_fetch = Bool(
+        False,
+        help="""
+        Only fetch the commit that `ref` points at.
+
+        By default the full history of a git repository is cloned when a
+        `ref` is given. When this is enabled the ref is resolved with
+        `git ls-remote` and only that commit is fetched, which is much faster
+        for repositories with a long history. The checkout will be a shallow
+        clone without history.
+
+        If the server doesn't allow fetching the commit directly the full
+        repository is cloned instead.
+        """,
+        config=True,
+    )
+
+    git_submodule_jobs = Int(
+        0,
+        help="""
+        Number of git submodules to fetch in parallel.
+
+        Set to 0 to use git's default (the `submodule.fetchJobs` git setting).
+        """,
+        config=True,
+    )
+
+    git_shallow_submodules = Bool(
+        False,
+        help="""
+        Only fetch the commit of each git submodule, without its history.
+        """,
+        config=True,
+    )
+
+    git_submodules = List(
+        Unicode(),
+        None,
+        help="""
+        Paths of the git submodules to initialize.
+
+        Glob patterns like `vendor/*` are allowed. Only top level submodules
+        are selected, the submodules nested inside of them are always
+        initialized. If unset all submodules are initialized.
+        """,
+        config=True,
+        allow_none=True,
+    )
+
+    git_skip_submodules = List(
+        Unicode(),
+        help="""
+        Paths of the git submodules not to initialize.
+
+        Glob patterns like `docs/*` are allowed. Takes precedence over
+        `git_submodules`.
+        """,
+        config=True,
+    )
+
+    git_mirror_cache_dir = Unicode(
+        None,
+        help="""
+        Directory in which to keep mirrors of the git repositories that are built.
+
+        When set, repo2docker keeps a bare mirror of every git repository it
+        clones in this directory. Later builds of the same repository only
+        download the objects that are new since the last build.
+
+        A good choice is `~/.cache/repo2docker/git-mirrors`. If unset, every
+        build clones the repository from scratch.
+        """,
+        config=True,
+        allow_none=True,
+    )
+
+    git_mirror_cache_size = ByteSpecification(
+        "10G",
+        help="""
+        Maximum size of the git mirror cache.
+
+        When the mirrors in `git_mirror_cache_dir` take up more space than
+        this, the least recently used ones are removed. Set to 0 to never
+        remove mirrors.
+        """,
+        config=True,
+    )
+
+    doi_cache_ttl = Float(
+        0,
+        help="""
+        Number of seconds to keep DOI resolutions on disk.
+
+        All DOI based content providers share the resolution of a DOI, so it
+        is only resolved once per process. If this is non-zero resolutions
+        are also kept in `~/.cache/repo2docker/doi.json` and reused by later
+        builds for this long. DOIs that don't resolve are never kept on disk.
+        """,
+        config=True,
+    )
+
+    content_cache_dir = Unicode(
+        None,
+        help="""
+        Directory in which to keep the contents of immutable records.
+
+        Records from content providers like Zenodo, Figshare, Hydroshare or
+        Software Heritage never change once published. When set, repo2docker
+        keeps a copy of every such record it fetches in this directory and
+        uses it instead of downloading the record again.
+
+        A good choice is `~/.cache/repo2docker/content`. If unset, records
+        are always downloaded.
+        """,
+        config=True,
+        allow_none=True,
+    )
+
+    content_cache_size = ByteSpecification(
+        "20G",
+        help="""
+        Maximum size of the content cache.
+
+        When the records in `content_cache_dir` take up more space than this,
+        the least recently used ones are removed. Set to 0 to never remove
+        records.
+        """,
+        config=True,
+    )
+
     cleanup_checkout = Bool(
         True,
         help="""
@@ -500,6 +732,9 @@ class Repo2Docker(Application):
         picked_content_provider = None
         for ContentProvider in self.content_providers:
             cp = ContentProvider()
+            if isinstance(cp, DoiProvider):
+                # detecting a DOI based content provider resolves the DOI
+                cp.doi_cache_ttl = self.doi_cache_ttl
             spec = cp.detect(url, ref=ref)
             if spec is not None:
                 picked_content_provider = cp
@@ -509,14 +744,38 @@ class Repo2Docker(Application):
         if picked_content_provider is None:
             self.log.error(f"No matching content provider found for {url}.")
 
+        if isinstance(picked_content_provider, contentproviders.Local):
+            picked_content_provider.subdir = self.subdir
+
+        if isinstance(picked_content_provider, contentproviders.Git):
+            picked_content_provider.shallow_fetch_ref = self.git_shallow_fetch
+            picked_content_provider.submodule_jobs = self.git_submodule_jobs
+            picked_content_provider.shallow_submodules = self.git_shallow_submodules
+            picked_content_provider.submodules = self.git_submodules
+            picked_content_provider.skip_submodules = self.git_skip_submodules
+            if self.git_mirror_cache_dir:
+                picked_content_provider.mirror_cache = GitMirrorCache(
+                    os.path.expanduser(self.git_mirror_cache_dir),
+                    self.git_mirror_cache_size,
+                )
+
         swh_token = self.config.get("swh_token", self.swh_token)
         if swh_token and isinstance(picked_content_provider, contentproviders.Swhid):
             picked_content_provider.set_auth_token(swh_token)
 
-        for log_line in picked_content_provider.fetch(
-            spec, checkout_path, yield_output=self.json_logs
-        ):
-            self.log.info(log_line, extra=dict(phase=R2dState.FETCHING))
+        content_id = None
+        if self.content_cache_dir and picked_content_provider.immutable:
+            content_id = picked_content_provider.content_id
+
+        if content_id is None:
+            for log_line in picked_content_provider.fetch(
+                spec, checkout_path, yield_output=self.json_logs
+            ):
+                self.log.info(log_line, extra=dict(phase=R2dState.FETCHING))
+        else:
+            self.fetch_from_content_store(
+                picked_content_provider, spec, content_id, checkout_path
+            )
 
         if not self.output_image_spec:
             image_spec = "r2d" + self.repo
@@ -526,6 +785,8 @@ class Repo2Docker(Application):
             if self.subdir:
                 image_spec += self.subdir
             if picked_content_provider.content_id is not None:
+                # the same content built differently is a different image
+                image_spec += self._build_config_id()
                 image_spec += picked_content_provider.content_id
             else:
                 image_spec += str(int(time.time()))
@@ -533,6 +794,69 @@ class Repo2Docker(Application):
                 image_spec, escape_char="-"
             ).lower()
 
+    def _build_config_id(self):
+        """A hash of the configuration that changes the image built from a repository
+
+        Part of the default image name together with the content_id, so
+        that an existing image is only reused if it was built from the same
+        content in the same way.
+        """
+        config = dict(
+            version=self.version,
+            base_image=self.base_image,
+            platform=self.platform,
+            user_id=self.user_id,
+            user_name=self.user_name,
+            target_repo_dir=self.target_repo_dir,
+            extra_build_args=self.extra_build_args,
+            labels=self.labels,
+            appendix=self.appendix,
+            cache_mounts=self.cache_mounts,
+            buildpacks=[
+                # buildpacks are classes, or factories that aren't
+                getattr(bp, "__qualname__", type(bp).__qualname__)
+                for bp in self.buildpacks + [self.default_buildpack]
+            ],
+        )
+        config_json = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(config_json.encode("utf-8")).hexdigest()[:8]
+
+    def fetch_from_content_store(
+        self, content_provider, spec, content_id, checkout_path
+    ):
+        """Fetch an immutable record via the content store
+
+        The record is fetched into the store first if it isn't there yet.
+        """
+        store = ContentStore(
+            os.path.expanduser(self.content_cache_dir), self.content_cache_size
+        )
+        provider = content_provider.__class__.__name__.lower()
+
+        def fetch(output_dir):
+            for log_line in content_provider.fetch(
+                spec, output_dir, yield_output=self.json_logs
+            ):
+                self.log.info(log_line, extra=dict(phase=R2dState.FETCHING))
+
+        # if the checkout is kept around it might be modified later, which
+        # would also modify hardlinked files in the store
+        link = self.cleanup_checkout
+        if store.materialize(provider, content_id, checkout_path, link=link):
+            self.log.info(
+                f"Using {content_id} from the content cache.\n",
+                extra=dict(phase=R2dState.FETCHING),
+            )
+        else:
+            with store.add(provider, content_id) as staging_dir:
+                fetch(staging_dir)
+            if not store.materialize(provider, content_id, checkout_path, link=link):
+                # another build evicted the record right after it was added
+                fetch(checkout_path)
+
+        for path in store.evict(keep=[(provider, content_id)]):
+            self.log.info(f"Removed {path} from the content cache.\n")
+
     def json_excepthook(self, etype, evalue, traceback):
         """Called on an uncaught exception when using json logging
 
@@ -577,7 +901,12 @@ class Repo2Docker(Application):
 
         and wait for it to finish.
         """
-        container = self.start_container()
+        if self.timings is None:
+            self.timings = Timings(self.log)
+        with self.timings.timed(R2dState.RUNNING, "start container"):
+            container = self.start_container()
+        # log the timings of the build again, now with this step
+        self._log_timings()
         self.wait_for_container(container)
 
     def start_container(self):
@@ -705,12 +1034,37 @@ class Repo2Docker(Application):
             return False
         # check if we already have an image for this content
         engine = self.get_engine()
+        if self.push:
+            # a local image would still have to be pushed, so look in the
+            # registry that we would push to
+            return engine.image_in_registry(self.output_image_spec)
         return engine.inspect_image(self.output_image_spec) is not None
 
     def build(self):
         """
         Build docker image
         """
+        self.timings = Timings(self.log)
+        try:
+            self._build()
+        finally:
+            self._log_timings()
+
+    def _log_timings(self):
+        self.log.info(
+            self.timings.summary(),
+            extra=dict(
+                phase=R2dState.BUILDING,
+                durations=[
+                    dict(phase=phase, step=step, duration=round(duration, 3))
+                    for phase, step, duration in self.timings.durations
+                ],
+            ),
+        )
+        if self.metrics_textfile:
+            self.timings.write_textfile(self.metrics_textfile)
+
+    def _build(self):
         # Check if r2d can connect to docker daemon
         if not self.dry_run:
             try:
@@ -718,6 +1072,11 @@ class Repo2Docker(Application):
             except ContainerEngineException as e:
                 self.log.error(f"\nContainer engine initialization error: {e}\n")
                 self.exit(1)
+            docker_client.timings = self.timings
+            # builds of other commits of the repository share its build cache
+            docker_client.cache_name = (
+                f"{self.repo}/{self.subdir}" if self.subdir else self.repo
+            )
 
         # If the source to be executed is a directory, continue using the
         # directory. In the case of a local directory, it is used as both the
@@ -735,12 +1094,12 @@ class Repo2Docker(Application):
                 checkout_path = self.git_workdir
 
         try:
-            self.fetch(self.repo, self.ref, checkout_path)
+            with self.timings.timed(R2dState.FETCHING, "fetch"):
+                self.fetch(self.repo, self.ref, checkout_path)
 
-            if self.find_image() and not self.push:
-                # If push is requested we don't have a general way to query the registry.
-                # ContainerEngine.build() also handles pushing, so always "build" and
-                # rely on the implementation to decide whether to rebuild.
+            with self.timings.timed(R2dState.BUILDING, "find image"):
+                image_found = self.find_image()
+            if image_found:
                 self.log.info(
                     f"Reusing existing image ({self.output_image_spec}), not building."
                 )
@@ -758,93 +1117,129 @@ class Repo2Docker(Application):
                     )
                     raise FileNotFoundError(f"Could not find {checkout_path}")
 
-            with chdir(checkout_path):
+            # Walk the repository once, detection, rendering and creating
+            # the build context all use this index. Buildpacks read the files
+            # relative to its root, not the working directory, which is shared
+            # by all the builds of a process.
+            with self.timings.timed(R2dState.BUILDING, "detect"):
+                repo_index = RepoIndex(os.path.abspath(checkout_path))
                 for BP in self.buildpacks:
                     bp = BP(base_image=self.base_image)
+                    bp.repo_index = repo_index
                     if bp.detect():
                         picked_buildpack = bp
                         break
                 else:
-                    if self.default_buildpack:
-                        picked_buildpack = self.default_buildpack(
-                            base_image=self.base_image
-                        )
-                    else:
-                        self.log.error(
-                            "No environment specification found. See https://repo2docker.readthedocs.io/en/latest/configuration/ for supported files.\n"
-                        )
-                        self.exit(1)
-
-                picked_buildpack.platform = self.platform
-                picked_buildpack.appendix = self.appendix
-                # Add metadata labels
-                picked_buildpack.labels["repo2docker.version"] = self.version
-                repo_label = "local" if os.path.isdir(self.repo) else self.repo
-                picked_buildpack.labels["repo2docker.repo"] = repo_label
-                picked_buildpack.labels["repo2docker.ref"] = self.ref
-
-                picked_buildpack.labels.update(self.labels)
-
-                build_args = {
-                    "NB_USER": self.user_name,
-                    "NB_UID": str(self.user_id),
-                }
-                if self.target_repo_dir:
-                    build_args["REPO_DIR"] = self.target_repo_dir
-                build_args.update(self.extra_build_args)
-
-                if self.dry_run:
-                    print(picked_buildpack.render(build_args))
+                    picked_buildpack = None
+            if picked_buildpack is None:
+                if self.default_buildpack:
+                    picked_buildpack = self.default_buildpack(
+                        base_image=self.base_image
+                    )
+                    picked_buildpack.repo_index = repo_index
                 else:
-                    self.log.debug(
-                        picked_buildpack.render(build_args),
-                        extra=dict(phase=R2dState.BUILDING),
+                    self.log.error(
+                        "No environment specification found. See https://repo2docker.readthedocs.io/en/latest/configuration/ for supported files.\n"
+                    )
+                    self.exit(1)
+
+            picked_buildpack.timings = self.timings
+            picked_buildpack.platform = self.platform
+            picked_buildpack.appendix = self.appendix
+            picked_buildpack.cache_mounts = self.cache_mounts
+            picked_buildpack.build_context_memory_limit = (
+                self.build_context_memory_limit
+            )
+            # Add metadata labels
+            picked_buildpack.labels["repo2docker.version"] = self.version
+            repo_label = "local" if os.path.isdir(self.repo) else self.repo
+            picked_buildpack.labels["repo2docker.repo"] = repo_label
+            picked_buildpack.labels["repo2docker.ref"] = self.ref
+
+            picked_buildpack.labels.update(self.labels)
+
+            build_args = {
+                "NB_USER": self.user_name,
+                "NB_UID": str(self.user_id),
+            }
+            if self.target_repo_dir:
+                build_args["REPO_DIR"] = self.target_repo_dir
+            build_args.update(self.extra_build_args)
+
+            if self.system_image_repository and picked_buildpack.render_system():
+                system_build_args = {
+                    "NB_USER": build_args["NB_USER"],
+                    "NB_UID": build_args["NB_UID"],
+                }
+                system_image = picked_buildpack.system_image_spec(
+                    self.system_image_repository, system_build_args
+                )
+                if not self.dry_run:
+                    self._ensure_base_image(
+                        docker_client,
+                        "system",
+                        picked_buildpack.build_system_image,
+                        system_image,
+                        system_build_args,
                     )
-                    if self.user_id == 0:
-                        raise ValueError(
-                            "Root as the primary user in the image is not permitted."
-                        )
-
-                    self.log.info(
-                        f"Using {bp.__class__.__name__} builder\n",
-                        extra=dict(phase=R2dState.BUILDING),
+                picked_buildpack.system_image = system_image
+
+            if self.environment_image_repository and (
+                picked_buildpack.render_environment(build_args)
+            ):
+                env_build_args = {
+                    "NB_USER": build_args["NB_USER"],
+                    "NB_UID": build_args["NB_UID"],
+                }
+                environment_image = picked_buildpack.environment_image_spec(
+                    self.environment_image_repository, env_build_args
+                )
+                if not self.dry_run:
+                    self._ensure_base_image(
+                        docker_client,
+                        "environment",
+                        picked_buildpack.build_environment_image,
+                        environment_image,
+                        env_build_args,
                     )
+                picked_buildpack.environment_image = environment_image
 
-                    extra_build_kwargs = self.extra_build_kwargs.copy()
-                    # Set "push" and "load" parameters in a backwards compat way, without
-                    # having to change the signature of every buildpack
-                    extra_build_kwargs["push"] = self.push
-                    extra_build_kwargs["load"] = self.run
+            # the first render, later ones are memoized
+            with self.timings.timed(R2dState.BUILDING, "render"):
+                dockerfile = picked_buildpack.render(build_args)
+            if self.dry_run:
+                print(dockerfile)
+            else:
+                self.log.debug(dockerfile, extra=dict(phase=R2dState.BUILDING))
+                if self.user_id == 0:
+                    raise ValueError(
+                        "Root as the primary user in the image is not permitted."
+                    )
 
-                    for l in picked_buildpack.build(
-                        docker_client,
-                        self.output_image_spec,
-                        # This is deprecated, but passing it anyway to not break backwards compatibility
-                        self.build_memory_limit,
-                        build_args,
-                        self.cache_from,
-                        extra_build_kwargs,
-                        platform=self.platform,
-                    ):
-                        if docker_client.string_output:
-                            self.log.info(l, extra=dict(phase=R2dState.BUILDING))
-                        # else this is Docker output
-                        elif "stream" in l:
-                            self.log.info(
-                                l["stream"], extra=dict(phase=R2dState.BUILDING)
-                            )
-                        elif "error" in l:
-                            self.log.info(l["error"], extra=dict(phase=R2dState.FAILED))
-                            raise BuildError(l["error"])
-                        elif "status" in l:
-                            self.log.info(
-                                "Fetching base image...\r",
-                                extra=dict(phase=R2dState.BUILDING),
-                            )
-                        else:
-                            self.log.info(
-                                json.dumps(l), extra=dict(phase=R2dState.BUILDING)
-                            )
+                self.log.info(
+                    f"Using {picked_buildpack.__class__.__name__} builder\n",
+                    extra=dict(phase=R2dState.BUILDING),
+                )
+
+                extra_build_kwargs = self.extra_build_kwargs.copy()
+                # Set "push" and "load" parameters in a backwards compat way, without
+                # having to change the signature of every buildpack
+                extra_build_kwargs["push"] = self.push
+                extra_build_kwargs["load"] = self.run
+
+                progress = BuildKitProgress()
+                for l in picked_buildpack.build(
+                    docker_client,
+                    self.output_image_spec,
+                    # This is deprecated, but passing it anyway to not break backwards compatibility
+                    self.build_memory_limit,
+                    build_args,
+                    self.cache_from,
+                    extra_build_kwargs,
+                    platform=self.platform,
+                ):
+                    self._log_build_output(docker_client, l, progress)
+                self._log_build_summary(progress, picked_buildpack)
 
         finally:
             # Cleanup checkout if necessary
@@ -852,6 +1247,95 @@ class Repo2Docker(Application):
             if self.cleanup_checkout:
                 shutil.rmtree(checkout_path, ignore_errors=True)
 
+    def _log_build_output(self, docker_client, l, progress):
+        """Log one line or event of the output of the container engine"""
+        if docker_client.string_output:
+            extra = dict(phase=R2dState.BUILDING)
+            event = progress.feed(l)
+            if event is not None:
+                extra["buildkit"] = event
+            self.log.info(l, extra=extra)
+        # else this is Docker output
+        elif "stream" in l:
+            self.log.info(l["stream"], extra=dict(phase=R2dState.BUILDING))
+        elif "error" in l:
+            self.log.info(l["error"], extra=dict(phase=R2dState.FAILED))
+            raise BuildError(l["error"])
+        elif "status" in l:
+            self.log.info(
+                "Fetching base image...\r",
+                extra=dict(phase=R2dState.BUILDING),
+            )
+        else:
+            self.log.info(json.dumps(l), extra=dict(phase=R2dState.BUILDING))
+
+    def _ensure_base_image(self, docker_client, kind, build, image_spec, build_args):
+        """Build a system or environment image unless it exists already
+
+        `kind` is used in the log messages, `build` is the build method of
+        the buildpack for this kind of image.
+        """
+        with self.timings.timed(R2dState.BUILDING, f"{kind} image"):
+            if self.push:
+                # other builders can only use it if it is in the registry
+                found = docker_client.image_in_registry(image_spec)
+            else:
+                found = docker_client.inspect_image(image_spec) is not None
+            if found:
+                self.log.info(
+                    f"Using existing {kind} image {image_spec}\n",
+                    extra=dict(phase=R2dState.BUILDING),
+                )
+                return
+
+            self.log.info(
+                f"Building {kind} image {image_spec}\n",
+                extra=dict(phase=R2dState.BUILDING),
+            )
+            extra_build_kwargs = self.extra_build_kwargs.copy()
+            extra_build_kwargs["push"] = self.push
+            extra_build_kwargs["load"] = not self.push
+            progress = BuildKitProgress()
+            for l in build(
+                docker_client,
+                image_spec,
+                build_args,
+                extra_build_kwargs,
+                platform=self.platform,
+            ):
+                self._log_build_output(docker_client, l, progress)
+
+    def _log_build_summary(self, progress, buildpack):
+        """Log how many of the build steps were cached"""
+        summary = progress.summary(buildpack.build_context_bytes)
+        if not summary["steps"]:
+            # not BuildKit output
+            return
+        details = ""
+        if summary["context_bytes"] is not None:
+            details += f", build context {summary['context_bytes'] / 1e6:.1f} MB"
+        if summary["cache_import_duration"]:
+            details += f", cache import {summary['cache_import_duration']:.1f}s"
+        if summary["cache_export_duration"]:
+            details += f", cache export {summary['cache_export_duration']:.1f}s"
+        self.log.info(
+            f"{summary['cached']} of {summary['steps']} build steps cached{details}\n",
+            extra=dict(phase=R2dState.BUILDING, buildkit_summary=summary),
+        )
+
+    async def build_async(self):
+        """
+        Build docker image without blocking the event loop
+
+        An asynchronous generator of log events, see
+        `repo2docker.asyncbuild.build_events`:
+
+            async for event in r2d.build_async():
+                print(event["message"], end="")
+        """
+        async for event in build_events(self):
+            yield event
+
     def start(self):
         self.build()
 
@@ -0,0 +1,113 @@
+"""
+Build images from an asyncio event loop
+
+`build_events` runs `Repo2Docker.build` in a worker thread, so the event
+loop isn't blocked by its subprocesses and HTTP requests and one event loop
+can drive many concurrent builds. The log records of the build are turned
+into log events as they are emitted.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+
+from pythonjsonlogger import jsonlogger
+
+from .engine import BuildError
+from .utils import ProcessGroup, R2dState, process_group
+
+# (loop, queue, level) of the build that is running in the current context
+_build_queue = contextvars.ContextVar("repo2docker_build_queue", default=None)
+
+
+class _EventHandler(logging.Handler):
+    """
+    Hand the log records of a build to the `build_events` that runs it
+
+    A single handler serves all builds, the context variable tells which
+    build a record belongs to. Records from other code are ignored.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # the same fields as the --json-logs output
+        self.setFormatter(jsonlogger.JsonFormatter())
+
+    def emit(self, record):
+        target = _build_queue.get()
+        if target is None:
+            return
+        loop, queue, level = target
+        if record.levelno < level:
+            return
+        try:
+            event = json.loads(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        # records are emitted by the threads of the build
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+_handler = _EventHandler()
+
+
+async def build_events(app):
+    """Build the image configured by app, yielding log events
+
+    Every event is a dict with the `message` of a log line and, for most
+    lines, the `phase` of the build it comes from, like the lines logged
+    with `--json-logs`.
+
+    The image is built but never run. When the build is finished
+    `app.output_image_spec` is the name of the image, the last event has
+    it as its `image`. Exceptions of the build are raised as they would be
+    by `app.build()`, except that exiting is raised as a BuildError. If the
+    iteration is stopped early the commands of the build are killed.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # like Repo2Docker.initialize, the application and its engine log to the
+    # repo2docker logger too. Its other handlers are left alone.
+    app.log = logging.getLogger("repo2docker")
+    if _handler not in app.log.handlers:
+        app.log.addHandler(_handler)
+    if not app.log.isEnabledFor(app.log_level):
+        app.log.setLevel(app.log_level)
+
+    processes = ProcessGroup()
+
+    def build():
+        # runs in a copy of the context of build_events
+        _build_queue.set((loop, queue, app.log_level))
+        process_group.set(processes)
+        try:
+            app.build()
+        except SystemExit as e:
+            raise BuildError(f"repo2docker exited with status {e.code}") from e
+        app.log.info(
+            f"Finished building {app.output_image_spec}\n",
+            extra=dict(phase=R2dState.BUILDING, image=app.output_image_spec),
+        )
+
+    task = asyncio.ensure_future(asyncio.to_thread(build))
+    done = object()
+    # queued after the events the build emitted before it finished
+    task.add_done_callback(lambda task: loop.call_soon(queue.put_nowait, done))
+    try:
+        while True:
+            event = await queue.get()
+            if event is done:
+                break
+            yield event
+        # raise the exception of the build, if any
+        await task
+    finally:
+        if not task.done():
+            # the thread can't be cancelled, stop what it is waiting for
+            processes.kill()
+            try:
+                await task
+            except Exception:
+                pass
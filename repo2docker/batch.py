@@ -0,0 +1,197 @@
+"""
+Build many repositories listed in a manifest
+
+The manifest is a YAML list of repositories, in the same format as
+tests/external/reproductions.repos.yaml:
+
+    - name: Binder Examples - Requirements
+      url: https://github.com/binder-examples/requirements
+      ref: main
+
+Builds run in a pool of worker processes. Each worker builds one repository
+at a time and is reused for the next one, so the caches of a process (the
+Dockerfile template, DOI resolutions, the Dataverse installations) are only
+populated once per worker. Fetches from the same host are limited across all
+workers. Every log line of a build is labelled with the name of its
+repository.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlparse
+
+from ruamel.yaml import YAML
+
+from .app import Repo2Docker
+
+# per worker process state, set by _init_worker
+_worker = {}
+
+
+def load_manifest(path):
+    """Return the list of repositories in a manifest
+
+    Every entry has a `url` and optionally a `name` and a `ref`, other keys
+    are ignored.
+    """
+    with open(path) as f:
+        entries = YAML(typ="safe").load(f) or []
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} must contain a list of repositories")
+    repos = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or "url" not in entry:
+            raise ValueError(f"Entry {i} of {path} has no url")
+        repos.append(
+            {
+                "name": entry.get("name", entry["url"]),
+                "url": entry["url"],
+                "ref": entry.get("ref"),
+            }
+        )
+    return repos
+
+
+def _host(url):
+    """The host a repository is fetched from, used to limit concurrency"""
+    return urlparse(url).netloc or "local"
+
+
+class _RepoFilter(logging.Filter):
+    """Add the name of the repository being built to log records"""
+
+    def __init__(self, repo_name):
+        super().__init__()
+        self.repo_name = repo_name
+
+    def filter(self, record):
+        record.repo = self.repo_name
+        return True
+
+
+class BatchRepo2Docker(Repo2Docker):
+    """Repo2Docker for one build in a batch worker process"""
+
+    def fetch(self, url, ref, checkout_path):
+        limit = _worker.get("host_limits", {}).get(_host(url))
+        with limit or nullcontext():
+            super().fetch(url, ref, checkout_path)
+
+
+def _init_worker(config_file, traitlet_args, host_limits):
+    _worker["config_file"] = config_file
+    _worker["traitlet_args"] = traitlet_args
+    _worker["host_limits"] = host_limits
+
+
+def _build(repo):
+    """Build one repository, return a summary of the result"""
+    result = dict(repo, image=None, status="failed", error=None)
+    start = time.monotonic()
+    try:
+        r2d = BatchRepo2Docker()
+        if _worker["config_file"]:
+            r2d.load_config_file(_worker["config_file"])
+        r2d.parse_command_line(_worker["traitlet_args"])
+        r2d.repo = repo["url"]
+        r2d.ref = repo["ref"]
+        r2d.run = False
+        r2d.initialize()
+        # builds of all workers log to the same stream
+        for handler in r2d.log.handlers:
+            handler.addFilter(_RepoFilter(repo["name"]))
+            if not r2d.json_logs:
+                handler.setFormatter(logging.Formatter("[%(repo)s] %(message)s"))
+        r2d.build()
+        result["image"] = r2d.output_image_spec
+        result["status"] = "success"
+    except SystemExit as e:
+        result["error"] = f"exited with status {e.code}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["duration"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def run_batch(repos, jobs=2, host_limit=4, config_file=None, traitlet_args=()):
+    """Build repositories on a pool of `jobs` worker processes
+
+    At most `host_limit` repositories are fetched from the same host at the
+    same time. Returns the results in the order of `repos`.
+    """
+    host_limits = {
+        host: multiprocessing.BoundedSemaphore(host_limit)
+        for host in {_host(repo["url"]) for repo in repos}
+    }
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(config_file, list(traitlet_args), host_limits),
+    ) as pool:
+        return list(pool.map(_build, repos))
+
+
+def get_argparser():
+    argparser = argparse.ArgumentParser(
+        prog="repo2docker-batch",
+        description="Build all repositories listed in a manifest",
+    )
+    argparser.add_argument(
+        "manifest",
+        help="YAML file with a list of repositories with name, url and ref",
+    )
+    argparser.add_argument(
+        "--jobs",
+        type=int,
+        default=2,
+        help="Number of repositories to build at the same time",
+    )
+    argparser.add_argument(
+        "--host-limit",
+        type=int,
+        default=4,
+        help="Maximum number of repositories to fetch from one host at a time",
+    )
+    argparser.add_argument(
+        "--summary",
+        help="Write the results as JSON to this file instead of stdout",
+    )
+    argparser.add_argument(
+        "--config",
+        default="repo2docker_config.py",
+        help="Path to config file for repo2docker",
+    )
+    return argparser
+
+
+def main(argv=None):
+    """Entry point of `repo2docker-batch`
+
+    Arguments that aren't listed by `--help` are passed on to every build,
+    e.g. `--Repo2Docker.push=True`.
+    """
+    args, traitlet_args = get_argparser().parse_known_args(argv)
+    repos = load_manifest(args.manifest)
+    results = run_batch(
+        repos,
+        jobs=args.jobs,
+        host_limit=args.host_limit,
+        config_file=args.config,
+        traitlet_args=traitlet_args,
+    )
+
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if any(result["status"] != "success" for result in results):
+        sys.exit(1)
@@ -0,0 +1,134 @@
+"""
+Structured events from the plain progress output of BuildKit
+
+`docker buildx build --progress plain` prints the progress of every vertex
+(a step of the build) as lines prefixed with the number of the vertex:
+
+    #7 [ 3/12] RUN pip install -r requirements.txt
+    #7 0.512 Collecting numpy
+    #7 DONE 12.3s
+
+    #8 [ 4/12] COPY src/ ${REPO_DIR}/
+    #8 CACHED
+
+The first line of a vertex is its name, which for a Dockerfile instruction
+includes the number of the step. The last line says if it was cached, how
+long it ran or that it failed.
+"""
+
+import re
+
+_VERTEX_LINE = re.compile(r"^#(\d+) (.*)$")
+_STEP_NAME = re.compile(
+    r"^\[(?:(?P<stage>[^\]]*?) +)?(?P<step>\d+/\d+)\] (?P<instruction>[A-Z]+)\b"
+)
+_DONE = re.compile(r"^DONE (\d+(?:\.\d+)?)s$")
+_ERROR = re.compile(r"^ERROR\b")
+_TRANSFER = re.compile(r"^transferring \w+: (\d+(?:\.\d+)?)([kMGTP]?B)\b")
+_UNITS = {"B": 1, "kB": 1e3, "MB": 1e6, "GB": 1e9, "TB": 1e12, "PB": 1e15}
+
+BUILD_CONTEXT = "[internal] load build context"
+# a tar build context streamed on stdin (`docker buildx build -`)
+REMOTE_BUILD_CONTEXT = "[internal] load remote build context"
+CACHE_IMPORT = "importing cache manifest from "
+CACHE_EXPORT = "exporting cache"
+
+
+class BuildKitProgress:
+    """
+    Parser for the plain progress output of BuildKit
+
+    Lines are passed to `feed` as they are produced. When a line finishes a
+    vertex an event for it is returned, a dict with:
+
+    - vertex: the number of the vertex
+    - name: the name of the vertex
+    - stage, step, instruction: for Dockerfile instructions the build stage
+      (or None), the step (e.g. "3/12") and the instruction (e.g. "RUN")
+    - status: "cached", "done", "error" or "canceled"
+    - duration: in seconds, None if the vertex didn't run
+    - transferred: bytes transferred, e.g. for the build context, or None
+    """
+
+    def __init__(self):
+        self.vertices = {}
+
+    def feed(self, line):
+        """Parse one line of output, return an event if it finishes a vertex"""
+        m = _VERTEX_LINE.match(line.rstrip("\r\n"))
+        if m is None:
+            return None
+        number, text = int(m.group(1)), m.group(2)
+
+        vertex = self.vertices.get(number)
+        if vertex is None:
+            step = _STEP_NAME.match(text)
+            self.vertices[number] = dict(
+                vertex=number,
+                name=text,
+                stage=step and step.group("stage"),
+                step=step and step.group("step"),
+                instruction=step and step.group("instruction"),
+                status=None,
+                duration=None,
+                transferred=None,
+            )
+            return None
+
+        transfer = _TRANSFER.match(text)
+        if transfer:
+            # progress is repeated with the total so far, keep the last one
+            size, unit = transfer.groups()
+            vertex["transferred"] = int(float(size) * _UNITS[unit])
+            return None
+
+        done = _DONE.match(text)
+        if text == "CACHED":
+            vertex["status"] = "cached"
+        elif done:
+            vertex["status"] = "done"
+            vertex["duration"] = float(done.group(1))
+        elif _ERROR.match(text):
+            vertex["status"] = "error"
+        elif text == "CANCELED":
+            vertex["status"] = "canceled"
+        else:
+            return None
+        return dict(vertex)
+
+    def summary(self, sent_context_bytes=None):
+        """Return a summary of the Dockerfile steps seen so far
+
+        A dict with the number of `steps`, how many were `cached` and
+        `executed`, the `cache_hit_rate`, the total `duration` of the executed
+        steps, the size of the build context in `context_bytes` and how long
+        importing and exporting the build cache took in
+        `cache_import_duration` and `cache_export_duration`.
+
+        BuildKit doesn't report the size of a build context streamed on
+        stdin, the size that was sent can be passed as `sent_context_bytes`
+        instead.
+        """
+        steps = [v for v in self.vertices.values() if v["step"] and v["status"]]
+        cached = sum(1 for v in steps if v["status"] == "cached")
+        context_bytes = None
+        cache_import_duration = cache_export_duration = 0
+        for vertex in self.vertices.values():
+            if vertex["name"] == BUILD_CONTEXT:
+                context_bytes = vertex["transferred"]
+            elif vertex["name"] == REMOTE_BUILD_CONTEXT:
+                context_bytes = vertex["transferred"] or sent_context_bytes
+            elif vertex["name"].startswith(CACHE_IMPORT):
+                cache_import_duration += vertex["duration"] or 0
+            elif vertex["name"].startswith(CACHE_EXPORT):
+                cache_export_duration += vertex["duration"] or 0
+        return dict(
+            steps=len(steps),
+            cached=cached,
+            executed=len(steps) - cached,
+            cache_hit_rate=round(cached / len(steps), 3) if steps else None,
+            duration=round(sum(v["duration"] or 0 for v in steps), 3),
+            context_bytes=context_bytes,
+            cache_import_duration=round(cache_import_duration, 3),
+            cache_export_duration=round(cache_export_duration, 3),
+        )
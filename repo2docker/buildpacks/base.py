@@ -7,15 +7,22 @@ import re
 import string
 import sys
 import tarfile
+import tempfile
 import textwrap
 from functools import lru_cache
 
 import escapism
 import jinja2
-from docker.utils.build import exclude_paths
+
+from ..repoindex import RepoIndex
+from ..utils import R2dState, Timings
 
 # Only use syntax features supported by Docker 17.09
-TEMPLATE = r"""
+
+# The system layers set up locales, the user and the base apt packages. They
+# are the same for all repositories with the same base image and user, so they
+# can be built once as a system image, see BuildPack.render_system.
+SYSTEM_TEMPLATE = r"""
 FROM {{base_image}}
 
 # Avoid prompts from apt
@@ -80,7 +87,13 @@ RUN apt-get -qq update && \
     apt-get -qq purge && \
     apt-get -qq clean && \
     rm -rf /var/lib/apt/lists/*
+"""
 
+# The environment layers follow the system layers and run the build scripts,
+# e.g. to create the conda base environment from a lockfile. Build scripts
+# don't depend on the contents of the repository, so these layers can also be
+# built once as an environment image, see BuildPack.render_environment.
+ENVIRONMENT_TEMPLATE = r"""
 {% if packages -%}
 RUN apt-get -qq update && \
     apt-get -qq install --yes \
@@ -117,6 +130,26 @@ COPY --chown={{ user }}:{{ user }} {{ src }} {{ dst }}
 {% for sd in build_script_directives -%}
 {{ sd }}
 {% endfor %}
+"""
+
+# Where package managers keep their downloads when BuildKit cache mounts are
+# used, see BuildPack.cache_mounts. Only the empty mount points end up in the
+# image.
+APT_CACHE_DIR = "/var/cache/repo2docker/apt"
+PIP_CACHE_DIR = "/var/cache/repo2docker/pip"
+CONDA_PKGS_DIR = "/var/cache/repo2docker/conda"
+
+# Replaces the layers that are in a system or environment image
+BASE_IMAGE_TEMPLATE = r"""
+FROM {{image}}
+
+# The layers up to here are in this image
+ARG NB_USER
+ARG NB_UID
+"""
+
+TEMPLATE = r"""
+{{ base_layers }}
 # ensure root user after build scripts
 USER root
 
@@ -215,9 +248,20 @@ CMD ["jupyter", "notebook", "--ip", "0.0.0.0"]
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 
+
+@lru_cache(maxsize=None)
+def _get_template(source=TEMPLATE):
+    """Compile a Dockerfile template once per process"""
+    return jinja2.Template(source)
+
+
 # Also used for the group
 DEFAULT_NB_UID = 1000
 
+# Build contexts larger than this are spooled to a temporary file on disk
+# instead of being held in memory
+DEFAULT_BUILD_CONTEXT_MEMORY_LIMIT = 64 * 1024 * 1024
+
 
 class BuildPack:
     """
@@ -249,6 +293,15 @@ class BuildPack:
                 "support is experimental in repo2docker."
             )
         self.platform = ""
+        self.build_context_memory_limit = DEFAULT_BUILD_CONTEXT_MEMORY_LIMIT
+        self._rendered = {}
+        self._repo_index = None
+        self.timings = Timings()
+        self.system_image = None
+        self.environment_image = None
+        self.cache_mounts = False
+        # size of the tar build context of the last build
+        self.build_context_bytes = None
 
     @lru_cache
     def get_packages(self):
@@ -341,16 +394,16 @@ class BuildPack:
         """
         return {}
 
+    @lru_cache
     def _check_stencila(self):
         """Find the stencila manifest dir if it exists
 
         And warn about removed stencila support
         """
-        for root, dirs, files in os.walk("."):
-            if "manifest.xml" in files:
-                self.log.error(
-                    f"Found a stencila manifest.xml at {root}. Stencila is no longer supported."
-                )
+        for root in self.repo_index.find("manifest.xml"):
+            self.log.error(
+                f"Found a stencila manifest.xml at {root}. Stencila is no longer supported."
+            )
 
     @lru_cache
     def get_build_scripts(self):
@@ -462,22 +515,25 @@ class BuildPack:
         return None
 
     @property
-    def binder_dir(self):
-        has_binder = os.path.isdir("binder")
-        has_dotbinder = os.path.isdir(".binder")
+    def repo_index(self):
+        """
+        Index of the files in the repository.
 
-        if has_binder and has_dotbinder:
-            raise RuntimeError(
-                "The repository contains both a 'binder' and a '.binder' "
-                "directory. However they are exclusive."
-            )
+        Repo2Docker sets this to an index that is shared by all buildpacks.
+        If it is not set an index of the current working directory is
+        created the first time it is used.
+        """
+        if self._repo_index is None:
+            self._repo_index = RepoIndex()
+        return self._repo_index
 
-        if has_dotbinder:
-            return ".binder"
-        elif has_binder:
-            return "binder"
-        else:
-            return ""
+    @repo_index.setter
+    def repo_index(self, repo_index):
+        self._repo_index = repo_index
+
+    @property
+    def binder_dir(self):
+        return self.repo_index.binder_dir()
 
     def binder_path(self, path):
         """Locate a file"""
@@ -489,20 +545,30 @@ class BuildPack:
     def render(self, build_args=None):
         """
         Render BuildPack into Dockerfile
+
+        The result is memoized, render is called more than once per build.
+        Labels, the appendix, the base image and the platform can still be
+        changed after the buildpack has been created so they are part of
+        the key along with build_args.
         """
         build_args = build_args or {}
 
-        t = jinja2.Template(TEMPLATE)
+        key = (
+            tuple(sorted(build_args.items())),
+            tuple(sorted(self.get_labels().items())),
+            self.appendix,
+            self.base_image,
+            self.platform,
+            self.system_image,
+            self.environment_image,
+            self.cache_mounts,
+        )
+        if key not in self._rendered:
+            self._rendered[key] = self._render(build_args)
+        return self._rendered[key]
 
-        build_script_directives = []
-        last_user = "root"
-        for user, script in self.get_build_scripts():
-            if last_user != user:
-                build_script_directives.append(f"USER {user}")
-                last_user = user
-            build_script_directives.append(
-                "RUN {}".format(textwrap.dedent(script.strip("\n")))
-            )
+    def _render(self, build_args):
+        t = _get_template()
 
         assemble_script_directives = []
         last_user = "root"
@@ -524,10 +590,52 @@ class BuildPack:
                 "RUN {}".format(textwrap.dedent(script.strip("\n")))
             )
 
+        # check if there's a stencila manifest, support for which has been removd
+        self._check_stencila()
+
+        if self.environment_image:
+            base_layers = self._render_base_image(self.environment_image) + "\n"
+        else:
+            base_layers = self._render_environment(build_args)
+
+        return t.render(
+            base_layers=base_layers,
+            env=self.get_env(),
+            labels=self.get_labels(),
+            preassemble_script_files=self.get_preassemble_script_files(),
+            preassemble_script_directives=preassemble_script_directives,
+            assemble_script_directives=assemble_script_directives,
+            post_build_scripts=self.get_post_build_scripts(),
+            start_script=self.get_start_script(),
+            appendix=self.appendix,
+            # For docker 17.09 `COPY --chown`, 19.03 would allow using $NBUSER
+            user=build_args.get("NB_UID", DEFAULT_NB_UID),
+        )
+
+    def _render_base_image(self, image):
+        return _get_template(BASE_IMAGE_TEMPLATE).render(image=image).strip()
+
+    def _render_environment(self, build_args):
+        """Render the system and environment layers"""
+        if self.system_image:
+            system_layers = self._render_base_image(self.system_image)
+        else:
+            system_layers = self.render_system().strip()
+
+        build_script_directives = []
+        last_user = "root"
+        for user, script in self.get_build_scripts():
+            if last_user != user:
+                build_script_directives.append(f"USER {user}")
+                last_user = user
+            build_script_directives.append(
+                "RUN {}".format(textwrap.dedent(script.strip("\n")))
+            )
+
         # Based on a physical location of a build script on the host,
         # create a mapping between:
         #   1. Location of a build script in a Docker build context
-        #      ('assemble_files/<escaped-file-path-truncated>-<6-chars-of-its-hash>')
+        #      ('build_script_files/<escaped-relative-path-truncated>-<6-chars-of-its-content-hash>')
         #   2. Location of the aforemention script in the Docker image
         # Base template basically does: COPY <1.> <2.>
         build_script_files = {
@@ -535,28 +643,152 @@ class BuildPack:
             for k, v in self.get_build_script_files().items()
         }
 
-        # check if there's a stencila manifest, support for which has been removd
-        self._check_stencila()
-
-        return t.render(
+        environment_layers = _get_template(ENVIRONMENT_TEMPLATE).render(
             packages=sorted(self.get_packages()),
             path=self.get_path(),
             build_env=self.get_build_env(),
-            env=self.get_env(),
-            labels=self.get_labels(),
             build_script_directives=build_script_directives,
-            preassemble_script_files=self.get_preassemble_script_files(),
-            preassemble_script_directives=preassemble_script_directives,
-            assemble_script_directives=assemble_script_directives,
             build_script_files=build_script_files,
-            base_packages=sorted(self.get_base_packages()),
-            post_build_scripts=self.get_post_build_scripts(),
-            start_script=self.get_start_script(),
-            appendix=self.appendix,
             # For docker 17.09 `COPY --chown`, 19.03 would allow using $NBUSER
             user=build_args.get("NB_UID", DEFAULT_NB_UID),
+        )
+        return f"{system_layers}\n\n{environment_layers.lstrip()}"
+
+    def render_system(self):
+        """
+        Render the Dockerfile of the system layers
+
+        Used as the start of the Dockerfile, or to build a system image that
+        is shared by all repositories with the same base image, user and
+        base packages.
+        """
+        return _get_template(SYSTEM_TEMPLATE).render(
             base_image=self.base_image,
+            base_packages=sorted(self.get_base_packages()),
+        )
+
+    def render_environment(self, build_args):
+        """
+        Render the Dockerfile of the environment layers
+
+        The environment layers are the system layers followed by the build
+        scripts, e.g. the creation of the conda base environment from its
+        lockfile. They can be built as an environment image that is shared
+        by all repositories that need the same environment.
+
+        Returns None if there are no build scripts.
+        """
+        if self.render_system() is None or not self.get_build_scripts():
+            return None
+        return self._render_environment(build_args)
+
+    def _image_spec(self, repository, dockerfile, build_args, files=()):
+        key = hashlib.sha256()
+        for part in (
+            dockerfile,
+            build_args.get("NB_USER", ""),
+            str(build_args.get("NB_UID", DEFAULT_NB_UID)),
+            self.platform,
+        ):
+            key.update(part.encode("utf-8") + b"\0")
+        for name, path in files:
+            key.update(name.encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                key.update(hashlib.sha256(f.read()).digest())
+        return f"{repository}:{key.hexdigest()[:16]}"
+
+    def system_image_spec(self, repository, build_args):
+        """
+        Return the name of the system image in repository
+
+        The tag is a hash of everything the image depends on, so the image
+        only has to be built once for every combination of them.
+        """
+        return self._image_spec(repository, self.render_system(), build_args)
+
+    def environment_image_spec(self, repository, build_args):
+        """
+        Return the name of the environment image in repository
+
+        Like the system image, the tag is a hash of everything the image
+        depends on, including the names in the build context and contents
+        of the build script files like the conda lockfiles.
+        """
+        files = [
+            self.generate_build_context_filename(src)
+            for src in sorted(self.get_build_script_files())
+        ]
+        return self._image_spec(
+            repository, self.render_environment(build_args), build_args, files
+        )
+
+    def _build_image(
+        self, client, tarf, image_spec, build_args, extra_build_kwargs, platform
+    ):
+        build_kwargs = dict(
+            fileobj=tarf,
+            tag=image_spec,
+            custom_context=True,
+            buildargs=build_args,
+            platform=platform,
+        )
+        build_kwargs.update(extra_build_kwargs)
+        try:
+            yield from client.build(**build_kwargs)
+        finally:
+            tarf.close()
+
+    def build_system_image(
+        self, client, image_spec, build_args, extra_build_kwargs, platform=None
+    ):
+        """Build the system image, see render_system"""
+        dockerfile = self.render_system().encode("utf-8")
+        tarf = self._build_context(
+            dockerfile, build_args, script_files=False, repo=False
+        )
+        yield from self._build_image(
+            client, tarf, image_spec, build_args, extra_build_kwargs, platform
+        )
+
+    def build_environment_image(
+        self, client, image_spec, build_args, extra_build_kwargs, platform=None
+    ):
+        """Build the environment image, see render_environment"""
+        dockerfile = self.render_environment(build_args).encode("utf-8")
+        tarf = self._build_context(dockerfile, build_args, repo=False)
+        yield from self._build_image(
+            client, tarf, image_spec, build_args, extra_build_kwargs, platform
+        )
+
+    def _cache_mount(self, script, target, user="root", sharing="shared"):
+        """
+        Run script with a BuildKit cache mounted at target
+
+        Returns script unchanged unless cache_mounts is set, otherwise with
+        the `--mount` option for its `RUN` instruction in front of it. The
+        cache is owned by user, "root" or "${NB_USER}".
+        """
+        if not self.cache_mounts:
+            return script
+        uid = "0" if user == "root" else "${NB_UID}"
+        mount = (
+            f"--mount=type=cache,id=repo2docker-{os.path.basename(target)}-{uid},"
+            f"target={target},uid={uid},gid={uid},sharing={sharing}"
         )
+        script = textwrap.dedent(script.strip("\n"))
+        return f"{mount} \\\n" + textwrap.indent(script, "    ")
+
+    def _pip_cache_option(self):
+        """The option of `pip install` for its cache of downloads and wheels"""
+        if self.cache_mounts:
+            return f"--cache-dir={PIP_CACHE_DIR}"
+        return "--no-cache-dir"
+
+    def _apt_install(self, apt="apt-get"):
+        """The `apt-get install` command, keeping downloads in the cache mount"""
+        if self.cache_mounts:
+            return f"{apt} -o Dir::Cache::Archives={APT_CACHE_DIR} install"
+        return f"{apt} install"
 
     @staticmethod
     def generate_build_context_filename(src_path, hash_length=6):
@@ -566,43 +798,52 @@ class BuildPack:
         In case the src_path is relative, it's assumed it's relative to directory of
         this __file__. Returns the resulting filename and an absolute path to the source
         file on host.
+
+        The filename is made of the path relative to this directory, or the
+        name of a file outside of it, and a hash of the file's contents. It
+        doesn't depend on where repo2docker is installed, so neither do the
+        Dockerfiles that copy the file.
         """
+        here = os.path.dirname(__file__)
         if not os.path.isabs(src_path):
             src_parts = src_path.split("/")
-            src_path = os.path.join(os.path.dirname(__file__), *src_parts)
+            src_path = os.path.join(here, *src_parts)
 
-        src_path_hash = hashlib.sha256(src_path.encode("utf-8")).hexdigest()
+        name = os.path.relpath(src_path, here)
+        if name.split(os.sep)[0] == os.pardir:
+            name = os.path.basename(src_path)
+        with open(src_path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
         safe_chars = set(string.ascii_letters + string.digits)
 
         def escape(s):
             return escapism.escape(s, safe=safe_chars, escape_char="-")
 
-        src_path_slug = escape(src_path)
+        name_slug = escape(name.replace(os.sep, "/"))
         filename = "build_script_files/{name}-{hash}"
         return (
             filename.format(
-                name=src_path_slug[: 255 - hash_length - 20],
-                hash=src_path_hash[:hash_length],
+                name=name_slug[: 255 - hash_length - 20],
+                hash=content_hash[:hash_length],
             ).lower(),
             src_path,
         )
 
-    def build(
-        self,
-        client,
-        image_spec,
-        memory_limit,
-        build_args,
-        cache_from,
-        extra_build_kwargs,
-        platform=None,
-    ):
-        tarf = io.BytesIO()
+    def _build_context(self, dockerfile, build_args, script_files=True, repo=True):
+        """Return a file with the build context as a tar archive
+
+        The build script files and the repository are only added if
+        `script_files` and `repo` are true.
+        """
+        # The build context is spooled to disk once it grows beyond
+        # build_context_memory_limit, so memory use stays flat no matter
+        # how large the repository is. A limit of 0 keeps it in memory.
+        tarf = tempfile.SpooledTemporaryFile(
+            max_size=self.build_context_memory_limit or 0
+        )
         tar = tarfile.open(fileobj=tarf, mode="w")
         dockerfile_tarinfo = tarfile.TarInfo("Dockerfile")
-        dockerfile = self.render(build_args).encode("utf-8")
         dockerfile_tarinfo.size = len(dockerfile)
-
         tar.addfile(dockerfile_tarinfo, io.BytesIO(dockerfile))
 
         def _filter_tar(tarinfo):
@@ -616,35 +857,31 @@ class BuildPack:
             tarinfo.gid = int(build_args.get("NB_UID", DEFAULT_NB_UID))
             return tarinfo
 
-        for src in sorted(self.get_build_script_files()):
-            dest_path, src_path = self.generate_build_context_filename(src)
-            tar.add(src_path, dest_path, filter=_filter_tar)
+        if script_files:
+            for src in sorted(self.get_build_script_files()):
+                dest_path, src_path = self.generate_build_context_filename(src)
+                tar.add(src_path, dest_path, filter=_filter_tar)
+
+        if not repo:
+            tar.close()
+            tarf.seek(0)
+            return tarf
 
         for fname in ("repo2docker-entrypoint", "python3-login"):
             tar.add(os.path.join(HERE, fname), fname, filter=_filter_tar)
 
-        exclude = []
-
-        for ignore_file_name in [".dockerignore", ".containerignore"]:
-            ignore_file_name = self.binder_path(ignore_file_name)
-            if os.path.exists(ignore_file_name):
-                with open(ignore_file_name) as ignore_file:
-                    cleaned_lines = [
-                        line.strip() for line in ignore_file.read().splitlines()
-                    ]
-                    exclude.extend(
-                        [
-                            line
-                            for line in cleaned_lines
-                            if line != "" and line[0] != "#"
-                        ]
-                    )
-
-        files_to_add = exclude_paths(".", exclude)
+        exclude = self.repo_index.ignore_patterns(self.binder_dir)
+
+        files_to_add = self.repo_index.exclude_paths(exclude)
 
         if files_to_add:
             for item in files_to_add:
-                tar.add(item, f"src/{item}", recursive=False, filter=_filter_tar)
+                tar.add(
+                    self.repo_index.full_path(item),
+                    f"src/{item}",
+                    recursive=False,
+                    filter=_filter_tar,
+                )
         else:
             # Either the source was empty or everything was filtered out.
             # In any case, create an src dir so the build can proceed.
@@ -654,6 +891,25 @@ class BuildPack:
 
         tar.close()
         tarf.seek(0)
+        return tarf
+
+    def build(
+        self,
+        client,
+        image_spec,
+        memory_limit,
+        build_args,
+        cache_from,
+        extra_build_kwargs,
+        platform=None,
+    ):
+        dockerfile = self.render(build_args).encode("utf-8")
+
+        with self.timings.timed(R2dState.BUILDING, "build context"):
+            tarf = self._build_context(dockerfile, build_args)
+        tarf.seek(0, os.SEEK_END)
+        self.build_context_bytes = tarf.tell()
+        tarf.seek(0)
 
         # If you work on this bit of code check the corresponding code in
         # buildpacks/docker.py where it is duplicated
@@ -682,7 +938,10 @@ class BuildPack:
 
         build_kwargs.update(extra_build_kwargs)
 
-        yield from client.build(**build_kwargs)
+        try:
+            yield from client.build(**build_kwargs)
+        finally:
+            tarf.close()
 
 
 class BaseImage(BuildPack):
@@ -705,7 +964,7 @@ class BaseImage(BuildPack):
     def get_preassemble_scripts(self):
         scripts = []
         try:
-            with open(self.binder_path("apt.txt")) as f:
+            with open(self.repo_index.full_path(self.binder_path("apt.txt"))) as f:
                 extra_apt_packages = []
                 for l in f:
                     package = l.partition("#")[0].strip()
@@ -720,18 +979,16 @@ class BaseImage(BuildPack):
                         )
                     extra_apt_packages.append(package)
 
-            scripts.append(
-                (
-                    "root",
-                    # This apt-get install is *not* quiet, since users explicitly asked for this
-                    r"""
+            # This apt-get install is *not* quiet, since users explicitly asked for this
+            script = r"""
                 apt-get -qq update && \
-                apt-get install --yes --no-install-recommends {} && \
+                {} --yes --no-install-recommends {} && \
                 apt-get -qq purge && \
                 apt-get -qq clean && \
                 rm -rf /var/lib/apt/lists/*
-                """.format(" ".join(sorted(extra_apt_packages))),
-                )
+                """.format(self._apt_install(), " ".join(sorted(extra_apt_packages)))
+            scripts.append(
+                ("root", self._cache_mount(script, APT_CACHE_DIR, sharing="locked"))
             )
 
         except FileNotFoundError:
@@ -747,14 +1004,14 @@ class BaseImage(BuildPack):
     @lru_cache
     def get_post_build_scripts(self):
         post_build = self.binder_path("postBuild")
-        if os.path.exists(post_build):
+        if self.repo_index.exists(post_build):
             return [post_build]
         return []
 
     @lru_cache
     def get_start_script(self):
         start = self.binder_path("start")
-        if os.path.exists(start):
+        if self.repo_index.exists(start):
             # Return an absolute path to start
             # This is important when built container images start with
             # a working directory that is different from ${REPO_DIR}
@@ -783,7 +1040,7 @@ class BaseImage(BuildPack):
 
         runtime_path = self.binder_path("runtime.txt")
         try:
-            with open(runtime_path) as f:
+            with open(self.repo_index.full_path(runtime_path)) as f:
                 runtime_txt = f.read().strip()
         except FileNotFoundError:
             return self._runtime
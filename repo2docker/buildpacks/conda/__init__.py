@@ -10,7 +10,7 @@ from ruamel.yaml import YAML
 from ...semver import parse_version as V
 from ...utils import is_local_pip_requirement
 from .._r_base import rstudio_base_scripts
-from ..base import BaseImage
+from ..base import CONDA_PKGS_DIR, BaseImage
 
 # pattern for parsing conda dependency line
 PYTHON_REGEX = re.compile(r"python\s*=+\s*([\d\.]*)")
@@ -238,7 +238,7 @@ class CondaBuildPack(BaseImage):
 
         for filename in ["environment.yml", "environment.yaml"]:
             environment_yaml_path = self.binder_path(filename)
-            if os.path.exists(environment_yaml_path):
+            if self.repo_index.exists(environment_yaml_path):
                 self._environment_yaml_path = environment_yaml_path
                 break
 
@@ -257,7 +257,7 @@ class CondaBuildPack(BaseImage):
             self._environment_yaml = {}
             return self._environment_yaml
 
-        with open(self.environment_yaml_path) as f:
+        with open(self.repo_index.full_path(self.environment_yaml_path)) as f:
             env = YAML().load(f)
             # check if the env file is empty, if so instantiate an empty dictionary.
             if env is None:
@@ -414,19 +414,26 @@ class CondaBuildPack(BaseImage):
             else "${NB_PYTHON_PREFIX}"
         )
 
+        # `clean --all -f` removes all package directories, so packages are
+        # only kept in the cache mount when it's only set for the install
+        mamba_install = "${MAMBA_EXE}"
+        if self.cache_mounts:
+            mamba_install = f"CONDA_PKGS_DIRS={CONDA_PKGS_DIR} {mamba_install}"
+
         if self.environment_yaml_path:
             # TODO: when using micromamba, we call $MAMBA_EXE install -p ...
             # whereas mamba/conda need `env update -p ...` when it's an env.yaml file
-            scripts.append(
-                (
-                    "${NB_USER}",
-                    rf"""
+            script = rf"""
                 TIMEFORMAT='time: %3R' \
-                bash -c 'time ${{MAMBA_EXE}} env update -p {env_prefix} --file "{self.environment_yaml_path}" && \
+                bash -c 'time {mamba_install} env update -p {env_prefix} --file "{self.environment_yaml_path}" && \
                 time ${{MAMBA_EXE}} clean --all -f -y && \
                 ${{MAMBA_EXE}} list -p {env_prefix} \
                 '
-                """,
+                """
+            scripts.append(
+                (
+                    "${NB_USER}",
+                    self._cache_mount(script, CONDA_PKGS_DIR, "${NB_USER}"),
                 )
             )
 
@@ -435,14 +442,15 @@ class CondaBuildPack(BaseImage):
                 r_pin = "=" + self.r_version
             else:
                 r_pin = ""
+            script = rf"""
+                {mamba_install} install -p {env_prefix} r-base{r_pin} r-irkernel r-devtools -y && \
+                ${{MAMBA_EXE}} clean --all -f -y && \
+                ${{MAMBA_EXE}} list -p {env_prefix}
+                """
             scripts.append(
                 (
                     "${NB_USER}",
-                    rf"""
-                ${{MAMBA_EXE}} install -p {env_prefix} r-base{r_pin} r-irkernel r-devtools -y && \
-                ${{MAMBA_EXE}} clean --all -f -y && \
-                ${{MAMBA_EXE}} list -p {env_prefix}
-                """,
+                    self._cache_mount(script, CONDA_PKGS_DIR, "${NB_USER}"),
                 )
             )
             if self.platform != "linux/amd64":
@@ -12,14 +12,18 @@ class DockerBuildPack(BuildPack):
 
     def detect(self):
         """Check if current repo should be built with the Docker BuildPack"""
-        return os.path.exists(self.binder_path("Dockerfile"))
+        return self.repo_index.exists(self.binder_path("Dockerfile"))
 
     def render(self, build_args=None):
         """Render the Dockerfile using by reading it from the source repo"""
         Dockerfile = self.binder_path("Dockerfile")
-        with open(Dockerfile) as f:
+        with open(self.repo_index.full_path(Dockerfile)) as f:
             return f.read()
 
+    def render_system(self):
+        """The Dockerfile in the repository has no separate system layers"""
+        return None
+
     def build(
         self,
         client,
@@ -46,9 +50,10 @@ class DockerBuildPack(BuildPack):
             # we use no swap.
             limits = {"memory": memory_limit, "memswap": memory_limit}
 
+        path = os.path.abspath(self.repo_index.root)
         build_kwargs = dict(
-            path=os.getcwd(),
-            dockerfile=self.binder_path(self.dockerfile),
+            path=path,
+            dockerfile=os.path.join(path, self.binder_path(self.dockerfile)),
             tag=image_spec,
             buildargs=build_args,
             container_limits=limits,
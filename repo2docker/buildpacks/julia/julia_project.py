@@ -1,7 +1,6 @@
 """Generates a Dockerfile based on an input matrix for Julia"""
 
 import functools
-import os
 from functools import lru_cache
 
 import requests
@@ -41,10 +40,14 @@ class JuliaProjectTomlBuildPack(PythonBuildPack):
 
     @property
     def julia_version(self):
-        if os.path.exists(self.binder_path("JuliaProject.toml")):
-            project_toml = toml.load(self.binder_path("JuliaProject.toml"))
+        if self.repo_index.exists(self.binder_path("JuliaProject.toml")):
+            project_toml = toml.load(
+                self.repo_index.full_path(self.binder_path("JuliaProject.toml"))
+            )
         else:
-            project_toml = toml.load(self.binder_path("Project.toml"))
+            project_toml = toml.load(
+                self.repo_index.full_path(self.binder_path("Project.toml"))
+            )
 
         try:
             # For Project.toml files, install the latest julia version that
@@ -195,6 +198,6 @@ class JuliaProjectTomlBuildPack(PythonBuildPack):
         `JuliaProject.toml` exists.
 
         """
-        return os.path.exists(self.binder_path("Project.toml")) or os.path.exists(
-            self.binder_path("JuliaProject.toml")
-        )
+        return self.repo_index.exists(
+            self.binder_path("Project.toml")
+        ) or self.repo_index.exists(self.binder_path("JuliaProject.toml"))
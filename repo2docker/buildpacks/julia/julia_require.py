@@ -2,8 +2,6 @@
 DEPRECATED - Dependencies of REQUIRE have been removed
 """
 
-import os
-
 from ..python import PythonBuildPack
 
 
@@ -25,7 +23,7 @@ class JuliaRequireBuildPack(PythonBuildPack):
 
         This no longer works, but try to raise an informative error.
         """
-        return os.path.exists(self.binder_path("REQUIRE")) and not (
-            os.path.exists(self.binder_path("Project.toml"))
-            or os.path.exists(self.binder_path("JuliaProject.toml"))
+        return self.repo_index.exists(self.binder_path("REQUIRE")) and not (
+            self.repo_index.exists(self.binder_path("Project.toml"))
+            or self.repo_index.exists(self.binder_path("JuliaProject.toml"))
         )
@@ -17,14 +17,20 @@ class LegacyBinderDockerBuildPack:
     This buildpack has been deprecated.
     """
 
+    # the index of the repository, set by Repo2Docker
+    repo_index = None
+
     def __init__(self, *args, **kwargs):
         pass
 
     def detect(self):
         """Check if current repo should be built with the Legacy BuildPack."""
         log = logging.getLogger("repo2docker")
+        dockerfile = "Dockerfile"
+        if self.repo_index is not None:
+            dockerfile = self.repo_index.full_path(dockerfile)
         try:
-            with open("Dockerfile") as f:
+            with open(dockerfile) as f:
                 for line in f:
                     if line.startswith("FROM"):
                         if "andrewosh/binder-base" in line.split("#")[0].lower():
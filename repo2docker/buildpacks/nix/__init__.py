@@ -1,6 +1,5 @@
 """BuildPack for nixpkgs environments"""
 
-import os
 from functools import lru_cache
 
 from ..base import BaseImage
@@ -92,4 +91,4 @@ class NixBuildPack(BaseImage):
 
     def detect(self):
         """Check if current repo should be built with the nix BuildPack"""
-        return os.path.exists(self.binder_path("default.nix"))
+        return self.repo_index.exists(self.binder_path("default.nix"))
@@ -6,13 +6,13 @@ same as the Python or Conda build packs.
 """
 
 import json
-import os
 import re
 from functools import lru_cache
 
 import toml
 
 from ...semver import parse_version as V
+from ..base import PIP_CACHE_DIR
 from ..conda import CondaBuildPack
 
 VERSION_PAT = re.compile(r"\d+(\.\d+)*")
@@ -39,14 +39,14 @@ class PipfileBuildPack(CondaBuildPack):
 
         lockfile = self.binder_path("Pipfile.lock")
         requires_sources = []
-        if os.path.exists(lockfile):
-            with open(lockfile) as f:
+        if self.repo_index.exists(lockfile):
+            with open(self.repo_index.full_path(lockfile)) as f:
                 lock_info = json.load(f)
                 requires_sources.append(lock_info.get("_meta", {}).get("requires", {}))
 
         pipfile = self.binder_path("Pipfile")
-        if os.path.exists(pipfile):
-            with open(pipfile) as f:
+        if self.repo_index.exists(pipfile):
+            with open(self.repo_index.full_path(pipfile)) as f:
                 pipfile_info = toml.load(f)
             requires_sources.append(pipfile_info.get("requires", {}))
 
@@ -86,7 +86,7 @@ class PipfileBuildPack(CondaBuildPack):
         files = super().get_preassemble_script_files()
         for name in ("requirements3.txt", "Pipfile", "Pipfile.lock"):
             path = self.binder_path(name)
-            if os.path.exists(path):
+            if self.repo_index.exists(path):
                 files[path] = path
         return files
 
@@ -103,7 +103,11 @@ class PipfileBuildPack(CondaBuildPack):
         scripts.append(
             (
                 "${NB_USER}",
-                f"${{KERNEL_PYTHON_PREFIX}}/bin/pip install --no-cache-dir pipenv=={pipenv_version}",
+                self._cache_mount(
+                    f"${{KERNEL_PYTHON_PREFIX}}/bin/pip install {self._pip_cache_option()} pipenv=={pipenv_version}",
+                    PIP_CACHE_DIR,
+                    "${NB_USER}",
+                ),
             )
         )
         return scripts
@@ -127,11 +131,15 @@ class PipfileBuildPack(CondaBuildPack):
             # requirements3.txt allows for packages to be installed to the
             # notebook servers Python environment
             nb_requirements_file = self.binder_path("requirements3.txt")
-            if os.path.exists(nb_requirements_file):
+            if self.repo_index.exists(nb_requirements_file):
                 assemble_scripts.append(
                     (
                         "${NB_USER}",
-                        f'${{NB_PYTHON_PREFIX}}/bin/pip install --no-cache-dir -r "{nb_requirements_file}"',
+                        self._cache_mount(
+                            f'${{NB_PYTHON_PREFIX}}/bin/pip install {self._pip_cache_option()} -r "{nb_requirements_file}"',
+                            PIP_CACHE_DIR,
+                            "${NB_USER}",
+                        ),
                     )
                 )
 
@@ -175,7 +183,7 @@ class PipfileBuildPack(CondaBuildPack):
                     working_directory=working_directory,
                     install_option=(
                         "--ignore-pipfile"
-                        if os.path.exists(pipfile_lock)
+                        if self.repo_index.exists(pipfile_lock)
                         else "--skip-lock"
                     ),
                 ),
@@ -194,4 +202,4 @@ class PipfileBuildPack(CondaBuildPack):
         pipfile = self.binder_path("Pipfile")
         pipfile_lock = self.binder_path("Pipfile.lock")
 
-        return os.path.exists(pipfile) or os.path.exists(pipfile_lock)
+        return self.repo_index.exists(pipfile) or self.repo_index.exists(pipfile_lock)
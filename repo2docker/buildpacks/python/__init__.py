@@ -1,6 +1,5 @@
 """Generates Dockerfiles based on an input matrix based on Python."""
 
-import os
 from functools import lru_cache
 
 try:
@@ -12,6 +11,7 @@ from packaging.specifiers import SpecifierSet
 from packaging.version import Version
 
 from ...utils import is_local_pip_requirement, open_guess_encoding
+from ..base import PIP_CACHE_DIR
 from ..conda import CondaBuildPack
 from ..conda.supported_python_version import SUPPORTED_PYTHON_VERSION
 
@@ -52,8 +52,10 @@ class PythonBuildPack(CondaBuildPack):
         # pyproject.toml can be used by some tools for minimum version of Python
         # even if the Git repository is not a Python package.
         pyproject_toml = "pyproject.toml"
-        if not self.binder_dir and os.path.exists(pyproject_toml):
-            with open(pyproject_toml, "rb") as _pyproject_file:
+        if not self.binder_dir and self.repo_index.exists(pyproject_toml):
+            with open(
+                self.repo_index.full_path(pyproject_toml), "rb"
+            ) as _pyproject_file:
                 pyproject = tomllib.load(_pyproject_file)
 
             if "project" in pyproject and "requires-python" in pyproject["project"]:
@@ -103,23 +105,31 @@ class PythonBuildPack(CondaBuildPack):
             # using legacy Python kernel
             # requirements3.txt allows installation in the notebook server env
             nb_requirements_file = self.binder_path("requirements3.txt")
-            if os.path.exists(nb_requirements_file):
+            if self.repo_index.exists(nb_requirements_file):
                 scripts.append(
                     (
                         "${NB_USER}",
                         # want the $NB_PYHTON_PREFIX environment variable, not for
                         # Python's string formatting to try and replace this
-                        f'${{NB_PYTHON_PREFIX}}/bin/pip install --no-cache-dir -r "{nb_requirements_file}"',
+                        self._cache_mount(
+                            f'${{NB_PYTHON_PREFIX}}/bin/pip install {self._pip_cache_option()} -r "{nb_requirements_file}"',
+                            PIP_CACHE_DIR,
+                            "${NB_USER}",
+                        ),
                     )
                 )
 
         # install requirements.txt in the kernel env
         requirements_file = self.binder_path("requirements.txt")
-        if os.path.exists(requirements_file):
+        if self.repo_index.exists(requirements_file):
             scripts.append(
                 (
                     "${NB_USER}",
-                    f'{pip} install --no-cache-dir -r "{requirements_file}"',
+                    self._cache_mount(
+                        f'{pip} install {self._pip_cache_option()} -r "{requirements_file}"',
+                        PIP_CACHE_DIR,
+                        "${NB_USER}",
+                    ),
                 )
             )
         return scripts
@@ -137,9 +147,9 @@ class PythonBuildPack(CondaBuildPack):
 
         for name in ("requirements.txt", "requirements3.txt"):
             requirements_txt = self.binder_path(name)
-            if not os.path.exists(requirements_txt):
+            if not self.repo_index.exists(requirements_txt):
                 continue
-            with open_guess_encoding(requirements_txt) as f:
+            with open_guess_encoding(self.repo_index.full_path(requirements_txt)) as f:
                 for line in f:
                     if is_local_pip_requirement(line):
                         return False
@@ -152,10 +162,12 @@ class PythonBuildPack(CondaBuildPack):
     def _is_python_package(self):
         if self.binder_dir:
             return False
-        if os.path.exists("setup.py"):
+        if self.repo_index.exists("setup.py"):
             return True
-        if os.path.exists("pyproject.toml"):
-            with open("pyproject.toml", "rb") as _pyproject_file:
+        if self.repo_index.exists("pyproject.toml"):
+            with open(
+                self.repo_index.full_path("pyproject.toml"), "rb"
+            ) as _pyproject_file:
                 pyproject = tomllib.load(_pyproject_file)
 
             if ("project" in pyproject) and ("build-system" in pyproject):
@@ -167,7 +179,7 @@ class PythonBuildPack(CondaBuildPack):
         assemble_files = super().get_preassemble_script_files()
         for name in ("requirements.txt", "requirements3.txt"):
             requirements_txt = self.binder_path(name)
-            if os.path.exists(requirements_txt):
+            if self.repo_index.exists(requirements_txt):
                 assemble_files[requirements_txt] = requirements_txt
         return assemble_files
 
@@ -194,7 +206,16 @@ class PythonBuildPack(CondaBuildPack):
             assemble_scripts.extend(self._get_pip_scripts())
 
         if self._is_python_package():
-            assemble_scripts.append(("${NB_USER}", f"{pip} install --no-cache-dir ."))
+            assemble_scripts.append(
+                (
+                    "${NB_USER}",
+                    self._cache_mount(
+                        f"{pip} install {self._pip_cache_option()} .",
+                        PIP_CACHE_DIR,
+                        "${NB_USER}",
+                    ),
+                )
+            )
 
         return assemble_scripts
 
@@ -209,4 +230,4 @@ class PythonBuildPack(CondaBuildPack):
         if self._is_python_package():
             return True
 
-        return os.path.exists(requirements_txt)
+        return self.repo_index.exists(requirements_txt)
@@ -1,5 +1,4 @@
 import datetime
-import os
 import re
 import warnings
 from functools import lru_cache
@@ -8,6 +7,7 @@ import requests
 
 from ..semver import parse_version as V
 from ._r_base import rstudio_base_scripts
+from .base import APT_CACHE_DIR
 from .python import PythonBuildPack
 
 # Aproximately the first snapshot on RSPM (Posit package manager)
@@ -139,7 +139,7 @@ class RBuildPack(PythonBuildPack):
             return True
 
         description_R = "DESCRIPTION"
-        if not self.binder_dir and os.path.exists(description_R):
+        if not self.binder_dir and self.repo_index.exists(description_R):
             # no R snapshot date set through runtime.txt
             # Set it to two days ago from today
             self._checkpoint_date = datetime.date.today() - datetime.timedelta(days=2)
@@ -281,17 +281,14 @@ class RBuildPack(PythonBuildPack):
             raise RuntimeError(
                 f"RStudio is only available for linux/amd64 ({self.platform})"
             )
-        scripts = [
-            (
-                "root",
-                rf"""
+        script = rf"""
                 apt-get update > /dev/null && \
-                apt-get install --yes --no-install-recommends \
+                {self._apt_install()} --yes --no-install-recommends \
                         libclang-dev \
                         libzmq3-dev > /dev/null && \
                 wget --quiet -O /tmp/r-{self.r_version}.deb \
                     https://cdn.rstudio.com/r/ubuntu-$(. /etc/os-release && echo $VERSION_ID | sed 's/\.//')/pkgs/r-{self.r_version}_1_amd64.deb && \
-                apt install --yes --no-install-recommends /tmp/r-{self.r_version}.deb > /dev/null && \
+                {self._apt_install("apt")} --yes --no-install-recommends /tmp/r-{self.r_version}.deb > /dev/null && \
                 rm /tmp/r-{self.r_version}.deb && \
                 apt-get -qq purge && \
                 apt-get -qq clean && \
@@ -299,8 +296,9 @@ class RBuildPack(PythonBuildPack):
                 ln -s /opt/R/{self.r_version}/bin/R /usr/local/bin/R && \
                 ln -s /opt/R/{self.r_version}/bin/Rscript /usr/local/bin/Rscript && \
                 R --version
-                """,
-            ),
+                """
+        scripts = [
+            ("root", self._cache_mount(script, APT_CACHE_DIR, sharing="locked")),
         ]
 
         scripts += rstudio_base_scripts(self.r_version)
@@ -364,7 +362,7 @@ class RBuildPack(PythonBuildPack):
     def get_preassemble_script_files(self):
         files = super().get_preassemble_script_files()
         installR_path = self.binder_path("install.R")
-        if os.path.exists(installR_path):
+        if self.repo_index.exists(installR_path):
             files[installR_path] = installR_path
 
         return files
@@ -383,7 +381,7 @@ class RBuildPack(PythonBuildPack):
         scripts = []
 
         installR_path = self.binder_path("install.R")
-        if os.path.exists(installR_path):
+        if self.repo_index.exists(installR_path):
             scripts += [
                 (
                     "${NB_USER}",
@@ -401,7 +399,7 @@ class RBuildPack(PythonBuildPack):
         assemble_scripts = super().get_assemble_scripts()
 
         installR_path = self.binder_path("install.R")
-        if os.path.exists(installR_path):
+        if self.repo_index.exists(installR_path):
             assemble_scripts += [
                 (
                     "${NB_USER}",
@@ -412,7 +410,7 @@ class RBuildPack(PythonBuildPack):
             ]
 
         description_R = "DESCRIPTION"
-        if not self.binder_dir and os.path.exists(description_R):
+        if not self.binder_dir and self.repo_index.exists(description_R):
             assemble_scripts += [
                 (
                     "${NB_USER}",
@@ -5,9 +5,13 @@ ContentProviders accept a `spec` of various kinds, and
 provide the contents from the spec to a given output directory.
 """
 
+import hashlib
 import logging
 import os
 
+from ..repoindex import RepoIndex, StatCache
+from ..utils import get_cache_dir
+
 
 class ContentProviderException(Exception):
     """Exception raised when a ContentProvider can not provide content."""
@@ -16,6 +20,11 @@ class ContentProviderException(Exception):
 
 
 class ContentProvider:
+    # True if the content for a content_id never changes, and content_id is
+    # known after `detect`. The fetched content can then be kept in a
+    # ContentStore and reused.
+    immutable = False
+
     def __init__(self):
         self.log = logging.getLogger("repo2docker")
 
@@ -63,6 +72,12 @@ class ContentProvider:
 
 
 class Local(ContentProvider):
+    # Subdirectory of the repository that will be built. Only files in it
+    # are part of the build context and so of the content_id.
+    subdir = ""
+
+    _content_id = None
+
     def detect(self, source, ref=None, extra_args=None):
         if os.path.isdir(source):
             return {"path": source}
@@ -72,3 +87,46 @@ class Local(ContentProvider):
         msg = f'Local content provider assumes {spec["path"]} == {output_dir}'
         assert output_dir == spec["path"], msg
         yield f'Using local repo {spec["path"]}.\n'
+
+        try:
+            self._content_id = self._hash_build_context(
+                os.path.join(spec["path"], self.subdir)
+            )
+        except (OSError, RuntimeError) as e:
+            # without a content_id a fresh image is built, same as before
+            self.log.warning(f"Could not compute content id of local repo: {e}\n")
+
+    def _hash_build_context(self, path):
+        """Hash the files from path that will end up in the build context
+
+        Respects the .dockerignore and .containerignore files, found the
+        same way as by the buildpacks. Like the rest of the build context
+        that includes the .git directory, unless it is ignored. Digests of
+        individual files are cached on disk so that an unchanged file is
+        not read again the next time the same directory is built.
+        """
+        path = os.path.abspath(path)
+        repo_index = RepoIndex(path)
+        paths = repo_index.exclude_paths(
+            repo_index.ignore_patterns(repo_index.binder_dir())
+        )
+
+        path_hash = hashlib.sha256(path.encode()).hexdigest()
+        stat_cache = StatCache(get_cache_dir("local", f"{path_hash[:16]}.json"))
+        digest = repo_index.content_digest(paths, stat_cache)
+        try:
+            stat_cache.save()
+        except OSError as e:
+            self.log.debug(f"Could not save stat cache {stat_cache.path}: {e}\n")
+        return digest
+
+    @property
+    def content_id(self):
+        """A hash of the files that are part of the build context.
+
+        Local directories have no revision, so the files that will be copied
+        into the image are hashed instead. Computed by `fetch`.
+        """
+        if self._content_id is None:
+            return None
+        return self._content_id[:12]
@@ -1,11 +1,12 @@
+import json
 import os
-import shutil
+import time
 from typing import List, Tuple
 from urllib.parse import parse_qs, urlparse
 
 import requests
 
-from ..utils import copytree, deep_get, is_doi
+from ..utils import deep_get, flatten_dir, get_cache_dir, is_doi
 from .doi import DoiProvider
 
 
@@ -15,7 +16,9 @@ class Dataverse(DoiProvider):
 
     Dataverse installations are downloaded from
     https://iqss.github.io/dataverse-installations/data/data.json
-    or $R2D_DATAVERSE_INSTALLATIONS_URL if specified.
+    or $R2D_DATAVERSE_INSTALLATIONS_URL if specified. The list is cached in
+    ~/.cache/repo2docker for `installations_ttl` seconds and revalidated
+    with its ETag afterwards.
     """
 
     dataverse_installations_url = (
@@ -23,17 +26,86 @@ class Dataverse(DoiProvider):
         or "https://iqss.github.io/dataverse-installations/data/data.json"
     )
 
+    installations_ttl = 24 * 60 * 60
+
     hosts = None
+    # hosts indexed by their hostname
+    hosts_by_name = None
+    # when hosts were loaded, they are reloaded after installations_ttl
+    hosts_loaded = None
+
+    def _installations_cache_path(self):
+        return get_cache_dir("dataverse-installations.json")
+
+    def _read_installations_cache(self):
+        try:
+            with open(self._installations_cache_path()) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cache.get("url") != self.dataverse_installations_url:
+            return None
+        return cache
+
+    def _write_installations_cache(self, cache):
+        path = self._installations_cache_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.log.debug(f"Could not cache dataverse installations: {e}\n")
+
+    def _fetch_installations(self):
+        cache = self._read_installations_cache()
+        if (
+            cache is not None
+            and time.time() - cache["fetched"] < self.installations_ttl
+        ):
+            return cache["installations"]
+
+        self.log.debug(
+            "Retrieving dataverse installations from %s\n",
+            self.dataverse_installations_url,
+        )
+        headers = {}
+        if cache is not None and cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        try:
+            r = self._request(self.dataverse_installations_url, headers=headers)
+            r.raise_for_status()
+        except requests.RequestException:
+            if cache is None:
+                raise
+            self.log.warning(
+                "Could not retrieve dataverse installations, using cached list\n"
+            )
+            return cache["installations"]
+
+        if r.status_code != 304:
+            cache = {
+                "url": self.dataverse_installations_url,
+                "etag": r.headers.get("ETag"),
+                "installations": r.json()["installations"],
+            }
+        cache["fetched"] = time.time()
+        self._write_installations_cache(cache)
+        return cache["installations"]
 
     def load_hosts(self):
-        if self.hosts is None:
-            self.log.debug(
-                "Retrieving dataverse installations from %s\n",
-                self.dataverse_installations_url,
-            )
-            r = requests.get(self.dataverse_installations_url)
-            r.raise_for_status()
-            self.hosts = r.json()["installations"]
+        if (
+            self.hosts is None
+            or time.time() - self.hosts_loaded >= self.installations_ttl
+        ):
+            # shared by all instances, a long running process reloads the
+            # list as often as it is revalidated on disk
+            cls = type(self)
+            hosts = self._fetch_installations()
+            cls.hosts_by_name = {host["hostname"]: host for host in hosts}
+            cls.hosts = hosts
+            cls.hosts_loaded = time.time()
 
     def detect(self, spec, ref=None, extra_args=None):
         """
@@ -55,14 +127,13 @@ class Dataverse(DoiProvider):
             url = spec
         # Parse the url, to get the base for later API calls
         parsed_url = urlparse(url)
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.netloc:
+            # local paths and the like, no need to look at the installations
+            return
 
         # Check if the url matches any known Dataverse installation, bail if not.
         self.load_hosts()
-        host = next(
-            (host for host in self.hosts if host["hostname"] == parsed_url.netloc),
-            None,
-        )
-        if host is None:
+        if parsed_url.netloc not in self.hosts_by_name:
             return
 
         # At this point, we *know* this is a dataverse URL, because:
@@ -192,6 +263,7 @@ class Dataverse(DoiProvider):
 
         yield f"Fetching Dataverse record {url}.\n"
 
+        file_refs = []
         for fobj in self.get_datafiles(url):
             file_url = (
                 # without format=original you get the preservation format (plain text, tab separated)
@@ -205,18 +277,16 @@ class Dataverse(DoiProvider):
 
             filename_with_path = os.path.join(fobj.get("directoryLabel", ""), filename)
 
-            file_ref = {"download": file_url, "filename": filename_with_path}
-            fetch_map = {key: key for key in file_ref.keys()}
+            file_refs.append({"download": file_url, "filename": filename_with_path})
 
-            yield from self.fetch_file(file_ref, fetch_map, output_dir)
+        fetch_map = {"download": "download", "filename": "filename"}
+        yield from self.fetch_files(file_refs, fetch_map, output_dir)
 
         new_subdirs = os.listdir(output_dir)
         # if there is only one new subdirectory move its contents
         # to the top level directory
         if len(new_subdirs) == 1 and os.path.isdir(new_subdirs[0]):
-            d = new_subdirs[0]
-            copytree(os.path.join(output_dir, d), output_dir)
-            shutil.rmtree(os.path.join(output_dir, d))
+            flatten_dir(output_dir, new_subdirs[0])
 
     @property
     def content_id(self):
@@ -2,19 +2,130 @@ import json
 import logging
 import os
 import shutil
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from os import makedirs, path
+from urllib.parse import urlparse
 from zipfile import ZipFile, is_zipfile
 
 from requests import HTTPError, Session
+from requests.adapters import HTTPAdapter
 
 from .. import __version__
-from ..utils import copytree, deep_get, is_doi, normalize_doi
+from ..utils import deep_get, flatten_dir, get_cache_dir, is_doi, normalize_doi
 from .base import ContentProvider
 
 
+class DoiCache:
+    """
+    A cache of DOI resolutions shared by all DOI based content providers.
+
+    Every DOI provider resolves the DOI it is given while detecting whether it
+    can handle it, the cache makes sure the DOI is only resolved once per
+    process.
+
+    If `ttl` (in seconds) is non-zero resolutions are also stored in a JSON
+    file at `path` and reused by later processes for `ttl` seconds. Lookups
+    can pass their own `ttl`, e.g. from the configuration of the build they
+    are part of, instead of changing the cache shared by all builds.
+
+    DOIs that don't resolve to a URL are only remembered in memory for
+    `failure_ttl` seconds, a DOI that was just minted resolves soon after.
+    """
+
+    failure_ttl = 60
+
+    def __init__(self, path=None, ttl=0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        entries = {}
+        if self.path:
+            try:
+                with open(self.path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return entries
+
+    def get(self, doi, ttl=None):
+        """Return `(True, url)` if the resolution of doi is known
+
+        `url` is None for DOIs that don't resolve to a URL. Resolutions from
+        disk older than `ttl`, which defaults to the cache's, are ignored.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(doi)
+        if entry is None:
+            return False, None
+        url, timestamp = entry
+        if url is None:
+            ttl = self.failure_ttl
+        if timestamp is not None and time.time() - timestamp > ttl:
+            return False, None
+        return True, url
+
+    def set(self, doi, url, ttl=None):
+        """Remember the resolution of doi, on disk if `ttl` is non-zero"""
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            if url is None:
+                self._entries[doi] = [None, time.time()]
+                return
+            if not (ttl and self.path):
+                self._entries[doi] = [url, None]
+                return
+            # another process might have updated the file in the meantime
+            entries = self._load()
+            now = time.time()
+            entries = {
+                key: entry
+                for key, entry in entries.items()
+                if entry[0] is not None and now - entry[1] <= ttl
+            }
+            entries[doi] = [url, now]
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+            # keep the failures, and resolutions of lookups without a ttl,
+            # that are only in memory
+            for key, entry in self._entries.items():
+                if entry[0] is None or entry[1] is None:
+                    entries.setdefault(key, entry)
+            self._entries = entries
+
+
 class DoiProvider(ContentProvider):
     """Provide contents of a repository identified by a DOI and some helper functions."""
 
+    # maximum number of files fetch_files downloads at the same time, in total
+    # and from a single host
+    max_downloads = 8
+    max_downloads_per_host = 4
+
+    # DOI resolutions, shared by all instances
+    doi_cache = DoiCache(get_cache_dir("doi.json"))
+    # seconds to keep resolutions on disk, set from Repo2Docker.doi_cache_ttl.
+    # None uses the ttl of doi_cache.
+    doi_cache_ttl = None
+
     def __init__(self):
         super().__init__()
         self.session = Session()
@@ -23,6 +134,10 @@ class DoiProvider(ContentProvider):
                 "user-agent": f"repo2docker {__version__}",
             }
         )
+        # keep a connection open for every concurrent download
+        adapter = HTTPAdapter(pool_maxsize=self.max_downloads)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def _request(self, url, **kwargs):
         return self.session.get(url, **kwargs)
@@ -35,30 +150,38 @@ class DoiProvider(ContentProvider):
         if is_doi(doi):
             normalized_doi = normalize_doi(doi)
 
-            # Use the doi.org resolver API
-            # documented at https://www.doi.org/the-identifier/resources/factsheets/doi-resolution-documentation#5-proxy-server-rest-api
-            req_url = f"https://doi.org/api/handles/{normalized_doi}"
-            resp = self._request(req_url)
-            if resp.status_code == 404:
-                # Not a doi, return what we were passed in
-                return doi
-            elif resp.status_code == 200:
-                data = resp.json()
-                # Pick the first URL we find from the doi response
-                for v in data["values"]:
-                    if v["type"] == "URL":
-                        return v["data"]["value"]
-
-                # No URLs found for this doi, what do we do?
-                self.log.error("DOI {normalized_doi} doesn't point to any URLs")
-                return doi
-            else:
-                # If we get any other status codes, raise error
-                raise
+            cached, url = self.doi_cache.get(normalized_doi, self.doi_cache_ttl)
+            if not cached:
+                url = self._resolve_doi(normalized_doi)
+                self.doi_cache.set(normalized_doi, url, self.doi_cache_ttl)
+            # Not a doi, return what we were passed in
+            return doi if url is None else url
         else:
             # Just return what is actulally just a URL
             return doi
 
+    def _resolve_doi(self, normalized_doi):
+        """Return the URL a DOI points to or None"""
+        # Use the doi.org resolver API
+        # documented at https://www.doi.org/the-identifier/resources/factsheets/doi-resolution-documentation#5-proxy-server-rest-api
+        req_url = f"https://doi.org/api/handles/{normalized_doi}"
+        resp = self._request(req_url)
+        if resp.status_code == 404:
+            return None
+        elif resp.status_code == 200:
+            data = resp.json()
+            # Pick the first URL we find from the doi response
+            for v in data["values"]:
+                if v["type"] == "URL":
+                    return v["data"]["value"]
+
+            # No URLs found for this doi, what do we do?
+            self.log.error("DOI {normalized_doi} doesn't point to any URLs")
+            return None
+        else:
+            # If we get any other status codes, raise error
+            raise
+
     def fetch_file(self, file_ref, host, output_dir, unzip=False):
         # the assumption is that `unzip=True` means that this is the only
         # file related to a record
@@ -98,9 +221,46 @@ class DoiProvider(ContentProvider):
             new_subdirs = os.listdir(output_dir)
             # if there is only one new subdirectory move its contents
             # to the top level directory
-            if len(new_subdirs) == 1:
-                d = new_subdirs[0]
-                copytree(path.join(output_dir, d), output_dir)
-                shutil.rmtree(path.join(output_dir, d))
+            if len(new_subdirs) == 1 and path.isdir(
+                path.join(output_dir, new_subdirs[0])
+            ):
+                flatten_dir(output_dir, new_subdirs[0])
 
             yield f"Fetched files: {os.listdir(output_dir)}\n"
+
+    def fetch_files(self, file_refs, host, output_dir):
+        """Fetch several files concurrently
+
+        Files are downloaded by a pool of threads sharing this provider's
+        session, at most `max_downloads_per_host` of them from the same host.
+        The log messages of each file are yielded together, in the order of
+        `file_refs`.
+        """
+        file_refs = list(file_refs)
+        if len(file_refs) <= 1 or self.max_downloads <= 1:
+            for file_ref in file_refs:
+                yield from self.fetch_file(file_ref, host, output_dir)
+            return
+
+        host_limits = defaultdict(
+            lambda: threading.BoundedSemaphore(self.max_downloads_per_host)
+        )
+        for file_ref in file_refs:
+            # create all semaphores up front, defaultdict isn't thread safe
+            host_limits[urlparse(deep_get(file_ref, host["download"])).netloc]
+
+        def download(file_ref):
+            netloc = urlparse(deep_get(file_ref, host["download"])).netloc
+            with host_limits[netloc]:
+                return list(self.fetch_file(file_ref, host, output_dir))
+
+        with ThreadPoolExecutor(self.max_downloads) as pool:
+            futures = [pool.submit(download, file_ref) for file_ref in file_refs]
+            try:
+                for future in futures:
+                    yield from future.result()
+            except BaseException:
+                # don't start downloads that are still queued
+                for future in futures:
+                    future.cancel()
+                raise
@@ -22,6 +22,8 @@ class Figshare(DoiProvider):
       - https://figshare.com/articles/binder-examples_requirements/9784088 (only one zipfile, no DOI)
     """
 
+    immutable = True
+
     def __init__(self):
         super().__init__()
         self.hosts = [
@@ -86,10 +88,11 @@ class Figshare(DoiProvider):
         files = deep_get(article, host["filepath"])
         # only fetch files where is_link_only: False
         files = [file for file in files if not file["is_link_only"]]
-        only_one_file = len(files) == 1
-        for file_ref in files:
-            unzip = file_ref["name"].endswith(".zip") and only_one_file
-            yield from self.fetch_file(file_ref, host, output_dir, unzip)
+        if len(files) == 1:
+            unzip = files[0]["name"].endswith(".zip")
+            yield from self.fetch_file(files[0], host, output_dir, unzip)
+        else:
+            yield from self.fetch_files(files, host, output_dir)
 
     @property
     def content_id(self):
@@ -1,12 +1,199 @@
+import fcntl
+import fnmatch
+import hashlib
+import os
+import re
+import shutil
 import subprocess
+import time
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlsplit, urlunsplit
 
-from ..utils import R2dState, check_ref, execute_cmd
+from ..utils import R2dState, check_ref, dir_size, execute_cmd
 from .base import ContentProvider, ContentProviderException
 
 
+def normalize_url(url):
+    """Return a canonical form of a git remote URL to use as a cache key
+
+    Differences that don't change which repository is meant are removed:
+    the case of the scheme and host, credentials, a trailing slash and a
+    trailing `.git`. Local paths are made absolute.
+    """
+    url = url.strip()
+    if os.path.exists(url):
+        return os.path.realpath(url)
+    parts = urlsplit(url)
+    if parts.scheme and parts.hostname:
+        netloc = parts.hostname.lower()
+        if parts.port:
+            netloc += f":{parts.port}"
+        url = urlunsplit((parts.scheme.lower(), netloc, parts.path, "", ""))
+    url = url.rstrip("/")
+    if url.endswith(".git"):
+        url = url[: -len(".git")]
+    return url
+
+
+def resolve_remote_ref(repo, ref):
+    """Resolve `ref` to a commit SHA with `git ls-remote`
+
+    `ref` can be a full commit SHA, a branch, a tag or a fully qualified ref
+    like `refs/pull/1/head`. Returns None if the ref can't be resolved
+    without cloning, e.g. for abbreviated commit SHAs.
+    """
+    if re.fullmatch(r"[0-9a-f]{40}", ref):
+        return ref
+    try:
+        # ask for the peeled ref as well to get the commit an annotated tag
+        # points at
+        output = subprocess.check_output(
+            ["git", "ls-remote", repo, ref, ref + "^{}"],
+            stderr=subprocess.DEVNULL,
+        )
+    except subprocess.CalledProcessError:
+        return None
+
+    remote_refs = {}
+    for line in output.decode().splitlines():
+        sha, name = line.split("\t", 1)
+        remote_refs[name] = sha
+    # same order as `git rev-parse`, which resolves the ref in a full clone:
+    # a tag wins over a branch with the same name
+    for name in [ref, f"refs/tags/{ref}", f"refs/heads/{ref}"]:
+        sha = remote_refs.get(name + "^{}", remote_refs.get(name))
+        if sha is not None:
+            return sha
+    return None
+
+
+class GitMirrorCache:
+    """
+    A directory of bare git repositories mirroring remote repositories.
+
+    Each remote gets one mirror, named after a hash of its normalized URL.
+    Clones use the mirror with `--reference --dissociate` so that only the
+    objects that are not in the mirror yet are downloaded, while the clone
+    ends up independent of the mirror.
+
+    Access to a mirror is serialized with a lock file next to it: updating
+    takes an exclusive lock, cloning from it only needs a shared one.
+
+    If `max_size` (in bytes) is non-zero, the least recently used mirrors
+    are removed until the cache is smaller than `max_size`.
+    """
+
+    def __init__(self, cache_dir, max_size=0):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def path(self, url):
+        """Return the path of the mirror for `url`"""
+        key = hashlib.sha256(normalize_url(url).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, key + ".git")
+
+    @contextmanager
+    def lock(self, url):
+        """Hold an exclusive lock on the mirror for `url`
+
+        The context manager returns the lock file, use `share()` to downgrade
+        the lock.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.path(url) + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield lock_file
+
+    def share(self, lock_file):
+        """Downgrade a lock returned by `lock()` to a shared lock"""
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+    def update(self, url, capture=False):
+        """Create or update the mirror for `url`, the caller must hold its lock
+
+        The remote URL isn't stored in the mirror so that credentials that
+        are part of it are not written to disk.
+        """
+        path = self.path(url)
+        if not os.path.exists(path):
+            yield from execute_cmd(
+                ["git", "init", "--quiet", "--bare", path], capture=capture
+            )
+        yield from execute_cmd(
+            [
+                "git",
+                "fetch",
+                "--prune",
+                url,
+                "+refs/heads/*:refs/heads/*",
+                "+refs/tags/*:refs/tags/*",
+            ],
+            cwd=path,
+            capture=capture,
+        )
+        # the modification time of the mirror is used to find the least
+        # recently used ones
+        os.utime(path)
+
+    def evict(self, keep=None):
+        """Remove least recently used mirrors until the cache fits in max_size
+
+        The mirror for the URL `keep` is never removed, neither are mirrors
+        that are in use. Returns the paths of the mirrors that were removed.
+        """
+        if not self.max_size:
+            return []
+        keep = self.path(keep) if keep is not None else None
+
+        mirrors = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".git") and entry.is_dir():
+                        mirrors.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            return []
+        sizes = {path: dir_size(path) for _, path in mirrors}
+        total = sum(sizes.values())
+
+        removed = []
+        for _, path in sorted(mirrors):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            # lock files are never removed, otherwise two processes could end
+            # up holding a lock on different files for the same mirror
+            with open(path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            total -= sizes[path]
+            removed.append(path)
+        return removed
+
+
 class Git(ContentProvider):
     """Provide contents of a remote git repository."""
 
+    # a GitMirrorCache to speed up cloning, or None
+    mirror_cache = None
+
+    # only fetch the commit a given ref points at instead of cloning the full
+    # history of the repository
+    shallow_fetch_ref = False
+
+    # number of submodules to fetch in parallel, 0 uses git's default
+    submodule_jobs = 0
+    # only fetch the recorded commit of each submodule, without history
+    shallow_submodules = False
+    # glob patterns of the paths of the submodules to initialize, None for all
+    submodules = None
+    # glob patterns of the paths of submodules not to initialize
+    skip_submodules = ()
+
     def detect(self, source, ref=None, extra_args=None):
         # Git is our content provider of last resort. This is to maintain the
         # old behaviour when git and local directories were the only supported
@@ -18,32 +205,137 @@ class Git(ContentProvider):
         repo = spec["repo"]
         ref = spec.get("ref") or "HEAD"
 
-        # make a, possibly shallow, clone of the remote repository
-        try:
-            cmd = ["git", "clone"]
-            if ref == "HEAD":
-                # check out of HEAD is performed after the clone is complete
-                cmd.extend(["--depth", "1"])
-            else:
-                # don't check out HEAD, the given ref will be checked out later
-                # this prevents HEAD's submodules to be cloned if ref doesn't have them
-                cmd.extend(["--no-checkout"])
-            cmd.extend([repo, output_dir])
-            yield from execute_cmd(cmd, capture=yield_output)
+        hash = None
+        if ref != "HEAD" and self.shallow_fetch_ref:
+            hash = yield from self._fetch_commit(repo, ref, output_dir, yield_output)
 
-        except subprocess.CalledProcessError as e:
-            msg = f"Failed to clone repository from {repo}"
-            if ref != "HEAD":
-                msg += f" (ref {ref})"
-            msg += "."
-            raise ContentProviderException(msg) from e
+        if hash is None:
+            hash = yield from self._clone_ref(repo, ref, output_dir, yield_output)
+
+        if hash is not None:
+            # We don't need to explicitly checkout things as the reset will
+            # take care of that. If the hash is resolved above, we should be
+            # able to reset to it
+            yield from execute_cmd(
+                ["git", "reset", "--hard", hash], cwd=output_dir, capture=yield_output
+            )
+
+        # ensure that git submodules are initialised and updated
+        yield from self._update_submodules(output_dir)
+
+        cmd = ["git", "rev-parse", "HEAD"]
+        sha1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=output_dir)
+        self._sha1 = sha1.stdout.read().decode().strip()
+
+    def _want_submodule(self, path):
+        if self.submodules is not None and not any(
+            fnmatch.fnmatch(path, pattern) for pattern in self.submodules
+        ):
+            return False
+        return not any(fnmatch.fnmatch(path, p) for p in self.skip_submodules)
+
+    def _update_submodules(self, output_dir):
+        """Initialize and update the submodules of the checkout
+
+        `submodules` and `skip_submodules` select which of the top level
+        submodules are initialized, submodules nested in them are always
+        initialized too.
+        """
+        if not os.path.exists(os.path.join(output_dir, ".gitmodules")):
+            return
+
+        cmd = ["git", "submodule", "update", "--init", "--recursive"]
+        if self.submodule_jobs:
+            cmd.extend(["--jobs", str(self.submodule_jobs)])
+
+        if self.submodules is not None or self.skip_submodules:
+            try:
+                output = subprocess.check_output(
+                    [
+                        "git",
+                        "config",
+                        "--file",
+                        ".gitmodules",
+                        "--get-regexp",
+                        r"^submodule\..*\.path$",
+                    ],
+                    cwd=output_dir,
+                )
+            except subprocess.CalledProcessError:
+                # no submodules
+                return
+            paths = [line.split(" ", 1)[1] for line in output.decode().splitlines()]
+            selected = [path for path in paths if self._want_submodule(path)]
+            for path in paths:
+                if path not in selected:
+                    yield f"Skipping submodule {path}\n"
+            if not selected:
+                return
+            paths_args = ["--", *selected]
+        else:
+            paths_args = []
+
+        if self.shallow_submodules:
+            try:
+                yield from self._timed_submodule_update(
+                    cmd + ["--depth", "1"] + paths_args, output_dir
+                )
+                return
+            except subprocess.CalledProcessError:
+                # servers that don't allow fetching a commit by its SHA can
+                # only provide commits at the tip of a branch shallowly
+                self.log.info("Shallow submodule update failed, fetching history\n")
+        yield from self._timed_submodule_update(cmd + paths_args, output_dir)
+
+    def _timed_submodule_update(self, cmd, output_dir):
+        """Run `git submodule update` and report how long each submodule took"""
+        output_dir = os.path.realpath(output_dir)
+        start = time.monotonic()
+        started = {}
+        for line in execute_cmd(cmd, cwd=output_dir, capture=True):
+            yield line
+            m = re.match(r"Cloning into '(.*)'\.\.\.", line)
+            if m:
+                path = os.path.relpath(os.path.realpath(m.group(1)), output_dir)
+                started[path] = time.monotonic()
+                continue
+            m = re.match(r"Submodule path '(.*)': checked out", line)
+            if m:
+                path = m.group(1)
+                duration = time.monotonic() - started.get(path, start)
+                yield f"Submodule {path} fetched in {duration:.1f}s\n"
+
+    def _clone_ref(self, repo, ref, output_dir, yield_output):
+        """Clone the repository and resolve `ref` in the clone
+
+        Returns the SHA of the commit to check out, or None to stay at HEAD.
+        """
+        with ExitStack() as stack:
+            reference = None
+            if self.mirror_cache is not None:
+                try:
+                    lock_file = stack.enter_context(self.mirror_cache.lock(repo))
+                    yield from self.mirror_cache.update(repo, capture=yield_output)
+                    # other builds of this repository can clone from the
+                    # mirror at the same time, but not update it
+                    self.mirror_cache.share(lock_file)
+                    reference = self.mirror_cache.path(repo)
+                except (OSError, subprocess.CalledProcessError) as e:
+                    self.log.warning(f"Not using the git mirror cache: {e}\n")
+
+            yield from self._clone(repo, ref, output_dir, reference, yield_output)
+
+        if self.mirror_cache is not None:
+            for path in self.mirror_cache.evict(keep=repo):
+                self.log.info(f"Removed git mirror {path} from the cache\n")
 
         # check out the specific ref given by the user
         if ref != "HEAD":
             hash = check_ref(ref, output_dir)
             if hash is None:
                 self.log.error(
-                    f"Failed to check out ref {ref}", extra=dict(phase=R2dState.FAILED)
+                    f"Failed to check out ref {ref}",
+                    extra=dict(phase=R2dState.FAILED),
                 )
                 if ref == "master" or ref == "main":
                     msg = (
@@ -55,23 +347,67 @@ class Git(ContentProvider):
                 else:
                     msg = f"Failed to check out ref {ref}"
                 raise ValueError(msg)
-            # We don't need to explicitly checkout things as the reset will
-            # take care of that. If the hash is resolved above, we should be
-            # able to reset to it
+            return hash
+        return None
+
+    def _fetch_commit(self, repo, ref, output_dir, yield_output):
+        """Fetch only the commit `ref` points at into an empty repository
+
+        Returns the SHA of the commit or None if that isn't possible, for
+        example because the server doesn't allow fetching commits by SHA. In
+        that case output_dir is left empty.
+        """
+        sha = resolve_remote_ref(repo, ref)
+        if sha is None:
+            return None
+        try:
             yield from execute_cmd(
-                ["git", "reset", "--hard", hash], cwd=output_dir, capture=yield_output
+                ["git", "init", "--quiet", output_dir], capture=yield_output
             )
+            yield from execute_cmd(
+                ["git", "remote", "add", "origin", repo],
+                cwd=output_dir,
+                capture=yield_output,
+            )
+            yield from execute_cmd(
+                ["git", "fetch", "--depth", "1", "origin", sha],
+                cwd=output_dir,
+                capture=yield_output,
+            )
+        except subprocess.CalledProcessError:
+            self.log.info(f"Failed to fetch {sha}, cloning the whole repository\n")
+            shutil.rmtree(os.path.join(output_dir, ".git"), ignore_errors=True)
+            return None
+        return sha
 
-        # ensure that git submodules are initialised and updated
-        yield from execute_cmd(
-            ["git", "submodule", "update", "--init", "--recursive"],
-            cwd=output_dir,
-            capture=yield_output,
-        )
+    def _clone(self, repo, ref, output_dir, reference, yield_output):
+        """Make a, possibly shallow, clone of the remote repository
 
-        cmd = ["git", "rev-parse", "HEAD"]
-        sha1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=output_dir)
-        self._sha1 = sha1.stdout.read().decode().strip()
+        If `reference` is the path of a local repository, objects are taken
+        from there instead of downloading them.
+        """
+        try:
+            cmd = ["git", "clone"]
+            if ref == "HEAD":
+                # check out of HEAD is performed after the clone is complete
+                cmd.extend(["--depth", "1"])
+            else:
+                # don't check out HEAD, the given ref will be checked out later
+                # this prevents HEAD's submodules to be cloned if ref doesn't have them
+                cmd.extend(["--no-checkout"])
+            if reference is not None:
+                # copy the objects we need so the clone doesn't depend on the
+                # mirror once we release the lock on it
+                cmd.extend(["--reference", reference, "--dissociate"])
+            cmd.extend([repo, output_dir])
+            yield from execute_cmd(cmd, capture=yield_output)
+
+        except subprocess.CalledProcessError as e:
+            msg = f"Failed to clone repository from {repo}"
+            if ref != "HEAD":
+                msg += f" (ref {ref})"
+            msg += "."
+            raise ContentProviderException(msg) from e
 
     @property
     def content_id(self):
@@ -1,9 +1,8 @@
 import os
-import shutil
+import tempfile
 import time
 import zipfile
 from datetime import datetime, timedelta, timezone
-from urllib.request import urlretrieve
 
 from .base import ContentProviderException
 from .doi import DoiProvider
@@ -12,6 +11,13 @@ from .doi import DoiProvider
 class Hydroshare(DoiProvider):
     """Provide contents of a Hydroshare resource."""
 
+    immutable = True
+
+    # polling for a bag to be prepared starts with poll_delay seconds between
+    # requests, doubling up to max_poll_delay
+    poll_delay = 1
+    max_poll_delay = 30
+
     def _fetch_version(self, host):
         """Fetch resource modified date and convert to epoch"""
         json_response = self.urlopen(host["version"].format(self.resource_id)).json()
@@ -51,8 +57,15 @@ class Hydroshare(DoiProvider):
                     "version": self.version,
                 }
 
-    def _urlretrieve(self, bag_url):
-        return urlretrieve(bag_url)
+    def _urlretrieve(self, bag_url, output_dir):
+        """Download bag_url into output_dir, return the path and the headers"""
+        resp = self._request(bag_url, stream=True)
+        resp.raise_for_status()
+        filename = os.path.join(output_dir, "bag.zip")
+        with open(filename, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+        return filename, resp.headers
 
     def fetch(self, spec, output_dir, yield_output=False, timeout=120):
         """Fetch and unpack a Hydroshare resource"""
@@ -66,10 +79,10 @@ class Hydroshare(DoiProvider):
         # bag downloads are prepared on demand and may need some time
         conn = self.urlopen(bag_url)
         total_wait_time = 0
+        wait_time = self.poll_delay
         while conn.status_code == 200 and not conn.url.startswith(
             f"https://s3.hydroshare.org/bags/{resource_id}.zip"
         ):
-            wait_time = 10
             total_wait_time += wait_time
             if total_wait_time > timeout:
                 msg = "Bag taking too long to prepare, exiting now, try again later."
@@ -77,6 +90,7 @@ class Hydroshare(DoiProvider):
                 raise ContentProviderException(msg)
             yield f"Bag is being prepared, requesting again in {wait_time} seconds.\n"
             time.sleep(wait_time)
+            wait_time = min(wait_time * 2, self.max_poll_delay)
             conn = self.urlopen(bag_url)
         if conn.status_code != 200:
             msg = f"Failed to download bag. status code {conn.status_code}.\n"
@@ -84,17 +98,23 @@ class Hydroshare(DoiProvider):
             raise ContentProviderException(msg)
         # Bag creation seems to need a small time buffer after it says it's ready.
         time.sleep(1)
-        filehandle, _ = self._urlretrieve(bag_url)
-        zip_file_object = zipfile.ZipFile(filehandle, "r")
-        yield "Downloaded, unpacking contents.\n"
-        zip_file_object.extractall("temp")
-        # resources store the contents in the data/contents directory, which is all we want to keep
-        contents_dir = os.path.join("temp", self.resource_id, "data", "contents")
-        files = os.listdir(contents_dir)
-        for f in files:
-            shutil.move(os.path.join(contents_dir, f), output_dir)
+
+        # zip files can't be extracted while they are downloaded, as their
+        # index is at the end, so download to a private scratch directory
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            filename, _ = self._urlretrieve(bag_url, scratch_dir)
+            yield "Downloaded, unpacking contents.\n"
+            # resources store the contents in the data/contents directory,
+            # which is all we want to keep
+            prefix = f"{resource_id}/data/contents/"
+            with zipfile.ZipFile(filename, "r") as bag:
+                for info in bag.infolist():
+                    if not info.filename.startswith(prefix):
+                        continue
+                    info.filename = info.filename[len(prefix) :]
+                    if info.filename:
+                        bag.extract(info, output_dir)
         yield "Finished, cleaning up.\n"
-        shutil.rmtree("temp")
 
     @property
     def content_id(self):
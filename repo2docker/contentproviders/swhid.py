@@ -1,18 +1,40 @@
-import io
 import os
+import random
 import re
-import shutil
 import tarfile
 import time
-from os import path
 
 import requests
 
 from .. import __version__
-from ..utils import copytree
 from .base import ContentProvider
 
 
+def _strip_top_dir(archive, top_dir):
+    """Yield the members of archive inside top_dir, relative to top_dir"""
+    prefix = top_dir + "/"
+    for member in archive:
+        if not member.name.startswith(prefix):
+            continue
+        member.name = member.name[len(prefix) :]
+        if member.islnk() and member.linkname.startswith(prefix):
+            member.linkname = member.linkname[len(prefix) :]
+        yield member
+
+
+class _CountingReader:
+    """Wrap a file object and count the bytes read from it"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
 def parse_swhid(swhid):
     swhid_regexp = r"^swh:(?P<version>\d+):(?P<type>ori|cnt|rev|dir|snp|rel):(?P<hash>[0-9a-f]{40})$"
     # only parse/check the <identifier_core> of the swhid
@@ -25,7 +47,13 @@ def parse_swhid(swhid):
 class Swhid(ContentProvider):
     """Provide contents of a repository identified by a SWHID."""
 
+    immutable = True
+
     retry_delay = 5
+    # polling the vault starts with poll_delay seconds between requests,
+    # doubling up to max_poll_delay
+    poll_delay = 1
+    max_poll_delay = 60
 
     def __init__(self):
         self.swhid = None
@@ -41,13 +69,13 @@ class Swhid(ContentProvider):
         header = {"Authorization": f"Bearer {token}"}
         self.session.headers.update(header)
 
-    def _request(self, url, method="GET"):
+    def _request(self, url, method="GET", stream=False):
         if not url.endswith("/"):
             url = url + "/"
 
         for retries in range(3):
             try:
-                resp = self.session.request(method, url)
+                resp = self.session.request(method, url, stream=stream)
                 if resp.ok:
                     break
             except requests.ConnectionError:
@@ -68,29 +96,60 @@ class Swhid(ContentProvider):
             and swhid_dict["type"] in ("dir", "rev")
             and swhid_dict["version"] == "1"
         ):
+            if swhid_dict["type"] == "dir":
+                # the content_id of a revision is only known after fetching it
+                self.swhid = swhid
             return {"swhid": swhid, "swhid_obj": swhid_dict}
 
+    def _poll_delays(self):
+        """Yield how long to wait between polls of the vault
+
+        Exponential backoff with jitter, so that many clients waiting for
+        the vault don't poll it in lockstep.
+        """
+        delay = self.poll_delay
+        while True:
+            yield random.uniform(delay / 2, delay)
+            delay = min(delay * 2, self.max_poll_delay)
+
     def fetch_directory(self, dir_hash, output_dir):
         url = f"{self.base_url}/vault/directory/{dir_hash}/"
         yield f"Fetching directory {dir_hash} from {url}\n"
+        start = time.monotonic()
         resp = self._request(url, "POST")
         receipt = resp.json()
         status = receipt["status"]
         assert status != "failed", receipt
+        delays = self._poll_delays()
         while status not in ("failed", "done"):
-            time.sleep(self.retry_delay)
+            time.sleep(next(delays))
             resp = self._request(url)
             status = resp.json()["status"]
         if status == "failed":
             yield "Error preparing the directory for download"
             raise Exception()
-        resp = self._request(resp.json()["fetch_url"])
-        archive = tarfile.open(fileobj=io.BytesIO(resp.content))
-        archive.extractall(path=output_dir)
-        # the output_dir should have only one subdir named after the dir_hash
-        # move its content one level up
-        copytree(path.join(output_dir, dir_hash), output_dir)
-        shutil.rmtree(path.join(output_dir, dir_hash))
+        waited = time.monotonic() - start
+
+        start = time.monotonic()
+        resp = self._request(resp.json()["fetch_url"], stream=True)
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        body = _CountingReader(resp.raw)
+        # extract while downloading instead of holding the archive in memory
+        with tarfile.open(fileobj=body, mode="r|*") as archive:
+            # the archive has only one directory named after the dir_hash,
+            # extract its content directly into output_dir
+            archive.extractall(
+                path=output_dir, members=_strip_top_dir(archive, dir_hash)
+            )
+        downloaded = time.monotonic() - start
+
+        rate = body.bytes_read / max(downloaded, 1e-6)
+        yield (
+            f"Waited {waited:.1f}s for the vault, downloaded "
+            f"{body.bytes_read / 1e6:.1f} MB in {downloaded:.1f}s "
+            f"({rate / 1e6:.1f} MB/s)\n"
+        )
         yield f"Fetched files: {os.listdir(output_dir)}\n"
 
     def fetch(self, spec, output_dir, yield_output=False):
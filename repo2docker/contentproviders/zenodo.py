@@ -12,6 +12,8 @@ from .doi import DoiProvider
 class Zenodo(DoiProvider):
     """Provide contents of a Zenodo deposit."""
 
+    immutable = True
+
     def __init__(self):
         super().__init__()
         # We need the hostname (url where records are), api url (for metadata),
@@ -101,9 +103,10 @@ class Zenodo(DoiProvider):
             record = resp.json()
 
         files = deep_get(record, host["filepath"])
-        only_one_file = len(files) == 1
-        for file_ref in files:
-            yield from self.fetch_file(file_ref, host, output_dir, unzip=only_one_file)
+        if len(files) == 1:
+            yield from self.fetch_file(files[0], host, output_dir, unzip=True)
+        else:
+            yield from self.fetch_files(files, host, output_dir)
 
     @property
     def content_id(self):
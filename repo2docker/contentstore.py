@@ -0,0 +1,140 @@
+"""
+A local store of the contents of immutable records
+"""
+
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from .utils import copytree, dir_size
+
+
+def _link_or_copy(src, dst):
+    """Hardlink src to dst, copy it if that isn't possible"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ContentStore:
+    """
+    A directory with the contents of records that never change.
+
+    Content providers like Zenodo or Figshare fetch records whose content is
+    fixed for a given content ID. The store keeps a copy of every record that
+    was fetched in `<cache_dir>/<provider>/<content_id>`, so that fetching it
+    again doesn't need the network.
+
+    Records are fetched into a staging directory that is renamed into place
+    once complete, so a record in the store is never partially written. When
+    they are used, records are hardlinked into the checkout, or copied if
+    that isn't possible.
+
+    If `max_size` (in bytes) is non-zero, the least recently used records
+    are removed until the store is smaller than `max_size`.
+    """
+
+    def __init__(self, cache_dir, max_size=0):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def path(self, provider, content_id):
+        """Return the path of a record in the store"""
+        return os.path.join(self.cache_dir, provider, quote(content_id, safe=""))
+
+    @contextmanager
+    def _lock(self, mode):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            yield
+
+    def get(self, provider, content_id):
+        """Return the path of a record if it is in the store, otherwise None"""
+        path = self.path(provider, content_id)
+        if not os.path.isdir(path):
+            return None
+        # the modification time is used to find the least recently used records
+        os.utime(path)
+        return path
+
+    @contextmanager
+    def add(self, provider, content_id):
+        """Add a record to the store
+
+        The context manager returns an empty directory to put the content of
+        the record in. If the block completes without an exception the
+        directory becomes the record, otherwise it is removed.
+        """
+        path = self.path(provider, content_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=os.path.dirname(path))
+        try:
+            yield staging_dir
+            try:
+                os.rename(staging_dir, path)
+            except OSError:
+                # another process added the same record in the meantime
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def materialize(self, provider, content_id, output_dir, link=True):
+        """Put the files of a record into output_dir
+
+        Files are hardlinked if `link` is true, otherwise they are copied.
+        Changes to hardlinked files also change the record in the store.
+
+        Returns False, leaving output_dir alone, if the record isn't in the
+        store, e.g. because it was evicted since it was added.
+        """
+        copy_function = _link_or_copy if link else shutil.copy2
+        # the record can't be evicted between finding and copying it
+        with self._lock(fcntl.LOCK_SH):
+            path = self.get(provider, content_id)
+            if path is None:
+                return False
+            copytree(path, output_dir, symlinks=True, copy_function=copy_function)
+        return True
+
+    def evict(self, keep=()):
+        """Remove least recently used records until the store fits in max_size
+
+        `keep` is a list of `(provider, content_id)` tuples of records that
+        must not be removed. Returns the paths of the removed records.
+        """
+        if not self.max_size:
+            return []
+        keep = {self.path(provider, content_id) for provider, content_id in keep}
+
+        removed = []
+        # don't remove records while they are being materialized, the ones
+        # to remove are picked under the lock too so that a record that is
+        # used meanwhile counts as recently used
+        with self._lock(fcntl.LOCK_EX):
+            records = []
+            for provider in os.listdir(self.cache_dir):
+                provider_dir = os.path.join(self.cache_dir, provider)
+                if not os.path.isdir(provider_dir):
+                    continue
+                with os.scandir(provider_dir) as it:
+                    for entry in it:
+                        if not entry.name.startswith(".") and entry.is_dir():
+                            records.append((entry.stat().st_mtime, entry.path))
+            sizes = {path: dir_size(path) for _, path in records}
+            total = sum(sizes.values())
+
+            for _, path in sorted(records):
+                if total <= self.max_size:
+                    break
+                if path in keep:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= sizes[path]
+                removed.append(path)
+        return removed
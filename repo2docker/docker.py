@@ -2,8 +2,11 @@
 Docker container engine for repo2docker
 """
 
+import fcntl
+import hashlib
 import json
 import os
+import re
 import shutil
 import subprocess
 import tarfile
@@ -13,12 +16,19 @@ from contextlib import ExitStack, contextmanager
 from pathlib import Path
 
 from iso8601 import parse_date
-from traitlets import Dict, List, Unicode, default
+from traitlets import Dict, Enum, List, Unicode, default
 
 import docker
 
-from .engine import Container, ContainerEngine, Image
-from .utils import execute_cmd
+from .engine import Container, ContainerEngine, Image, parse_image_reference
+from .utils import (
+    ByteSpecification,
+    R2dState,
+    Timings,
+    dir_size,
+    execute_cmd,
+    get_cache_dir,
+)
 
 # The DOCKER_HOST environment variable is used by Docker to set a remote host.
 # The same DOCKER_HOST environment variable is also used
@@ -139,6 +149,177 @@ class DockerEngine(ContainerEngine):
         config=True,
     )
 
+    build_cache = Enum(
+        ["local", "registry", "inline"],
+        None,
+        allow_none=True,
+        help="""
+        Where to export the BuildKit cache of a build to, and import it from.
+
+        - `local`: a directory per repository in `build_cache_dir`
+        - `registry`: an image per repository, see `build_cache_repository`
+        - `inline`: in the built image, so that it can be listed in
+          `Repo2Docker.cache_from` by later builds
+
+        Exporting to a directory or a registry needs a builder that doesn't
+        use the `docker` driver, e.g. one made with `docker buildx create --use`.
+        By default the cache isn't exported.
+        """,
+        config=True,
+    )
+
+    build_cache_dir = Unicode(
+        help="""
+        Directory for the `local` build cache.
+
+        Defaults to `buildkit` in repo2docker's cache directory.
+        """,
+        config=True,
+    )
+
+    @default("build_cache_dir")
+    def _build_cache_dir_default(self):
+        return get_cache_dir("buildkit")
+
+    build_cache_size = ByteSpecification(
+        "20G",
+        help="""
+        Maximum size of the `local` build cache.
+
+        When the caches in `build_cache_dir` take up more space than this,
+        the least recently used ones are removed. Set to 0 to never remove
+        caches.
+        """,
+        config=True,
+    )
+
+    build_cache_repository = Unicode(
+        None,
+        allow_none=True,
+        help="""
+        Image repository for the `registry` build cache.
+
+        The cache of each repository that is built is a tag of this
+        repository. By default the cache is the `buildcache` tag of the
+        image's own repository.
+        """,
+        config=True,
+    )
+
+    def _cache_key(self, tag):
+        """A name for the build cache of the repository being built
+
+        Falls back to the image repository of tag if repo2docker didn't set
+        `cache_name`. Valid as a directory name and as an image tag.
+        """
+        if self.cache_name:
+            name = self.cache_name
+        else:
+            registry, name, _ = parse_image_reference(tag)
+            name = f"{registry}/{name}"
+        key = re.sub(r"[^a-zA-Z0-9_.-]+", "-", name).lstrip(".-")
+        if len(key) > 128:
+            # keep long names that only differ at the end apart
+            digest = hashlib.sha256(name.encode("utf-8")).hexdigest()
+            key = f"{key[:119]}-{digest[:8]}"
+        return key
+
+    def _registry_cache_ref(self, tag):
+        if self.build_cache_repository:
+            return f"{self.build_cache_repository}:{self._cache_key(tag)}"
+        repository = tag.split("@", 1)[0]
+        if ":" in repository.rsplit("/", 1)[-1]:
+            repository = repository.rsplit(":", 1)[0]
+        return f"{repository}:buildcache"
+
+    def _local_cache(self, tag):
+        """Log the size of the local build cache of tag, return its path"""
+        cache_dir = os.path.join(self.build_cache_dir, self._cache_key(tag))
+        if os.path.isdir(cache_dir):
+            # the modification time is used to find the least recently used
+            # caches
+            os.utime(cache_dir)
+            size = dir_size(cache_dir)
+            self.log.info(
+                f"Importing build cache from {cache_dir} ({size / 1e6:.1f} MB)\n",
+                extra=dict(phase=R2dState.BUILDING, cache_import_bytes=size),
+            )
+        return cache_dir
+
+    def _replace_local_cache(self, cache_dir, new_cache_dir):
+        """Replace the local build cache with the one exported by a build
+
+        Exporting to a new directory keeps blobs that are no longer used
+        from piling up in the cache. Builds of the same image repository
+        replace the cache one at a time, a cache that can't be replaced is
+        only a warning, the build itself succeeded.
+        """
+        size = dir_size(new_cache_dir)
+        try:
+            with open(cache_dir + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                old_cache_dir = tempfile.mkdtemp(
+                    prefix=".old-", dir=os.path.dirname(cache_dir)
+                )
+                try:
+                    if os.path.isdir(cache_dir):
+                        os.replace(cache_dir, os.path.join(old_cache_dir, "cache"))
+                    os.replace(new_cache_dir, cache_dir)
+                finally:
+                    shutil.rmtree(old_cache_dir, ignore_errors=True)
+        except OSError as e:
+            self.log.warning(
+                f"Could not export build cache to {cache_dir}: {e}\n",
+                extra=dict(phase=R2dState.BUILDING),
+            )
+            return
+        self.log.info(
+            f"Exported build cache to {cache_dir} ({size / 1e6:.1f} MB)\n",
+            extra=dict(phase=R2dState.BUILDING, cache_export_bytes=size),
+        )
+        for path in self._evict_local_caches(keep=cache_dir):
+            self.log.info(
+                f"Removed {path} from the build cache.\n",
+                extra=dict(phase=R2dState.BUILDING),
+            )
+
+    def _evict_local_caches(self, keep):
+        """Remove least recently used caches until they fit in build_cache_size
+
+        The cache `keep` is never removed, neither are caches that are being
+        replaced. A build that imports a cache that is removed meanwhile
+        only misses the cache. Returns the paths of the removed caches.
+        """
+        if not self.build_cache_size:
+            return []
+
+        caches = []
+        with os.scandir(self.build_cache_dir) as it:
+            for entry in it:
+                # skip caches that are being exported or replaced
+                if not entry.name.startswith(".") and entry.is_dir():
+                    caches.append((entry.stat().st_mtime, entry.path))
+        sizes = {path: dir_size(path) for _, path in caches}
+        total = sum(sizes.values())
+
+        removed = []
+        for _, path in sorted(caches):
+            if total <= self.build_cache_size:
+                break
+            if path == keep:
+                continue
+            # lock files are never removed, otherwise two processes could end
+            # up holding a lock on different files for the same cache
+            with open(path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            total -= sizes[path]
+            removed.append(path)
+        return removed
+
     def build(
         self,
         *,
@@ -172,6 +353,24 @@ class DockerEngine(ContainerEngine):
             for cf in cache_from:
                 args += ["--cache-from", cf]
 
+        cache_dir = new_cache_dir = None
+        if self.build_cache and tag:
+            if self.build_cache == "local":
+                cache_dir = self._local_cache(tag)
+                os.makedirs(self.build_cache_dir, exist_ok=True)
+                new_cache_dir = tempfile.mkdtemp(
+                    prefix=".new-", dir=self.build_cache_dir
+                )
+                if os.path.isdir(cache_dir):
+                    args += ["--cache-from", f"type=local,src={cache_dir}"]
+                args += ["--cache-to", f"type=local,dest={new_cache_dir},mode=max"]
+            elif self.build_cache == "registry":
+                ref = self._registry_cache_ref(tag)
+                args += ["--cache-from", f"type=registry,ref={ref}"]
+                args += ["--cache-to", f"type=registry,ref={ref},mode=max"]
+            else:
+                args += ["--cache-to", "type=inline"]
+
         if dockerfile:
             args += ["--file", dockerfile]
 
@@ -188,26 +387,43 @@ class DockerEngine(ContainerEngine):
         # place extra args right *before* the path
         args += self.extra_buildx_build_args
 
+        timings = self.timings or Timings()
         with ExitStack() as stack:
-            if fileobj:
-                with tempfile.TemporaryDirectory() as d:
-                    tarf = tarfile.open(fileobj=fileobj)
-                    tarf.extractall(d)
-
-                    args += [d]
+            if new_cache_dir:
+                stack.callback(shutil.rmtree, new_cache_dir, ignore_errors=True)
+            if self.registry_credentials and (
+                (push and tag) or self.build_cache == "registry"
+            ):
+                # the registry cache is pushed during the build
+                stack.enter_context(self.docker_login(**self.registry_credentials))
+
+            with timings.timed(R2dState.BUILDING, "buildx build"):
+                if fileobj and self.container_cli == "docker":
+                    # docker buildx reads a tar build context from stdin, so stream
+                    # it in directly instead of extracting it to disk first
+                    args += ["-"]
+
+                    yield from execute_cmd(args, True, input_fileobj=fileobj)
+                elif fileobj:
+                    with tempfile.TemporaryDirectory() as d:
+                        tarf = tarfile.open(fileobj=fileobj)
+                        tarf.extractall(d)
+
+                        args += [d]
+
+                        yield from execute_cmd(args, True)
+                else:
+                    # Assume 'path' is passed in
+                    args += [path]
 
                     yield from execute_cmd(args, True)
-            else:
-                # Assume 'path' is passed in
-                args += [path]
 
-                yield from execute_cmd(args, True)
+            if new_cache_dir:
+                self._replace_local_cache(cache_dir, new_cache_dir)
 
             if push and tag:
-                if self.registry_credentials:
-                    stack.enter_context(self.docker_login(**self.registry_credentials))
-
-                yield from execute_cmd([self.container_cli, "push", tag], True)
+                with timings.timed(R2dState.PUSHING, "push"):
+                    yield from execute_cmd([self.container_cli, "push", tag], True)
 
     def inspect_image(self, image):
         """
@@ -4,11 +4,58 @@ Interface for a repo2docker container engine
 
 import json
 import os
+import re
 from abc import ABC, abstractmethod
+from urllib.parse import urlparse
 
+import requests
 from traitlets import Dict, TraitError, default, validate
 from traitlets.config import LoggingConfigurable
 
+DOCKER_HUB = "registry-1.docker.io"
+DOCKER_HUB_ALIASES = {"docker.io", "index.docker.io", DOCKER_HUB}
+
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+
+
+def parse_image_reference(image):
+    """Split an image reference into (registry, repository, tag or digest)
+
+    Follows the rules of the docker CLI: the first component of the name is
+    a registry if it contains a `.` or a `:` or is `localhost`, otherwise the
+    image is on Docker Hub.
+    """
+    name, reference = image, "latest"
+    if "@" in name:
+        name, reference = name.split("@", 1)
+    else:
+        last = name.rsplit("/", 1)[-1]
+        if ":" in last:
+            name, reference = name.rsplit(":", 1)
+
+    first, _, rest = name.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        registry, name = first, rest
+    else:
+        registry = DOCKER_HUB
+    if registry in DOCKER_HUB_ALIASES:
+        registry = DOCKER_HUB
+        if "/" not in name:
+            name = f"library/{name}"
+    return registry, name, reference
+
+
+def _registry_host(url):
+    """The host[:port] of a registry URL, which may not have a scheme"""
+    host = urlparse(url if "://" in url else f"//{url}").netloc
+    return DOCKER_HUB if host in DOCKER_HUB_ALIASES else host
+
+
 # Based on https://docker-py.readthedocs.io/en/4.2.0/containers.html
 
 
@@ -186,6 +233,7 @@ class ContainerEngine(LoggingConfigurable):
             raise TraitError(
                 "registry_credentials must have keys 'registry', 'username' and 'password'"
             )
+        return new
 
     string_output = True
     """
@@ -197,6 +245,23 @@ class ContainerEngine(LoggingConfigurable):
     If an engine returns docker style events set this variable to False.
     """
 
+    timings = None
+    """
+    Timings of the build in progress, set by repo2docker before build() is called.
+
+    Engines can time their own steps, like building and pushing the image,
+    with `timings.timed(phase, step)`.
+    """
+
+    cache_name = None
+    """
+    Name of the repository being built, set by repo2docker before build() is called.
+
+    Unlike the name of the image, which changes with the content of the
+    repository, it stays the same across builds of the same repository.
+    Engines can use it to name a build cache that later builds reuse.
+    """
+
     def __init__(self, *, parent):
         """
         Initialise the container engine
@@ -288,6 +353,75 @@ class ContainerEngine(LoggingConfigurable):
         """
         raise NotImplementedError("inspect_image not implemented")
 
+    def image_in_registry(self, image, timeout=10):
+        """
+        Check if an image exists in its registry
+
+        Sends a HEAD request for the manifest of the image with the registry
+        API, authenticating with `registry_credentials` if they are for the
+        registry of the image. Registries without TLS are only used if the
+        `registry` of the credentials is an http:// URL.
+
+        Parameters
+        ----------
+        image : str
+            The image
+        timeout : float
+            Timeout of each request, in seconds
+
+        Returns
+        -------
+        True if the image exists. False if it doesn't, or if the registry
+        can't be asked.
+        """
+        registry, name, reference = parse_image_reference(image)
+        auth = None
+        scheme = "https"
+        creds = self.registry_credentials
+        if creds and _registry_host(creds["registry"]) == registry:
+            auth = (creds["username"], creds["password"])
+            if creds["registry"].startswith("http://"):
+                scheme = "http"
+
+        url = f"{scheme}://{registry}/v2/{name}/manifests/{reference}"
+        headers = {"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+        try:
+            resp = requests.head(url, headers=headers, timeout=timeout)
+            if resp.status_code == 401:
+                challenge = resp.headers.get("WWW-Authenticate", "")
+                auth_scheme, _, params = challenge.partition(" ")
+                if auth_scheme.lower() == "basic":
+                    resp = requests.head(
+                        url, headers=headers, auth=auth, timeout=timeout
+                    )
+                elif auth_scheme.lower() == "bearer":
+                    token = self._registry_token(params, name, auth, timeout)
+                    headers["Authorization"] = f"Bearer {token}"
+                    resp = requests.head(url, headers=headers, timeout=timeout)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            # KeyError and ValueError are from unexpected token responses
+            self.log.warning(f"Could not look up {image} in its registry: {e}\n")
+            return False
+
+        if resp.status_code == 404:
+            return False
+        if not resp.ok:
+            self.log.warning(
+                f"Could not look up {image} in its registry: {resp.status_code} {resp.reason}\n"
+            )
+            return False
+        return True
+
+    def _registry_token(self, challenge_params, name, auth, timeout):
+        """Get a bearer token as asked for by a registry's WWW-Authenticate header"""
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge_params))
+        realm = params.pop("realm")
+        params.setdefault("scope", f"repository:{name}:pull")
+        resp = requests.get(realm, params=params, auth=auth, timeout=timeout)
+        resp.raise_for_status()
+        token = resp.json()
+        return token.get("token") or token["access_token"]
+
     # Note this is different from the Docker client which has Client.containers.run
     def run(
         self,
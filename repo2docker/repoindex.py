@@ -0,0 +1,300 @@
+"""
+An index of the files in a repository checkout
+"""
+
+import hashlib
+import json
+import os
+import stat
+import time
+from collections import namedtuple
+
+from docker.utils.build import PatternMatcher, normalize_slashes
+
+IGNORE_FILES = [".dockerignore", ".containerignore"]
+
+_Entry = namedtuple("_Entry", ["exists", "is_dir", "is_file", "is_link"])
+
+# Files modified more recently than this might be modified again without a
+# change to their stat information, see StatCache
+_RACY_NS = 2 * 1_000_000_000
+
+_ROOT = _Entry(exists=True, is_dir=True, is_file=False, is_link=False)
+_MISSING = _Entry(exists=False, is_dir=False, is_file=False, is_link=False)
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StatCache:
+    """
+    A persistent cache of file digests keyed on the files' stat information.
+
+    Like git's index: as long as the size, mtime, ctime and inode of a file
+    are unchanged its contents are assumed to be unchanged, and the digest
+    computed last time is reused instead of reading the file again.
+
+    The cache is stored as JSON in `path`. Entries that were not used since
+    the cache was loaded are dropped when it is saved.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._used = {}
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def digest(self, path, st):
+        """Return the sha256 digest of the file at path, st is its stat result
+
+        path must be absolute.
+        """
+        key = [st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino]
+        cached = self._entries.get(path)
+        if cached is not None and cached[:4] == key:
+            digest = cached[4]
+        else:
+            digest = _file_digest(path)
+
+        # A file modified within the timestamp resolution of the filesystem
+        # can change again without its stat information changing, git calls
+        # this "racily clean". Only remember digests of files that have been
+        # left alone for a little while.
+        if time.time_ns() - max(st.st_mtime_ns, st.st_ctime_ns) > _RACY_NS:
+            self._used[path] = key + [digest]
+        return digest
+
+    def save(self):
+        """Atomically write the cache to disk"""
+        if self._used == self._entries:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._used, f)
+        os.replace(tmp_path, self.path)
+        self._entries = dict(self._used)
+
+
+class RepoIndex:
+    """
+    An index of all the paths in a repository.
+
+    The index is built with a single walk of the directory tree using
+    `os.scandir`, afterwards questions like "does this file exist?" are
+    answered from memory. This matters when the checkout lives on a slow
+    (network) filesystem or contains a very large number of files.
+
+    Like `os.walk` the index does not descend into symlinked directories.
+    Queries for paths below a symlinked directory, or outside of the
+    repository, fall back to asking the filesystem.
+
+    Paths are relative to `root`, which defaults to the current working
+    directory. Use `full_path` to open the files.
+    """
+
+    def __init__(self, root="."):
+        self.root = root
+        # Maps relative path -> _Entry. Insertion order is the walk order,
+        # so a directory always comes before its contents.
+        self._entries = {}
+        self._walk()
+
+    def _walk(self):
+        stack = [""]
+        while stack:
+            reldir = stack.pop()
+            try:
+                it = os.scandir(os.path.join(self.root, reldir))
+            except OSError:
+                continue
+            subdirs = []
+            with it:
+                for entry in it:
+                    path = os.path.join(reldir, entry.name)
+                    is_link = entry.is_symlink()
+                    try:
+                        is_dir = entry.is_dir()
+                        is_file = entry.is_file()
+                    except OSError:
+                        is_dir = is_file = False
+                    # only symlinks can point at something that doesn't exist
+                    exists = os.path.exists(entry.path) if is_link else True
+                    self._entries[path] = _Entry(exists, is_dir, is_file, is_link)
+                    if is_dir and not is_link:
+                        subdirs.append(path)
+            # reversed so that directories are walked in the order scandir
+            # returned them
+            stack.extend(reversed(subdirs))
+
+    def _lookup(self, path):
+        """Return the _Entry for path or None if the index can't tell"""
+        path = os.path.normpath(path)
+        if path == ".":
+            return _ROOT
+        if os.path.isabs(path) or path.split(os.sep, 1)[0] == os.pardir:
+            return None
+
+        entry = self._entries.get(path)
+        if entry is not None:
+            return entry
+
+        parent = os.path.dirname(path)
+        while parent:
+            parent_entry = self._entries.get(parent)
+            if parent_entry is not None and parent_entry.is_link:
+                # we didn't walk below this symlinked directory
+                return None
+            parent = os.path.dirname(parent)
+        return _MISSING
+
+    def full_path(self, path):
+        """Return the path to open a file of the repository with
+
+        Unlike the working directory, `root` doesn't change while a
+        repository is built.
+        """
+        return os.path.join(self.root, path)
+
+    def exists(self, path):
+        """Equivalent of `os.path.exists` for a path in the repository"""
+        entry = self._lookup(path)
+        if entry is None:
+            return os.path.exists(os.path.join(self.root, path))
+        return entry.exists
+
+    def isdir(self, path):
+        """Equivalent of `os.path.isdir` for a path in the repository"""
+        entry = self._lookup(path)
+        if entry is None:
+            return os.path.isdir(os.path.join(self.root, path))
+        return entry.is_dir
+
+    def isfile(self, path):
+        """Equivalent of `os.path.isfile` for a path in the repository"""
+        entry = self._lookup(path)
+        if entry is None:
+            return os.path.isfile(os.path.join(self.root, path))
+        return entry.is_file
+
+    def find(self, name):
+        """Return the directories containing a (non-directory) entry `name`
+
+        Directories are returned in the form `os.walk(".")` would report them,
+        e.g. `.` or `./some/dir`.
+        """
+        return [
+            os.path.join(".", os.path.dirname(path)).rstrip(os.sep)
+            for path, entry in self._entries.items()
+            if os.path.basename(path) == name and not entry.is_dir
+        ]
+
+    def binder_dir(self):
+        """Return the directory with the configuration files, "" for the root
+
+        Raises RuntimeError if there is both a `binder` and a `.binder`
+        directory.
+        """
+        has_binder = self.isdir("binder")
+        has_dotbinder = self.isdir(".binder")
+
+        if has_binder and has_dotbinder:
+            raise RuntimeError(
+                "The repository contains both a 'binder' and a '.binder' "
+                "directory. However they are exclusive."
+            )
+
+        if has_dotbinder:
+            return ".binder"
+        elif has_binder:
+            return "binder"
+        else:
+            return ""
+
+    def ignore_patterns(self, binder_dir=""):
+        """Return the patterns of the .dockerignore/.containerignore files
+
+        The ignore files are looked up in `binder_dir`.
+        """
+        patterns = []
+        for ignore_file_name in IGNORE_FILES:
+            ignore_file_name = os.path.join(binder_dir, ignore_file_name)
+            if self.exists(ignore_file_name):
+                with open(os.path.join(self.root, ignore_file_name)) as ignore_file:
+                    cleaned_lines = [
+                        line.strip() for line in ignore_file.read().splitlines()
+                    ]
+                    patterns.extend(
+                        [
+                            line
+                            for line in cleaned_lines
+                            if line != "" and line[0] != "#"
+                        ]
+                    )
+        return patterns
+
+    def exclude_paths(self, patterns, dockerfile="Dockerfile"):
+        """
+        Return the set of paths that are not excluded by .dockerignore patterns
+
+        Gives the same result as `docker.utils.build.exclude_paths` without
+        walking the filesystem again.
+        """
+        pm = PatternMatcher(list(patterns) + [f"!{dockerfile}"])
+        exclusions = [p.cleaned_pattern for p in pm.patterns if p.exclusion]
+        if len(exclusions) == len(pm.patterns):
+            # only "!pattern"s, which can't exclude anything
+            return set(self._entries)
+
+        paths = set()
+        # directories that were excluded and whose contents we skip
+        skipped = set()
+        for path, entry in self._entries.items():
+            if os.path.dirname(path) in skipped:
+                if entry.is_dir:
+                    skipped.add(path)
+                continue
+
+            match = pm.matches(path)
+            if not match:
+                paths.add(path)
+            elif entry.is_dir and not entry.is_link:
+                # Only skip the contents of an excluded directory if there is
+                # no exclusion pattern (e.g. !dir/file) that starts with it
+                if not any(p.startswith(normalize_slashes(path)) for p in exclusions):
+                    skipped.add(path)
+        return paths
+
+    def content_digest(self, paths, stat_cache=None):
+        """
+        Return a digest of the paths, their types, modes and contents
+
+        Every regular file is hashed on its own and the digests of all paths
+        are then combined into a single digest. If a StatCache is given it is
+        used to avoid re-reading files that have not changed.
+        """
+        h = hashlib.sha256()
+        for path in sorted(paths):
+            full_path = os.path.join(self.root, path)
+            st = os.lstat(full_path)
+            if stat.S_ISREG(st.st_mode):
+                if stat_cache is not None:
+                    digest = stat_cache.digest(full_path, st)
+                else:
+                    digest = _file_digest(full_path)
+            elif stat.S_ISLNK(st.st_mode):
+                digest = hashlib.sha256(os.fsencode(os.readlink(full_path))).hexdigest()
+            else:
+                digest = ""
+            h.update(os.fsencode(path))
+            h.update(f"\0{st.st_mode:o}\0{digest}\n".encode())
+        return h.hexdigest()
@@ -1,13 +1,18 @@
+import contextvars
 import os
 import platform
 import re
 import socket
 import subprocess
+import tempfile
+import threading
+import time
 import warnings
+import weakref
 from contextlib import contextmanager
 from enum import Enum
 from functools import partial
-from shutil import copy2, copystat
+from shutil import copy2, copyfileobj, copystat, move, rmtree
 
 import charset_normalizer
 from traitlets import Integer, TraitError
@@ -28,50 +33,205 @@ class R2dState(Enum):
         return self.value
 
 
-def execute_cmd(cmd, capture=False, **kwargs):
+class Timings:
+    """
+    Durations of the steps of a build, measured with a monotonic clock
+
+    Each step belongs to one of the phases in R2dState. If a logger is given,
+    every duration is also logged as an event with `phase`, `step` and
+    `duration` (in seconds) fields.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        # list of (phase, step, seconds) tuples, in the order steps finished
+        self.durations = []
+
+    @contextmanager
+    def timed(self, phase, step):
+        """Time the block as `step` of `phase`"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.durations.append((str(phase), step, duration))
+            if self.log is not None:
+                self.log.info(
+                    f"{step} took {duration:.1f}s\n",
+                    extra=dict(phase=phase, step=step, duration=round(duration, 3)),
+                )
+
+    def summary(self):
+        """Return a one line summary of the durations"""
+        steps = ", ".join(f"{step} {d:.1f}s" for _, step, d in self.durations)
+        return f"Time spent per step: {steps}\n"
+
+    def write_textfile(self, path):
+        """Write the durations to path in the Prometheus text format
+
+        The file is replaced atomically so that a collector, like the textfile
+        collector of the Prometheus node exporter, never reads a partial file.
+        """
+
+        def escape(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        totals = {}
+        for phase, step, duration in self.durations:
+            totals[(phase, step)] = totals.get((phase, step), 0) + duration
+        lines = [
+            "# HELP repo2docker_step_duration_seconds Duration of the steps of the last build",
+            "# TYPE repo2docker_step_duration_seconds gauge",
+        ]
+        for (phase, step), duration in totals.items():
+            lines.append(
+                "repo2docker_step_duration_seconds"
+                f'{{phase="{escape(phase)}",step="{escape(step)}"}} {duration:.6f}'
+            )
+        lines += [
+            "# HELP repo2docker_last_build_timestamp_seconds When the last build finished",
+            "# TYPE repo2docker_last_build_timestamp_seconds gauge",
+            f"repo2docker_last_build_timestamp_seconds {time.time():.3f}",
+        ]
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".r2d-metrics-", dir=dirname)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+# A line ends at `\n`, at `\r\n`, or at a `\r` that is not followed by `\n`.
+# A trailing `\r` is only a line ending once we know what comes after it.
+_LINE_END = re.compile(rb"\r\n|\n|\r(?=[^\n])")
+
+
+def _iter_lines(stream, chunk_size=65536):
+    """Iterate over the lines of a binary stream
+
+    This should behave the same as .readline(), but splits on `\r` OR `\n`,
+    not just `\n`. The stream is read in chunks of whatever is available,
+    up to chunk_size bytes, rather than byte by byte.
+    """
+    read = getattr(stream, "read1", stream.read)
+    buf = bytearray()
+    for chunk in iter(partial(read, chunk_size), b""):
+        yield from _split_lines(buf, chunk)
+    if buf:
+        yield bytes(buf)
+
+
+def _split_lines(buf, chunk):
+    """Append chunk to buf, remove the complete lines from buf and return them"""
+    # everything but a trailing `\r` in buf has already been scanned
+    scan_from = max(len(buf) - 1, 0)
+    buf += chunk
+    lines = []
+    start = 0
+    for m in _LINE_END.finditer(buf, scan_from):
+        lines.append(bytes(buf[start : m.end()]))
+        start = m.end()
+    del buf[:start]
+    return lines
+
+
+def _feed_stdin(fileobj, stdin):
+    """Copy the contents of fileobj to a subprocess' stdin and close it"""
+    try:
+        copyfileobj(fileobj, stdin)
+    except BrokenPipeError:
+        # the process exited early, its exit code tells us what happened
+        pass
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+class ProcessGroup:
+    """
+    The commands a build runs with execute_cmd, so that they can be killed
+
+    `execute_cmd` adds its processes to the group in `process_group`, if
+    there is one in the current context. Once the group is killed the
+    commands that are started later are killed right away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # killing a process that has exited does nothing, they are only
+        # kept around as long as execute_cmd needs them
+        self._procs = weakref.WeakSet()
+        self.killed = False
+
+    def add(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+            if self.killed:
+                proc.kill()
+
+    def kill(self):
+        with self._lock:
+            self.killed = True
+            for proc in list(self._procs):
+                proc.kill()
+
+
+process_group = contextvars.ContextVar("repo2docker_process_group", default=None)
+
+
+def execute_cmd(cmd, capture=False, input_fileobj=None, **kwargs):
     """
     Call given command, yielding output line by line if capture=True.
 
+    If input_fileobj is given its contents are streamed to the command's
+    stdin from a background thread.
+
     Must be yielded from.
     """
     if capture:
         kwargs["stdout"] = subprocess.PIPE
         kwargs["stderr"] = subprocess.STDOUT
+    if input_fileobj is not None:
+        kwargs["stdin"] = subprocess.PIPE
 
     proc = subprocess.Popen(cmd, **kwargs)
+    group = process_group.get()
+    if group is not None:
+        group.add(proc)
+
+    feeder = None
+    if input_fileobj is not None:
+        feeder = threading.Thread(
+            target=_feed_stdin, args=(input_fileobj, proc.stdin), daemon=True
+        )
+        feeder.start()
 
     if not capture:
         # not capturing output, let subprocesses talk directly to terminal
         ret = proc.wait()
+        if feeder is not None:
+            feeder.join()
         if ret != 0:
             raise subprocess.CalledProcessError(ret, cmd)
         return
 
     # Capture output for logging.
     # Each line will be yielded as text.
-    # This should behave the same as .readline(), but splits on `\r` OR `\n`,
-    # not just `\n`.
-    buf = []
-
-    def flush():
-        """Flush next line of the buffer"""
-        line = b"".join(buf).decode("utf8", "replace")
-        buf[:] = []
-        return line
-
-    c_last = ""
     try:
-        for c in iter(partial(proc.stdout.read, 1), b""):
-            if c_last == b"\r" and buf and c != b"\n":
-                yield flush()
-            buf.append(c)
-            if c == b"\n":
-                yield flush()
-            c_last = c
-        if buf:
-            yield flush()
+        for line in _iter_lines(proc.stdout):
+            yield line.decode("utf8", "replace")
     finally:
         ret = proc.wait()
+        if feeder is not None:
+            feeder.join()
         if ret != 0:
             raise subprocess.CalledProcessError(ret, cmd)
 
@@ -322,17 +482,16 @@ def check_ref(ref, cwd=None):
         ref.split("/")[-1],
     ]  # In case partial commit w/ remote
 
-    hash = None
     for i_ref in refs:
         call = ["git", "rev-parse", "--quiet", i_ref]
         try:
             # If success, output will be <hash>
             response = subprocess.check_output(call, stderr=subprocess.DEVNULL, cwd=cwd)
-            hash = response.decode().strip()
+            return response.decode().strip()
         except Exception:
             # We'll throw an error later if no refs resolve
             pass
-    return hash
+    return None
 
 
 class Error(OSError):
@@ -428,6 +587,29 @@ def copytree(
     return dst
 
 
+def flatten_dir(parent, name):
+    """Move the contents of the directory `parent/name` up into `parent`
+
+    Entries are renamed rather than copied, so no data is copied unless they
+    are on a different filesystem. Entries of `parent` that have the same
+    name as an entry that is moved up are replaced. The then empty directory
+    `parent/name` is removed.
+    """
+    # move the directory out of the way first as it might contain an entry
+    # that is called `name` as well
+    tmp = tempfile.mkdtemp(prefix=".flatten-", dir=parent)
+    src = move(os.path.join(parent, name), os.path.join(tmp, name))
+    for entry in os.listdir(src):
+        dst = os.path.join(parent, entry)
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            rmtree(dst)
+        elif os.path.lexists(dst):
+            os.remove(dst)
+        move(os.path.join(src, entry), dst)
+    os.rmdir(src)
+    os.rmdir(tmp)
+
+
 def deep_get(dikt, path):
     """Get a value located in `path` from a nested dictionary.
 
@@ -540,6 +722,28 @@ def get_platform():
         return "linux/amd64"
 
 
+def get_cache_dir(*parts):
+    """Return a path inside repo2docker's cache directory
+
+    The cache lives in `$XDG_CACHE_HOME/repo2docker`, `~/.cache/repo2docker`
+    if XDG_CACHE_HOME is not set. The directory is not created.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "repo2docker", *parts)
+
+
+def dir_size(path):
+    """Return the total size in bytes of the files in a directory"""
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
 def get_free_port():
     """
     Hacky method to get a free random port on local host
@@ -29,6 +29,7 @@ import yaml
 
 import docker
 from repo2docker.__main__ import make_r2d
+from repo2docker.contentproviders.doi import DoiCache, DoiProvider
 
 TESTS_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -111,6 +112,14 @@ def run_repo2docker():
     return run_test
 
 
+@pytest.fixture(autouse=True)
+def doi_cache(monkeypatch):
+    """Don't share DOI resolutions between tests"""
+    cache = DoiCache()
+    monkeypatch.setattr(DoiProvider, "doi_cache", cache)
+    return cache
+
+
 @pytest.fixture()
 def base_image():
     """
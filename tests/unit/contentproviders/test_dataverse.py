@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from repo2docker.contentproviders import Dataverse
+
+INSTALLATIONS = {
+    "installations": [
+        {"name": "Harvard Dataverse", "hostname": "dataverse.harvard.edu"},
+        {"name": "CIMMYT Research Data", "hostname": "data.cimmyt.org"},
+    ]
+}
+
+
+@pytest.fixture
+def installations(requests_mock, tmpdir, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+    # the installations are shared between instances
+    monkeypatch.setattr(Dataverse, "hosts", None)
+    monkeypatch.setattr(Dataverse, "hosts_by_name", None)
+    monkeypatch.setattr(Dataverse, "hosts_loaded", None)
+    return requests_mock.get(
+        Dataverse.dataverse_installations_url,
+        json=INSTALLATIONS,
+        headers={"ETag": '"v1"'},
+    )
+
+
+def test_detect_without_network(installations):
+    url = "https://dataverse.harvard.edu/api/access/datafile/3323458"
+    assert Dataverse().detect(url) == url
+    assert Dataverse().detect("https://example.com/path/here") is None
+    # not a URL, the installations aren't needed
+    assert Dataverse().detect("/some/random/string") is None
+    assert installations.call_count == 1
+
+
+def test_installations_reloaded(installations, requests_mock, monkeypatch):
+    dv = Dataverse()
+    dv.load_hosts()
+    dv.load_hosts()
+    assert installations.call_count == 1
+
+    # a long running process reloads the list once it is stale
+    later = time.time() + Dataverse.installations_ttl + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    requests_mock.get(
+        Dataverse.dataverse_installations_url,
+        json={"installations": [{"name": "New", "hostname": "new.example.org"}]},
+    )
+    Dataverse().load_hosts()
+    assert "new.example.org" in dv.hosts_by_name
+    assert "dataverse.harvard.edu" not in dv.hosts_by_name
+
+
+def test_installations_cached_on_disk(installations, requests_mock, monkeypatch):
+    Dataverse().load_hosts()
+    assert installations.call_count == 1
+
+    # a new process reuses the cached list
+    monkeypatch.setattr(Dataverse, "hosts", None)
+    dv = Dataverse()
+    dv.load_hosts()
+    assert installations.call_count == 1
+    assert dv.hosts_by_name["data.cimmyt.org"]["name"] == "CIMMYT Research Data"
+
+    # once the list is stale it is revalidated with its ETag
+    monkeypatch.setattr(Dataverse, "hosts", None)
+    later = time.time() + Dataverse.installations_ttl + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    not_modified = requests_mock.get(
+        Dataverse.dataverse_installations_url,
+        request_headers={"If-None-Match": '"v1"'},
+        status_code=304,
+    )
+    dv = Dataverse()
+    dv.load_hosts()
+    assert not_modified.call_count == 1
+    assert "dataverse.harvard.edu" in dv.hosts_by_name
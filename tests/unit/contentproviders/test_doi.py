@@ -3,15 +3,19 @@ import logging
 import os
 import re
 import tempfile
+import threading
+import time
 import urllib
+from collections import Counter
 from unittest.mock import MagicMock, mock_open, patch
 from zipfile import ZipFile
 
 import pytest
 
 from repo2docker import __version__
+from repo2docker.contentproviders import Figshare, Zenodo
 from repo2docker.contentproviders.base import ContentProviderException
-from repo2docker.contentproviders.doi import DoiProvider
+from repo2docker.contentproviders.doi import DoiCache, DoiProvider
 
 
 def test_content_id():
@@ -41,3 +45,108 @@ def test_url_headers(requests_mock):
 def test_doi2url(requested_doi, expected):
     doi = DoiProvider()
     assert doi.doi2url(requested_doi) == expected
+
+
+def test_doi_resolved_once(requests_mock):
+    handle = requests_mock.get(
+        "https://doi.org/api/handles/10.5281/zenodo.3242074",
+        json={
+            "values": [
+                {"type": "URL", "data": {"value": "https://zenodo.org/record/1"}}
+            ]
+        },
+    )
+
+    for provider in [Zenodo(), Figshare(), DoiProvider()]:
+        assert provider.doi2url("doi:10.5281/zenodo.3242074") == (
+            "https://zenodo.org/record/1"
+        )
+    assert handle.call_count == 1
+
+
+def test_doi_cache_on_disk(tmpdir, monkeypatch):
+    path = str(tmpdir.join("cache", "doi.json"))
+    DoiCache(path, ttl=60).set("10.1/1", "https://example.org/1")
+    DoiCache(path, ttl=60).set("10.1/2", None)
+
+    cache = DoiCache(path, ttl=60)
+    assert cache.get("10.1/1") == (True, "https://example.org/1")
+    # failures are not kept on disk
+    assert cache.get("10.1/2") == (False, None)
+    assert cache.get("10.1/3") == (False, None)
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert DoiCache(path, ttl=60).get("10.1/1") == (False, None)
+
+
+def test_doi_cache_ttl_per_provider(tmpdir, requests_mock, monkeypatch):
+    handle = requests_mock.get(
+        "https://doi.org/api/handles/10.1/1",
+        json={"values": [{"type": "URL", "data": {"value": "https://example.org"}}]},
+    )
+    path = str(tmpdir.join("doi.json"))
+    monkeypatch.setattr(DoiProvider, "doi_cache", DoiCache(path))
+
+    doi = DoiProvider()
+    doi.doi_cache_ttl = 60
+    assert doi.doi2url("10.1/1") == "https://example.org"
+    # the ttl of the provider doesn't change the shared cache
+    assert DoiProvider.doi_cache.ttl == 0
+    assert DoiCache(path).get("10.1/1", ttl=60) == (True, "https://example.org")
+    # without a ttl the resolution on disk isn't used
+    assert DoiCache(path).get("10.1/1") == (False, None)
+    assert handle.call_count == 1
+
+
+def test_doi_failure_expires(requests_mock, monkeypatch):
+    handle = requests_mock.get("https://doi.org/api/handles/10.1/new", status_code=404)
+    doi = DoiProvider()
+    assert doi.doi2url("10.1/new") == "10.1/new"
+    assert doi.doi2url("10.1/new") == "10.1/new"
+    assert handle.call_count == 1
+
+    # the DOI was minted in the meantime
+    requests_mock.get(
+        "https://doi.org/api/handles/10.1/new",
+        json={"values": [{"type": "URL", "data": {"value": "https://example.org"}}]},
+    )
+    later = time.time() + DoiCache.failure_ttl + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert doi.doi2url("10.1/new") == "https://example.org"
+
+
+def test_fetch_files_concurrently(monkeypatch):
+    doi = DoiProvider()
+    doi.max_downloads = 4
+    doi.max_downloads_per_host = 2
+    host = {"download": "url", "filename": "name"}
+    file_refs = [
+        {"url": f"https://host{i % 2}.example.org/{i}", "name": str(i)}
+        for i in range(8)
+    ]
+
+    lock = threading.Lock()
+    active = Counter()
+    max_active = Counter()
+
+    def fetch_file(file_ref, host, output_dir, unzip=False):
+        netloc = file_ref["url"].split("/")[2]
+        with lock:
+            active[netloc] += 1
+            max_active[netloc] = max(max_active[netloc], active[netloc])
+        # later files finish first
+        time.sleep(0.01 * (8 - int(file_ref["name"])))
+        with lock:
+            active[netloc] -= 1
+        yield f"Fetching {file_ref['name']}\n"
+        yield f"Fetched {file_ref['name']}\n"
+
+    monkeypatch.setattr(doi, "fetch_file", fetch_file)
+    output = list(doi.fetch_files(file_refs, host, "/tmp"))
+
+    # log messages are in the order of the files, and not interleaved
+    assert output == [
+        line for i in range(8) for line in [f"Fetching {i}\n", f"Fetched {i}\n"]
+    ]
+    assert max_active == {"host0.example.org": 2, "host1.example.org": 2}
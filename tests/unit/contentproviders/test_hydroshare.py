@@ -84,11 +84,13 @@ def test_detect_hydroshare():
 
 
 @contextmanager
-def hydroshare_archive(prefix="123456789/data/contents"):
+def hydroshare_archive(prefix="123456789/data/contents", extra_files=()):
     with NamedTemporaryFile(suffix=".zip") as zfile:
         with ZipFile(zfile.name, mode="w") as zip:
             zip.writestr(f"{prefix}/some-file.txt", "some content")
             zip.writestr(f"{prefix}/some-other-file.txt", "some more content")
+            for name in extra_files:
+                zip.writestr(name, "extra")
 
         yield zfile
 
@@ -195,3 +197,42 @@ def test_fetch_bag_timeout():
                     # loop for yield statements
                     for l in hydro.fetch(spec, d, timeout=0):
                         pass
+
+
+def test_fetch_bag_only_contents(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    extra_files = [
+        "123456789/data/contents/sub/nested.txt",
+        "123456789/data/resourcemetadata.xml",
+        "123456789/bagit.txt",
+    ]
+    with hydroshare_archive(extra_files=extra_files) as hydro_path:
+        with (
+            patch.object(
+                Hydroshare,
+                "urlopen",
+                side_effect=[
+                    MockResponse("https://s3.hydroshare.org/bags/123456789.zip", 200)
+                ],
+            ),
+            patch.object(Hydroshare, "_urlretrieve", side_effect=[(hydro_path, None)]),
+        ):
+            hydro = Hydroshare()
+            spec = {
+                "host": {
+                    "django_s3": "https://www.hydroshare.org/django_s3/download/bags/"
+                },
+                "resource": "123456789",
+            }
+            output_dir = tmpdir.mkdir("output")
+            for _ in hydro.fetch(spec, str(output_dir)):
+                pass
+
+    assert set(os.listdir(output_dir)) == {
+        "some-file.txt",
+        "some-other-file.txt",
+        "sub",
+    }
+    assert os.listdir(output_dir.join("sub")) == ["nested.txt"]
+    # nothing is left behind in the working directory
+    assert os.listdir(tmpdir) == ["output"]
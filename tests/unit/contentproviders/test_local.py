@@ -1,6 +1,10 @@
 import os
 from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest.mock import patch
 
+import pytest
+
+from repo2docker import repoindex
 from repo2docker.contentproviders import Local
 
 
@@ -25,8 +29,7 @@ def test_not_detect_local_file():
 
 
 def test_content_id_is_None():
-    # content_id property should always be None for local content provider
-    # as we rely on the caching done by docker
+    # content_id is only known once the content has been "fetched"
     local = Local()
     assert local.content_id is None
 
@@ -43,6 +46,89 @@ def test_content_available():
         for _ in local.fetch(spec, d):
             pass
         assert os.path.exists(os.path.join(d, "test"))
-        # content_id property should always be None for local content provider
-        # as we rely on the caching done by docker
-        assert local.content_id is None
+        assert local.content_id is not None
+
+
+@pytest.fixture
+def cache_home(tmpdir, monkeypatch):
+    cache_home = tmpdir.mkdir("cache")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    return cache_home
+
+
+def _content_id(path, subdir=""):
+    local = Local()
+    local.subdir = subdir
+    for _ in local.fetch({"path": path}, path):
+        pass
+    return local.content_id
+
+
+def test_content_id_follows_build_context(tmpdir, cache_home):
+    repo = tmpdir.mkdir("repo")
+    repo.join("data.csv").write("1,2,3")
+    repo.join("scratch.log").write("noise")
+    repo.join(".dockerignore").write("*.log\n")
+
+    content_id = _content_id(str(repo))
+    assert content_id == _content_id(str(repo))
+
+    # ignored files are not part of the build context
+    repo.join("scratch.log").write("more noise")
+    assert _content_id(str(repo)) == content_id
+
+    repo.join("data.csv").write("4,5,6")
+    assert _content_id(str(repo)) != content_id
+
+    # only the subdirectory being built counts
+    sub = repo.mkdir("sub")
+    sub.join("file").write("a")
+    sub_id = _content_id(str(repo), "sub")
+    repo.join("data.csv").write("7,8,9")
+    assert _content_id(str(repo), "sub") == sub_id
+
+
+def test_content_id_uses_stat_cache(tmpdir, cache_home, monkeypatch):
+    repo = tmpdir.mkdir("repo")
+    repo.join("big").write("x" * 1000)
+    # the file was just written, don't consider it racily modified
+    monkeypatch.setattr(repoindex, "_RACY_NS", -1)
+
+    with patch.object(
+        repoindex, "_file_digest", wraps=repoindex._file_digest
+    ) as file_digest:
+        content_id = _content_id(str(repo))
+        assert file_digest.call_count == 1
+        assert _content_id(str(repo)) == content_id
+        assert file_digest.call_count == 1
+
+
+def test_content_id_git_dir(tmpdir, cache_home):
+    repo = tmpdir.mkdir("repo")
+    repo.join("data.csv").write("1,2,3")
+    repo.join(".git", "HEAD").write("a", ensure=True)
+
+    # the .git directory is part of the build context
+    content_id = _content_id(str(repo))
+    repo.join(".git", "HEAD").write("b")
+    assert _content_id(str(repo)) != content_id
+
+    # unless it is ignored
+    repo.join(".dockerignore").write(".git\n")
+    content_id = _content_id(str(repo))
+    repo.join(".git", "HEAD").write("c")
+    assert _content_id(str(repo)) == content_id
+
+
+def test_content_id_binder_dir(tmpdir, cache_home):
+    repo = tmpdir.mkdir("repo")
+    repo.join("data.csv").write("1,2,3")
+    repo.join(".binder", ".dockerignore").write("data.csv\n", ensure=True)
+
+    content_id = _content_id(str(repo))
+    repo.join("data.csv").write("4,5,6")
+    assert _content_id(str(repo)) == content_id
+
+    # the build fails with both binder/ and .binder/, so there is no content_id
+    repo.join("binder", "requirements.txt").write("", ensure=True)
+    assert _content_id(str(repo)) is None
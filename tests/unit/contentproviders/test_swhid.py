@@ -90,6 +90,7 @@ def mocked_provider(tmpdir, dirhash, tarfile_buf):
     adapter = requests_mock.Adapter()
     provider.base_url = "mock://api/1"
     provider.retry_delay = 0.1
+    provider.poll_delay = 0.1
     provider.session.mount("mock://", adapter)
 
     adapter.register_uri(
@@ -147,6 +148,16 @@ def test_fetch_directory(tmpdir, gen_tarfile):
     dir_id, tarfile_buf = gen_tarfile
     provider = mocked_provider(tmpdir, dir_id, tarfile_buf)
     swhid = "swh:1:dir:" + dir_id
-    for log in provider.fetch(provider.detect(swhid), tmpdir):
-        print(log)
+    output = list(provider.fetch(provider.detect(swhid), tmpdir))
     assert provider.content_id == swhid
+    assert os.listdir(tmpdir) == ["file1.txt"]
+    assert any(line.startswith("Waited ") and "MB/s" in line for line in output)
+
+
+def test_poll_delays():
+    provider = Swhid()
+    provider.poll_delay = 1
+    provider.max_poll_delay = 4
+    delays = provider._poll_delays()
+    for limit in [1, 2, 4, 4, 4]:
+        assert limit / 2 <= next(delays) <= limit
@@ -49,6 +49,26 @@ def test_local_dir_image_name(repo_with_content):
     )
 
 
+def test_local_dir_image_name_follows_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "requirements.txt").write_text("numpy\n")
+
+    def image_name(**kwargs):
+        kwargs.setdefault("user_id", 1000)
+        app = Repo2Docker(repo=str(repo), **kwargs)
+        app.fetch(str(repo), "", str(repo))
+        return app.output_image_spec
+
+    name = image_name()
+    assert name == image_name()
+    # an image built from the same content in a different way isn't reused
+    assert image_name(user_id=1001) != name
+    assert image_name(base_image="ubuntu:noble") != name
+    assert image_name(extra_build_args={"KEY": "value"}) != name
+
+
 def test_extra_buildx_build_args(repo_with_content):
     upstream, sha1 = repo_with_content
     argv = ["--DockerEngine.extra_buildx_build_args=--check", upstream]
@@ -90,3 +110,79 @@ def test_no_default(tmp_path, capsys):
         app.build()
     captured = capsys.readouterr()
     assert "No environment specification found" in captured.err
+
+
+def test_metrics_textfile(tmp_path):
+    (tmp_path / "requirements.txt").write_text("numpy\n")
+    metrics = tmp_path / "metrics" / "repo2docker.prom"
+    metrics.parent.mkdir()
+    argv = [
+        "--no-build",
+        "--user-id=1000",
+        f"--Repo2Docker.metrics_textfile={metrics}",
+        str(tmp_path),
+    ]
+    app = make_r2d(argv)
+    app.build()
+
+    steps = [step for _, step, _ in app.timings.durations]
+    assert steps == ["fetch", "find image", "detect", "render"]
+    text = metrics.read_text()
+    assert 'repo2docker_step_duration_seconds{phase="fetching",step="fetch"} ' in text
+    assert "repo2docker_last_build_timestamp_seconds " in text
+    assert os.listdir(metrics.parent) == ["repo2docker.prom"]
+
+    # starting the container is added to the timings of the build
+    with (
+        patch.object(Repo2Docker, "start_container"),
+        patch.object(Repo2Docker, "wait_for_container"),
+    ):
+        app.run_image()
+    steps = [step for _, step, _ in app.timings.durations]
+    assert steps == ["fetch", "find image", "detect", "render", "start container"]
+    text = metrics.read_text()
+    assert (
+        'repo2docker_step_duration_seconds{phase="running",step="start container"} '
+        in text
+    )
+
+
+def test_find_image_in_registry_when_pushing():
+    app = Repo2Docker(push=True, output_image_spec="quay.io/org/img:abc")
+    with patch.object(app, "get_engine") as get_engine:
+        engine = get_engine.return_value
+        engine.image_in_registry.return_value = True
+        assert app.find_image()
+    engine.image_in_registry.assert_called_once_with("quay.io/org/img:abc")
+    engine.inspect_image.assert_not_called()
+
+
+def test_system_image_dry_run(tmp_path, capsys):
+    (tmp_path / "requirements.txt").write_text("numpy\n")
+    argv = [
+        "--no-build",
+        "--user-id=1000",
+        "--Repo2Docker.system_image_repository=r2d-system",
+        str(tmp_path),
+    ]
+    app = make_r2d(argv)
+    app.build()
+    dockerfile = capsys.readouterr().out
+    assert dockerfile.lstrip().startswith("FROM r2d-system:")
+    assert "locale-gen" not in dockerfile
+
+
+def test_environment_image_dry_run(tmp_path, capsys):
+    (tmp_path / "requirements.txt").write_text("numpy\n")
+    argv = [
+        "--no-build",
+        "--user-id=1000",
+        "--Repo2Docker.environment_image_repository=r2d-env",
+        str(tmp_path),
+    ]
+    app = make_r2d(argv)
+    app.build()
+    dockerfile = capsys.readouterr().out
+    assert dockerfile.lstrip().startswith("FROM r2d-env:")
+    assert "install-base-env.bash" not in dockerfile
+    assert "requirements.txt" in dockerfile
@@ -0,0 +1,83 @@
+"""
+Tests for repo2docker/asyncbuild.py
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from repo2docker.app import Repo2Docker
+
+
+def _build(r2d, events=None):
+    events = [] if events is None else events
+
+    async def collect():
+        async for event in r2d.build_async():
+            events.append(event)
+        return events
+
+    return asyncio.run(collect())
+
+
+def test_build_async_dry_run(tmpdir):
+    tmpdir.join("requirements.txt").write("numpy\n")
+    r2d = Repo2Docker(repo=str(tmpdir), dry_run=True, user_id=1000)
+    events = _build(r2d)
+
+    assert {"message": "Picked Local content provider.\n"}.items() <= events[0].items()
+    assert {
+        "message": f"Using local repo {tmpdir}.\n",
+        "phase": "fetching",
+    }.items() <= events[1].items()
+    steps = [event["step"] for event in events if "step" in event]
+    assert steps == ["fetch", "find image", "detect", "render"]
+
+    assert r2d.output_image_spec
+    assert events[-1]["message"] == f"Finished building {r2d.output_image_spec}\n"
+    assert events[-1]["image"] == r2d.output_image_spec
+
+
+def test_build_async_concurrent(tmpdir):
+    python_repo = tmpdir.mkdir("python")
+    python_repo.join("requirements.txt").write("numpy\n")
+    conda_repo = tmpdir.mkdir("conda")
+    conda_repo.join("environment.yml").write("dependencies: [numpy]\n")
+
+    async def collect(r2d):
+        return [event async for event in r2d.build_async()]
+
+    async def build_both():
+        return await asyncio.gather(
+            *(
+                collect(Repo2Docker(repo=str(repo), dry_run=True, user_id=1000))
+                for repo in (python_repo, conda_repo)
+            )
+        )
+
+    cwd = os.getcwd()
+    python_events, conda_events = asyncio.run(build_both())
+
+    # every build only gets the events of its own repository
+    python_messages = "".join(event["message"] for event in python_events)
+    conda_messages = "".join(event["message"] for event in conda_events)
+    assert str(python_repo) in python_messages
+    assert str(conda_repo) not in python_messages
+    assert str(conda_repo) in conda_messages
+    assert str(python_repo) not in conda_messages
+    # the builds don't change the working directory of the process
+    assert os.getcwd() == cwd
+
+
+def test_build_async_failure(tmpdir):
+    r2d = Repo2Docker(repo=str(tmpdir), subdir="does-not-exist", dry_run=True)
+    events = []
+    with pytest.raises(FileNotFoundError):
+        _build(r2d, events)
+    assert {
+        "message": "Subdirectory does-not-exist does not exist",
+        "phase": "failed",
+    }.items() <= events[-2].items()
+    # the summary of the timings is logged anyway
+    assert events[-1]["message"].startswith("Time spent per step: fetch")
@@ -0,0 +1,65 @@
+"""
+Tests for repo2docker/batch.py
+"""
+
+import json
+import os
+
+import pytest
+
+from repo2docker import batch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_load_reproductions_manifest():
+    path = os.path.join(HERE, "..", "external", "reproductions.repos.yaml")
+    repos = batch.load_manifest(path)
+    assert repos[0] == {
+        "name": "LIGO Gravitational Waves",
+        "url": "https://github.com/minrk/ligo-binder/",
+        "ref": "origin/b8259dac9eb",
+    }
+
+
+def test_load_manifest_needs_url(tmpdir):
+    manifest = tmpdir.join("manifest.yaml")
+    manifest.write("- name: no url\n")
+    with pytest.raises(ValueError):
+        batch.load_manifest(str(manifest))
+
+
+def test_batch_dry_run(tmpdir, capfd):
+    for name in ["repo-a", "repo-b"]:
+        tmpdir.join(name, "requirements.txt").write("numpy\n", ensure=True)
+    manifest = tmpdir.join("manifest.yaml")
+    manifest.write(f"""
+- name: a
+  url: {tmpdir.join("repo-a")}
+- url: {tmpdir.join("repo-b")}
+- name: missing
+  url: {tmpdir.join("does-not-exist")}
+""")
+    summary = tmpdir.join("summary.json")
+
+    with pytest.raises(SystemExit) as e:
+        batch.main(
+            [
+                str(manifest),
+                "--jobs=2",
+                f"--summary={summary}",
+                "--Repo2Docker.dry_run=True",
+            ]
+        )
+    # one of the builds failed
+    assert e.value.code == 1
+
+    results = json.loads(summary.read())
+    assert [r["name"] for r in results] == ["a", str(tmpdir.join("repo-b")), "missing"]
+    assert [r["status"] for r in results] == ["success", "success", "failed"]
+    assert results[0]["image"]
+    assert results[2]["error"]
+
+    # log lines say which repository they belong to
+    logs = capfd.readouterr().err.splitlines()
+    assert "[a] Picked Local content provider." in logs
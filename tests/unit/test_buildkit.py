@@ -0,0 +1,115 @@
+"""
+Tests for repo2docker/buildkit.py
+"""
+
+from repo2docker.buildkit import BuildKitProgress
+
+OUTPUT = """\
+#0 building with "default" instance using docker driver
+
+#1 [internal] load build definition from Dockerfile
+#1 transferring dockerfile: 2.34kB done
+#1 DONE 0.0s
+
+#2 [internal] load metadata for docker.io/library/buildpack-deps:24.04
+#2 DONE 0.5s
+
+#8 importing cache manifest from local:1234567890
+#8 DONE 0.4s
+
+#3 [internal] load build context
+#3 transferring context: 512.00kB 0.1s
+#3 transferring context: 1.25MB 0.2s done
+#3 DONE 0.2s
+
+#4 [ 1/3] FROM docker.io/library/buildpack-deps:24.04@sha256:0123
+#4 CACHED
+
+#5 [ 2/3] COPY --chown=1000:1000 src/requirements.txt ${REPO_DIR}/requirements.txt
+#5 CACHED
+
+#6 [ 3/3] RUN ${KERNEL_PYTHON_PREFIX}/bin/pip install -r "requirements.txt"
+#6 0.512 Collecting numpy
+#6 12.28 Successfully installed numpy-2.1.0
+#6 DONE 12.3s
+
+#7 [builder 2/2] RUN exit 1
+#7 0.101 failing
+#7 ERROR: process "/bin/sh -c exit 1" did not complete successfully: exit code: 1
+
+#9 exporting cache to client directory
+#9 preparing build cache for export
+#9 writing layer sha256:0123 0.1s done
+#9 DONE 1.5s
+"""
+
+
+def test_parse_plain_progress():
+    progress = BuildKitProgress()
+    events = [progress.feed(line + "\n") for line in OUTPUT.splitlines()]
+    events = [event for event in events if event is not None]
+
+    assert [e["vertex"] for e in events] == [1, 2, 8, 3, 4, 5, 6, 7, 9]
+    assert events[3]["transferred"] == 1250000
+    assert events[5]["step"] == "2/3"
+    assert events[5]["instruction"] == "COPY"
+    assert events[5]["status"] == "cached"
+    assert events[6]["status"] == "done"
+    assert events[6]["duration"] == 12.3
+    assert events[7]["stage"] == "builder"
+    assert events[7]["status"] == "error"
+
+    assert progress.summary() == {
+        "steps": 4,
+        "cached": 2,
+        "executed": 2,
+        "cache_hit_rate": 0.5,
+        "duration": 12.3,
+        "context_bytes": 1250000,
+        "cache_import_duration": 0.4,
+        "cache_export_duration": 1.5,
+    }
+
+
+def test_no_buildkit_output():
+    progress = BuildKitProgress()
+    assert progress.feed("Step 1/3 : FROM ubuntu\n") is None
+    assert progress.summary()["steps"] == 0
+
+
+# `docker buildx build -` with a tar build context on stdin
+STDIN_OUTPUT = """\
+#0 building with "default" instance using docker driver
+
+#1 [internal] load remote build context
+#1 DONE 0.1s
+
+#2 copy /context /
+#2 DONE 0.2s
+
+#3 [internal] load metadata for docker.io/library/buildpack-deps:24.04
+#3 DONE 0.4s
+
+#4 [1/2] FROM docker.io/library/buildpack-deps:24.04@sha256:0123
+#4 CACHED
+
+#5 [2/2] RUN echo hello
+#5 0.215 hello
+#5 DONE 0.3s
+"""
+
+
+def test_stdin_build_context():
+    progress = BuildKitProgress()
+    for line in STDIN_OUTPUT.splitlines():
+        progress.feed(line + "\n")
+
+    summary = progress.summary(sent_context_bytes=2048)
+    assert summary["steps"] == 2
+    assert summary["cached"] == 1
+    assert summary["context_bytes"] == 2048
+    # the size only applies to a build context loaded from stdin
+    progress = BuildKitProgress()
+    for line in OUTPUT.splitlines():
+        progress.feed(line + "\n")
+    assert progress.summary(sent_context_bytes=2048)["context_bytes"] == 1250000
@@ -1,14 +1,21 @@
+import os
+import re
+import tarfile
+import tempfile
 from datetime import date
 from os.path import join as pjoin
 from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
 
 import pytest
 
+import docker
 from repo2docker.buildpacks import (
     BaseImage,
     LegacyBinderDockerBuildPack,
     PythonBuildPack,
 )
+from repo2docker.repoindex import RepoIndex
 from repo2docker.utils import chdir
 
 
@@ -93,3 +100,183 @@ def test_invalid_runtime(tmpdir, runtime_txt, base_image):
 
     with pytest.raises(ValueError, match=r"^Invalid runtime.txt.*"):
         base.runtime
+
+
+def test_repo_outside_cwd(tmpdir, base_image):
+    repo = tmpdir.mkdir("repo")
+    repo.join("requirements.txt").write("numpy\n")
+    repo.join("runtime.txt").write("python-3.11\n")
+    tmpdir.mkdir("elsewhere").chdir()
+
+    bp = PythonBuildPack(base_image)
+    bp.platform = "linux/amd64"
+    bp.repo_index = RepoIndex(str(repo))
+    assert bp.detect()
+    assert bp.python_version == "3.11"
+    assert "requirements.txt" in bp.render({"NB_UID": "1000"})
+
+    fake_client = MagicMock(spec=docker.APIClient)
+    fake_client.build.side_effect = _fake_build
+    names = list(bp.build(fake_client, "image-2", 0, {}, [], {}))
+    assert "src/requirements.txt" in names
+
+
+@pytest.mark.parametrize("memory_limit, on_disk", [(0, False), (1024, True)])
+def test_build_context_spooled(tmpdir, base_image, memory_limit, on_disk):
+    tmpdir.chdir()
+    with open("data.bin", "wb") as f:
+        f.write(b"x" * 64 * 1024)
+
+    def fake_build(**kwargs):
+        with tarfile.open(fileobj=kwargs["fileobj"]) as tar:
+            names = tar.getnames()
+            dockerfile = tar.extractfile("Dockerfile").read().decode("utf-8")
+        assert dockerfile == bp.render()
+        assert "src/data.bin" in names
+        yield "done"
+
+    fake_client = MagicMock(spec=docker.APIClient)
+    fake_client.build.side_effect = fake_build
+
+    bp = BaseImage(base_image)
+    bp.build_context_memory_limit = memory_limit
+    # a context larger than the limit is written to a file on disk
+    with patch("tempfile.TemporaryFile", wraps=tempfile.TemporaryFile) as on_disk_file:
+        assert list(bp.build(fake_client, "image-2", 0, {}, [], {})) == ["done"]
+    assert on_disk_file.called == on_disk
+    assert fake_client.build.call_args.kwargs["fileobj"].closed
+
+
+def test_render_memoized(tmpdir, base_image):
+    tmpdir.chdir()
+    bp = BaseImage(base_image)
+    with patch.object(bp, "_render", wraps=bp._render) as render:
+        dockerfile = bp.render({"NB_UID": "1000"})
+        assert bp.render({"NB_UID": "1000"}) is dockerfile
+        assert render.call_count == 1
+
+        assert "--chown=1001:1001" in bp.render({"NB_UID": "1001"})
+        assert render.call_count == 2
+
+        bp.labels["label"] = "value"
+        assert 'LABEL label="value"' in bp.render({"NB_UID": "1000"})
+        assert render.call_count == 3
+
+
+def _fake_build(fileobj, **kwargs):
+    with tarfile.open(fileobj=fileobj) as tar:
+        return iter(tar.getnames())
+
+
+def test_render_with_system_image(tmpdir, base_image):
+    tmpdir.chdir()
+    bp = BaseImage(base_image)
+    build_args = {"NB_USER": "jovyan", "NB_UID": "1000"}
+    dockerfile = bp.render(build_args)
+    assert dockerfile.startswith(bp.render_system().strip(), 1)
+
+    spec = bp.system_image_spec("r2d-system", build_args)
+    assert spec.startswith("r2d-system:")
+    assert bp.system_image_spec("r2d-system", dict(build_args, NB_UID="1001")) != spec
+    bp.base_image = "buildpack-deps:noble"
+    assert bp.system_image_spec("r2d-system", build_args) != spec
+
+    bp.system_image = spec
+    with_system_image = bp.render(build_args)
+    assert with_system_image.startswith(f"\nFROM {spec}\n")
+    assert "locale-gen" not in with_system_image
+    # everything after the system layers is the same
+    assert dockerfile.split("rm -rf /var/lib/apt/lists/*\n", 3)[-1] in with_system_image
+
+    fake_client = MagicMock(spec=docker.APIClient)
+    fake_client.build.side_effect = _fake_build
+    assert list(bp.build_system_image(fake_client, spec, build_args, {})) == [
+        "Dockerfile"
+    ]
+
+
+def test_render_with_environment_image(tmpdir, base_image):
+    tmpdir.chdir()
+    build_args = {"NB_USER": "jovyan", "NB_UID": "1000"}
+    bp = PythonBuildPack(base_image)
+    bp.platform = "linux/amd64"
+    dockerfile = bp.render(build_args)
+    assert dockerfile.startswith(bp.render_environment(build_args).strip(), 1)
+
+    spec = bp.environment_image_spec("r2d-env", build_args)
+    assert spec.startswith("r2d-env:")
+    # the lockfile depends on the python version
+    tmpdir.join("runtime.txt").write("python-3.12")
+    other_bp = PythonBuildPack(base_image)
+    other_bp.platform = "linux/amd64"
+    assert other_bp.environment_image_spec("r2d-env", build_args) != spec
+    other_bp.platform = "linux/arm64"
+    assert other_bp.environment_image_spec("r2d-env", build_args) != spec
+
+    bp.environment_image = spec
+    with_env_image = bp.render(build_args)
+    assert with_env_image.startswith(f"\nFROM {spec}\n")
+    assert "install-base-env.bash" not in with_env_image
+    assert "# ensure root user after build scripts" in with_env_image
+
+    fake_client = MagicMock(spec=docker.APIClient)
+    fake_client.build.side_effect = _fake_build
+    names = list(bp.build_environment_image(fake_client, spec, build_args, {}))
+    assert "Dockerfile" in names
+    assert not any(name.startswith("src") for name in names)
+    assert any("lock" in name for name in names)
+
+
+def test_build_context_filename(tmpdir):
+    name, src_path = BaseImage.generate_build_context_filename(
+        "conda/activate-conda.sh"
+    )
+    assert re.fullmatch(
+        r"build_script_files/conda-2factivate-2dconda-2esh-[0-9a-f]{6}", name
+    )
+    assert os.path.isabs(src_path)
+
+    # files outside of repo2docker are named after their contents, not
+    # where they are
+    for d in ("a", "b"):
+        tmpdir.join(d, "script").write("echo hi", ensure=True)
+    a_name = BaseImage.generate_build_context_filename(str(tmpdir.join("a", "script")))
+    b_name = BaseImage.generate_build_context_filename(str(tmpdir.join("b", "script")))
+    assert a_name[0] == b_name[0]
+    assert a_name[0].startswith("build_script_files/script-")
+    tmpdir.join("b", "script").write("echo bye")
+    b_name = BaseImage.generate_build_context_filename(str(tmpdir.join("b", "script")))
+    assert a_name[0] != b_name[0]
+
+
+def test_render_with_cache_mounts(tmpdir, base_image):
+    tmpdir.chdir()
+    tmpdir.join("requirements.txt").write("numpy\n")
+    tmpdir.join("apt.txt").write("gfortran\n")
+    build_args = {"NB_USER": "jovyan", "NB_UID": "1000"}
+    bp = PythonBuildPack(base_image)
+    bp.platform = "linux/amd64"
+    dockerfile = bp.render(build_args)
+    assert "--mount=type=cache" not in dockerfile
+
+    bp = PythonBuildPack(base_image)
+    bp.platform = "linux/amd64"
+    bp.cache_mounts = True
+    with_cache_mounts = bp.render(build_args)
+    assert (
+        "RUN --mount=type=cache,id=repo2docker-pip-${NB_UID},"
+        "target=/var/cache/repo2docker/pip,uid=${NB_UID},gid=${NB_UID},sharing=shared \\\n"
+        "    ${KERNEL_PYTHON_PREFIX}/bin/pip install "
+        "--cache-dir=/var/cache/repo2docker/pip -r"
+    ) in with_cache_mounts
+    assert "--no-cache-dir" not in with_cache_mounts
+    assert "target=/var/cache/repo2docker/apt,uid=0,gid=0,sharing=locked" in (
+        with_cache_mounts
+    )
+    assert "-o Dir::Cache::Archives=/var/cache/repo2docker/apt install" in (
+        with_cache_mounts
+    )
+    # the package lists are still removed from the image
+    assert with_cache_mounts.count("rm -rf /var/lib/apt/lists/*") == (
+        dockerfile.count("rm -rf /var/lib/apt/lists/*")
+    )
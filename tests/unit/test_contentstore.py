@@ -0,0 +1,109 @@
+"""
+Tests for repo2docker/contentstore.py
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from repo2docker.app import Repo2Docker
+from repo2docker.contentproviders.base import ContentProvider
+from repo2docker.contentstore import ContentStore
+
+
+def test_add_and_materialize(tmpdir):
+    store = ContentStore(str(tmpdir.join("store")))
+    assert store.get("zenodo", "1234") is None
+
+    with store.add("zenodo", "1234") as staging_dir:
+        with open(os.path.join(staging_dir, "data.csv"), "w") as f:
+            f.write("1,2,3\n")
+        os.mkdir(os.path.join(staging_dir, "sub"))
+    assert store.get("zenodo", "1234") == store.path("zenodo", "1234")
+
+    linked = tmpdir.mkdir("linked")
+    store.materialize("zenodo", "1234", str(linked))
+    copied = tmpdir.mkdir("copied")
+    store.materialize("zenodo", "1234", str(copied), link=False)
+
+    stored = os.path.join(store.path("zenodo", "1234"), "data.csv")
+    assert os.path.samefile(linked.join("data.csv"), stored)
+    assert not os.path.samefile(copied.join("data.csv"), stored)
+    assert copied.join("data.csv").read() == "1,2,3\n"
+    assert os.path.isdir(copied.join("sub"))
+
+
+def test_materialize_missing_record(tmpdir):
+    store = ContentStore(str(tmpdir.join("store")))
+    checkout = tmpdir.mkdir("checkout")
+    assert not store.materialize("zenodo", "1234", str(checkout))
+    assert checkout.listdir() == []
+
+
+def test_failed_add_leaves_nothing(tmpdir):
+    store = ContentStore(str(tmpdir))
+    with pytest.raises(RuntimeError):
+        with store.add("swhid", "swh:1:dir:abc") as staging_dir:
+            open(os.path.join(staging_dir, "partial"), "w").close()
+            raise RuntimeError("download failed")
+    assert store.get("swhid", "swh:1:dir:abc") is None
+    assert os.listdir(tmpdir.join("swhid")) == []
+
+
+def test_evict_least_recently_used(tmpdir):
+    store = ContentStore(str(tmpdir), max_size=2)
+    for i, content_id in enumerate(["a", "b", "c"]):
+        with store.add("figshare", content_id) as staging_dir:
+            with open(os.path.join(staging_dir, "file"), "w") as f:
+                f.write("x")
+        os.utime(store.path("figshare", content_id), (i, i))
+
+    removed = store.evict(keep=[("figshare", "a")])
+    assert removed == [store.path("figshare", "b")]
+    assert store.get("figshare", "a") is not None
+    assert store.get("figshare", "c") is not None
+
+
+class FakeRecord(ContentProvider):
+    immutable = True
+    fetches = 0
+
+    def detect(self, source, ref=None, extra_args=None):
+        return {"record": source}
+
+    def fetch(self, spec, output_dir, yield_output=False):
+        FakeRecord.fetches += 1
+        with open(os.path.join(output_dir, "README"), "w") as f:
+            f.write(spec["record"])
+        yield "Fetched record\n"
+
+    @property
+    def content_id(self):
+        return "record-1"
+
+
+def test_fetch_uses_content_store(tmpdir):
+    for i in range(2):
+        checkout = tmpdir.mkdir(f"checkout{i}")
+        app = Repo2Docker(
+            content_providers=[FakeRecord],
+            content_cache_dir=str(tmpdir.join("store")),
+        )
+        app.fetch("some-record", None, str(checkout))
+        assert checkout.join("README").read() == "some-record"
+    assert FakeRecord.fetches == 1
+
+
+def test_fetch_after_eviction(tmpdir):
+    FakeRecord.fetches = 0
+    checkout = tmpdir.mkdir("checkout")
+    app = Repo2Docker(
+        content_providers=[FakeRecord],
+        content_cache_dir=str(tmpdir.join("store")),
+    )
+    # another build evicts the record as soon as it is added
+    with patch.object(ContentStore, "get", return_value=None):
+        app.fetch("some-record", None, str(checkout))
+    assert checkout.join("README").read() == "some-record"
+    assert FakeRecord.fetches == 2
@@ -1,7 +1,13 @@
 """Tests for docker bits"""
 
+import errno
+import fcntl
+import io
 import os
 from subprocess import check_output
+from unittest.mock import patch
+
+from repo2docker.docker import DockerEngine
 
 repo_root = os.path.abspath(
     os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
@@ -19,3 +25,142 @@ def test_git_credential_env():
         .strip()
     )
     assert out == credential_env
+
+
+def test_build_streams_context_to_stdin():
+    engine = DockerEngine(parent=None)
+    engine._container_cli = "docker"
+    fileobj = io.BytesIO(b"not really a tar")
+
+    with patch("repo2docker.docker.execute_cmd", return_value=iter([])) as cmd:
+        list(engine.build(fileobj=fileobj, tag="image", custom_context=True))
+
+    args, kwargs = cmd.call_args
+    assert args[0][:3] == ["docker", "buildx", "build"]
+    assert args[0][-1] == "-"
+    assert kwargs["input_fileobj"] is fileobj
+
+
+def _cache_args(cmd):
+    return [
+        (cmd[i], cmd[i + 1])
+        for i in range(len(cmd) - 1)
+        if cmd[i] in ("--cache-from", "--cache-to")
+    ]
+
+
+def _export_cache(args, *a, **kw):
+    dest = _cache_args(args)[-1][1].split(",")[1].split("=")[1]
+    with open(os.path.join(dest, "index.json"), "w") as f:
+        f.write("{}")
+    return iter([])
+
+
+def test_build_local_cache(tmpdir):
+    engine = DockerEngine(parent=None)
+    engine._container_cli = "docker"
+    engine.build_cache = "local"
+    engine.build_cache_dir = str(tmpdir)
+    cache_dir = tmpdir.join("registry-1.docker.io-library-r2d-abc")
+
+    for i in range(2):
+        with patch("repo2docker.docker.execute_cmd", side_effect=_export_cache) as cmd:
+            list(engine.build(path=str(tmpdir), tag="r2d-abc:123"))
+        cache_args = _cache_args(cmd.call_args[0][0])
+        if i == 0:
+            assert len(cache_args) == 1
+        else:
+            assert cache_args[0] == ("--cache-from", f"type=local,src={cache_dir}")
+        assert cache_args[-1][0] == "--cache-to"
+        assert cache_args[-1][1].endswith(",mode=max")
+
+    # the exported cache replaced the old one, nothing else is left over
+    assert sorted(os.listdir(tmpdir)) == [
+        cache_dir.basename,
+        cache_dir.basename + ".lock",
+    ]
+    assert os.listdir(cache_dir) == ["index.json"]
+
+
+def test_build_local_cache_named_after_repo(tmpdir):
+    engine = DockerEngine(parent=None)
+    engine._container_cli = "docker"
+    engine.build_cache = "local"
+    engine.build_cache_dir = str(tmpdir)
+    engine.cache_name = "https://github.com/org/repo"
+    cache_dir = tmpdir.join("https-github.com-org-repo")
+
+    # the image names of different commits contain their hash
+    for i, tag in enumerate(["r2d-org-repo-abc", "r2d-org-repo-def"]):
+        with patch("repo2docker.docker.execute_cmd", side_effect=_export_cache) as cmd:
+            list(engine.build(path=str(tmpdir), tag=tag))
+        if i == 1:
+            cache_args = _cache_args(cmd.call_args[0][0])
+            assert cache_args[0] == ("--cache-from", f"type=local,src={cache_dir}")
+    assert cache_dir.check(dir=True)
+
+
+def test_build_local_cache_evicted(tmpdir):
+    engine = DockerEngine(parent=None)
+    engine._container_cli = "docker"
+    engine.build_cache = "local"
+    engine.build_cache_dir = str(tmpdir)
+    engine.build_cache_size = 2000
+    for i, name in enumerate(["oldest", "locked", "newer"]):
+        tmpdir.join(name, "blob").write("x" * 1000, ensure=True)
+        os.utime(str(tmpdir.join(name)), (i, i))
+
+    with open(str(tmpdir.join("locked.lock")), "a") as lock_file:
+        # a build is replacing this cache
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        with patch("repo2docker.docker.execute_cmd", side_effect=_export_cache):
+            list(engine.build(path=str(tmpdir), tag="r2d-abc:123"))
+
+    caches = [p for p in os.listdir(tmpdir) if not p.endswith(".lock")]
+    assert sorted(caches) == ["locked", "registry-1.docker.io-library-r2d-abc"]
+
+
+def test_build_local_cache_not_replaced(tmpdir, caplog):
+    engine = DockerEngine(parent=None)
+    engine._container_cli = "docker"
+    engine.build_cache = "local"
+    engine.build_cache_dir = str(tmpdir)
+
+    # e.g. a concurrent build that doesn't take the lock created the cache
+    error = OSError(errno.ENOTEMPTY, "Directory not empty")
+    with patch("repo2docker.docker.execute_cmd", side_effect=_export_cache):
+        with patch("repo2docker.docker.os.replace", side_effect=error):
+            list(engine.build(path=str(tmpdir), tag="r2d-abc:123"))
+
+    assert "Could not export build cache" in caplog.text
+    # the exported cache is removed
+    assert os.listdir(tmpdir) == ["registry-1.docker.io-library-r2d-abc.lock"]
+
+
+def test_build_registry_cache():
+    engine = DockerEngine(parent=None)
+    engine._container_cli = "docker"
+    engine.build_cache = "registry"
+
+    with patch("repo2docker.docker.execute_cmd", return_value=iter([])) as cmd:
+        list(engine.build(path=".", tag="quay.io/org/r2d-abc:123"))
+    assert _cache_args(cmd.call_args[0][0]) == [
+        ("--cache-from", "type=registry,ref=quay.io/org/r2d-abc:buildcache"),
+        ("--cache-to", "type=registry,ref=quay.io/org/r2d-abc:buildcache,mode=max"),
+    ]
+
+    engine.build_cache_repository = "localhost:5000/cache"
+    with patch("repo2docker.docker.execute_cmd", return_value=iter([])) as cmd:
+        list(engine.build(path=".", tag="quay.io/org/r2d-abc:123"))
+    assert _cache_args(cmd.call_args[0][0])[0] == (
+        "--cache-from",
+        "type=registry,ref=localhost:5000/cache:quay.io-org-r2d-abc",
+    )
+
+    engine.cache_name = "/home/user/repo"
+    with patch("repo2docker.docker.execute_cmd", return_value=iter([])) as cmd:
+        list(engine.build(path=".", tag="quay.io/org/r2d-abc:123"))
+    assert _cache_args(cmd.call_args[0][0])[0] == (
+        "--cache-from",
+        "type=registry,ref=localhost:5000/cache:home-user-repo",
+    )
@@ -1,7 +1,7 @@
 import pytest
 from traitlets import TraitError
 
-from repo2docker.engine import ContainerEngine
+from repo2docker.engine import ContainerEngine, parse_image_reference
 
 
 def test_registry_credentials():
@@ -16,3 +16,70 @@ def test_registry_credentials():
 
     with pytest.raises(TraitError):
         e.registry_credentials = {"hi": "bye"}
+
+
+@pytest.mark.parametrize(
+    "image, expected",
+    [
+        ("ubuntu", ("registry-1.docker.io", "library/ubuntu", "latest")),
+        ("jupyter/base:2024", ("registry-1.docker.io", "jupyter/base", "2024")),
+        ("docker.io/ubuntu:24.04", ("registry-1.docker.io", "library/ubuntu", "24.04")),
+        ("localhost:5000/r2d/img", ("localhost:5000", "r2d/img", "latest")),
+        ("quay.io/org/img@sha256:abc", ("quay.io", "org/img", "sha256:abc")),
+    ],
+)
+def test_parse_image_reference(image, expected):
+    assert parse_image_reference(image) == expected
+
+
+def test_image_in_registry_basic_auth(requests_mock):
+    e = ContainerEngine(parent=None)
+    e.registry_credentials = {
+        "registry": "http://localhost:5000",
+        "username": "user",
+        "password": "secret",
+    }
+    url = "http://localhost:5000/v2/r2d/img/manifests/abc"
+    requests_mock.head(
+        url,
+        [
+            {"status_code": 401, "headers": {"WWW-Authenticate": 'Basic realm="r"'}},
+            {"status_code": 200},
+        ],
+    )
+    assert e.image_in_registry("localhost:5000/r2d/img:abc")
+    assert (
+        requests_mock.request_history[-1].headers["Authorization"].startswith("Basic ")
+    )
+
+    requests_mock.head(url, status_code=404)
+    assert not e.image_in_registry("localhost:5000/r2d/img:abc")
+
+
+def test_image_in_registry_bearer_token(requests_mock):
+    e = ContainerEngine(parent=None)
+    url = "https://registry-1.docker.io/v2/library/ubuntu/manifests/latest"
+    challenge = (
+        'Bearer realm="https://auth.docker.io/token",service="registry.docker.io"'
+    )
+
+    def head(request, context):
+        if request.headers.get("Authorization") == "Bearer t0ken":
+            context.status_code = 200
+        else:
+            context.status_code = 401
+            context.headers["WWW-Authenticate"] = challenge
+
+    requests_mock.head(url, text=head)
+    token = requests_mock.get("https://auth.docker.io/token", json={"token": "t0ken"})
+    assert e.image_in_registry("ubuntu")
+    assert token.last_request.qs == {
+        "service": ["registry.docker.io"],
+        "scope": ["repository:library/ubuntu:pull"],
+    }
+
+
+def test_image_in_registry_unreachable(requests_mock):
+    e = ContainerEngine(parent=None)
+    requests_mock.head("https://quay.io/v2/org/img/manifests/latest", status_code=503)
+    assert not e.image_in_registry("quay.io/org/img")
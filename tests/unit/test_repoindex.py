@@ -0,0 +1,76 @@
+"""
+Tests for repo2docker/repoindex.py
+"""
+
+import os
+
+import pytest
+from docker.utils.build import exclude_paths
+
+from repo2docker.repoindex import RepoIndex
+
+
+@pytest.fixture
+def repo(tmpdir):
+    for path in ["a/b/f", "a/g", "c/h", ".git/x/y", "top", "a/b/manifest.xml"]:
+        tmpdir.join(path).ensure()
+    os.symlink("a", str(tmpdir.join("link")))
+    os.symlink("missing", str(tmpdir.join("dangling")))
+    tmpdir.chdir()
+    return tmpdir
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        ".",
+        "a",
+        "a/b/f",
+        "./a/../top",
+        "link",
+        "link/g",
+        "link/nope",
+        "dangling",
+        "nope",
+        "nope/nope",
+        "../repo/top",
+        "/",
+    ],
+)
+def test_matches_os_path(repo, path):
+    index = RepoIndex()
+    assert index.exists(path) == os.path.exists(path)
+    assert index.isdir(path) == os.path.isdir(path)
+    assert index.isfile(path) == os.path.isfile(path)
+
+
+def test_index_is_a_snapshot(repo):
+    index = RepoIndex()
+    repo.join("new").ensure()
+    assert not index.exists("new")
+    assert RepoIndex().exists("new")
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        [],
+        ["a"],
+        ["a", "!a/b/f"],
+        ["*/b"],
+        [".git"],
+        ["**/manifest.xml"],
+        ["link"],
+        ["*", "!c"],
+    ],
+)
+def test_exclude_paths(repo, patterns):
+    index = RepoIndex()
+    assert index.exclude_paths(patterns) == exclude_paths(".", list(patterns))
+
+
+def test_find(repo):
+    index = RepoIndex()
+    assert index.find("manifest.xml") == ["./a/b"]
+    assert sorted(index.find("f")) == ["./a/b"]
+    assert index.find("a") == []
@@ -2,9 +2,11 @@
 Tests for repo2docker/utils.py
 """
 
+import io
 import os
 import platform
 import subprocess
+import sys
 import tempfile
 
 import pytest
@@ -39,6 +41,63 @@ def test_capture_cmd_noeol_capture_success():
     assert lines == ["test\n", "test"]
 
 
+def test_capture_cmd_carriage_return():
+    lines = list(
+        utils.execute_cmd(
+            ["/bin/bash", "-c", r"printf '10%%\r50%%\r100%%\r\ndone\r\r\nend'"],
+            capture=True,
+        )
+    )
+    assert lines == ["10%\r", "50%\r", "100%\r\n", "done\r", "\r\n", "end"]
+
+
+class _ChunkedStream:
+    """A stream that returns its data in chunks of a fixed size"""
+
+    def __init__(self, data, size):
+        self.stream = io.BytesIO(data)
+        self.size = size
+
+    def read(self, n):
+        return self.stream.read(min(n, self.size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1024])
+def test_iter_lines_chunk_boundaries(chunk_size):
+    data = b"a\rb\r\nc\n\r\rd\n\n\re\r"
+    lines = list(utils._iter_lines(_ChunkedStream(data, chunk_size)))
+    assert lines == [
+        b"a\r",
+        b"b\r\n",
+        b"c\n",
+        b"\r",
+        b"\r",
+        b"d\n",
+        b"\n",
+        b"\r",
+        b"e\r",
+    ]
+
+
+def test_capture_cmd_noisy_output():
+    # a busy build produces lots of progress output, make sure none of it is lost
+    script = (
+        "for i in range(20000): print(f'progress {i}', end='\\r' if i % 2 else '\\n')"
+    )
+    lines = list(utils.execute_cmd([sys.executable, "-c", script], capture=True))
+    assert len(lines) == 20000
+    assert lines[0] == "progress 0\n"
+    assert lines[-1] == "progress 19999\r"
+
+
+def test_capture_cmd_input_fileobj():
+    data = b"line1\nline2\n" * 10000
+    lines = list(
+        utils.execute_cmd(["cat"], capture=True, input_fileobj=io.BytesIO(data))
+    )
+    assert "".join(lines).encode() == data
+
+
 def test_capture_cmd_capture_fail():
     with pytest.raises(subprocess.CalledProcessError):
         for line in utils.execute_cmd(
@@ -47,6 +106,49 @@ def test_capture_cmd_capture_fail():
             assert line == "test\n"
 
 
+def test_execute_cmd_process_group():
+    group = utils.ProcessGroup()
+    token = utils.process_group.set(group)
+    try:
+        lines = utils.execute_cmd(
+            ["/bin/bash", "-c", "echo started; sleep 60"], capture=True
+        )
+        assert next(lines) == "started\n"
+        group.kill()
+        with pytest.raises(subprocess.CalledProcessError) as e:
+            next(lines)
+        assert e.value.returncode == -9
+
+        # commands started later are killed right away
+        with pytest.raises(subprocess.CalledProcessError):
+            for line in utils.execute_cmd(["sleep", "60"]):
+                pass
+    finally:
+        utils.process_group.reset(token)
+
+
+def test_timings_textfile(tmpdir):
+    timings = utils.Timings()
+    with timings.timed(utils.R2dState.BUILDING, "render"):
+        pass
+    with pytest.raises(RuntimeError):
+        with timings.timed(utils.R2dState.PUSHING, 'push "latest"'):
+            raise RuntimeError("push failed")
+    assert [step for _, step, _ in timings.durations] == ["render", 'push "latest"']
+    assert timings.summary().startswith("Time spent per step: render 0.0s")
+
+    path = tmpdir.join("metrics.prom")
+    timings.write_textfile(str(path))
+    lines = path.read().splitlines()
+    assert lines[1] == "# TYPE repo2docker_step_duration_seconds gauge"
+    assert lines[2].startswith(
+        'repo2docker_step_duration_seconds{phase="building",step="render"} '
+    )
+    assert lines[3].startswith(
+        'repo2docker_step_duration_seconds{phase="pushing",step="push \\"latest\\""} '
+    )
+
+
 def test_chdir(tmpdir):
     d = str(tmpdir.mkdir("cwd"))
     cur_cwd = os.getcwd()
@@ -176,3 +278,19 @@ def test_local_pip_requirement(req, is_local):
 def test_get_platform(monkeypatch, machine_name, expected):
     monkeypatch.setattr(platform, "machine", lambda: machine_name)
     assert utils.get_platform() == expected
+
+
+def test_flatten_dir(tmpdir):
+    tmpdir.join("data", "a", "b").ensure()
+    tmpdir.join("data", "data", "c").ensure()
+    tmpdir.join("data", "d").write("new")
+    tmpdir.join("d").write("old")
+    inode = tmpdir.join("data", "a", "b").stat().ino
+
+    utils.flatten_dir(str(tmpdir), "data")
+
+    assert sorted(os.listdir(tmpdir)) == ["a", "d", "data"]
+    assert os.listdir(tmpdir.join("data")) == ["c"]
+    assert tmpdir.join("d").read() == "new"
+    # the file was moved, not copied
+    assert tmpdir.join("a", "b").stat().ino == inode